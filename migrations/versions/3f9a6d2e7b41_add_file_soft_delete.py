@@ -0,0 +1,31 @@
+"""Add soft delete to file
+
+Revision ID: 3f9a6d2e7b41
+Revises: 8c4d2f6b1a37
+Create Date: 2026-10-18 12:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a6d2e7b41'
+down_revision: Union[str, None] = '8c4d2f6b1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('file', sa.Column('deleted_at', sa.TIMESTAMP(), nullable=True))
+    op.create_index('ix_file_deleted_at', 'file', ['deleted_at'])
+    # Сборщик мусора ищет blob без ссылок по времени освобождения
+    op.create_index('ix_blob_released_at', 'blob', ['released_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_blob_released_at', table_name='blob')
+    op.drop_index('ix_file_deleted_at', table_name='file')
+    op.drop_column('file', 'deleted_at')
@@ -0,0 +1,38 @@
+"""Add processed result cache
+
+Revision ID: 8c4d2f6b1a37
+Revises: 5e1b7c3a9d20
+Create Date: 2026-10-18 11:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c4d2f6b1a37'
+down_revision: Union[str, None] = '5e1b7c3a9d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('result_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('object_key', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('details', sa.String(), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('accessed_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('key')
+    )
+    op.create_index('ix_result_cache_accessed_at', 'result_cache', ['accessed_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_result_cache_accessed_at', table_name='result_cache')
+    op.drop_table('result_cache')
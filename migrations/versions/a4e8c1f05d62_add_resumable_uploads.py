@@ -0,0 +1,54 @@
+"""Add resumable uploads
+
+Revision ID: a4e8c1f05d62
+Revises: 3f9a6d2e7b41
+Create Date: 2026-10-18 13:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4e8c1f05d62'
+down_revision: Union[str, None] = '3f9a6d2e7b41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('upload_session',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('status_id', sa.Integer(), nullable=True),
+    sa.Column('hash', sa.String(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('part_size', sa.BigInteger(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('upload_id', sa.String(), nullable=False),
+    sa.Column('created_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['status_id'], ['status.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('token')
+    )
+    op.create_index('ix_upload_session_updated_at', 'upload_session', ['updated_at'])
+    op.create_table('upload_part',
+    sa.Column('session_id', sa.Integer(), nullable=False),
+    sa.Column('number', sa.Integer(), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('etag', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['upload_session.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('session_id', 'number')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('upload_part')
+    op.drop_index('ix_upload_session_updated_at', table_name='upload_session')
+    op.drop_table('upload_session')
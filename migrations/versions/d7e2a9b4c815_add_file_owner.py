@@ -0,0 +1,40 @@
+"""Add file owner and lookup indexes
+
+Revision ID: d7e2a9b4c815
+Revises: a4e8c1f05d62
+Create Date: 2026-10-18 15:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7e2a9b4c815'
+down_revision: Union[str, None] = 'a4e8c1f05d62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('file', sa.Column('user_id', sa.Integer(), nullable=True))
+    # Владелец существующих файлов известен по таблице pointer, если имя там встречается один раз
+    # и среди неудалённых файлов нет его повторов; остальные строки остаются без владельца
+    op.execute("""
+        UPDATE file SET user_id = owner.user_id
+        FROM (SELECT name, min(user_id) AS user_id FROM pointer GROUP BY name HAVING count(*) = 1) AS owner
+        WHERE file.name = owner.name
+          AND file.deleted_at IS NULL
+          AND file.name IN (SELECT name FROM file WHERE deleted_at IS NULL GROUP BY name HAVING count(*) = 1)
+    """)
+    op.create_index('ix_file_user_id_name', 'file', ['user_id', 'name'], unique=True,
+                    postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_file_user_id_status_id', 'file', ['user_id', 'status_id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_file_user_id_status_id', table_name='file')
+    op.drop_index('ix_file_user_id_name', table_name='file')
+    op.drop_column('file', 'user_id')
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 import dotenv
 
@@ -16,5 +17,54 @@ secret_key = os.environ.get("SECRET_KEY")
 endpoint_url = os.environ.get("ENDPOINT_URL")
 bucket_name = os.environ.get("BUCKET_NAME")
 
+# Загрузка в S3 частями: размер части (не меньше 5 МБ) и число частей, загружаемых одновременно
+S3_PART_SIZE = int(os.environ.get("S3_PART_SIZE", 8 * 1024 * 1024))
+S3_UPLOAD_CONCURRENCY = int(os.environ.get("S3_UPLOAD_CONCURRENCY", 4))
+# Общий клиент S3: размер пула соединений, время жизни простаивающего соединения (с) и повторы запросов
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 50))
+S3_KEEPALIVE_TIMEOUT = float(os.environ.get("S3_KEEPALIVE_TIMEOUT", 12))
+S3_MAX_ATTEMPTS = int(os.environ.get("S3_MAX_ATTEMPTS", 5))
+S3_RETRY_MODE = os.environ.get("S3_RETRY_MODE", "standard")  # legacy, standard или adaptive
+S3_CONNECT_TIMEOUT = float(os.environ.get("S3_CONNECT_TIMEOUT", 10))
+S3_READ_TIMEOUT = float(os.environ.get("S3_READ_TIMEOUT", 60))
+# Кэш списков файлов: время жизни страницы (с, 0 - без кэша) и максимальное число страниц
+S3_LIST_CACHE_TTL = float(os.environ.get("S3_LIST_CACHE_TTL", 30))
+S3_LIST_CACHE_SIZE = int(os.environ.get("S3_LIST_CACHE_SIZE", 1024))
+S3_PRESIGN_EXPIRES = int(os.environ.get("S3_PRESIGN_EXPIRES", 15 * 60))  # Время жизни подписанных ссылок (с)
+
 SMTP_USER = os.environ.get("SMTP_USER")
-SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
\ No newline at end of file
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+# Декодированный звук длиннее этого (байт PCM) держится во временном файле, а не в памяти
+DECODE_MAX_MEMORY = int(os.environ.get("DECODE_MAX_MEMORY", 512 * 1024 * 1024))
+
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR", os.path.join(tempfile.gettempdir(), "soundnormalization"))
+SCRATCH_TMPFS_DIR = os.environ.get("SCRATCH_TMPFS_DIR", "/dev/shm")
+SCRATCH_TMPFS_MAX_SIZE = int(os.environ.get("SCRATCH_TMPFS_MAX_SIZE", 256 * 1024 * 1024))
+SCRATCH_QUOTA = int(os.environ.get("SCRATCH_QUOTA", 20 * 1024 * 1024 * 1024))
+SCRATCH_WAIT_TIMEOUT = float(os.environ.get("SCRATCH_WAIT_TIMEOUT", 300))
+
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "memory://")
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "cache+memory://")
+# С брокером memory:// (локальный запуск, тесты) задачи всегда выполняются прямо в процессе API
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", "0") == "1"
+
+# Пул процессов для обработки звука: по процессу на ядро и ограниченная очередь ожидающих задач
+PROCESS_WORKERS = int(os.environ.get("PROCESS_WORKERS", os.cpu_count() or 1))
+PROCESS_QUEUE_SIZE = int(os.environ.get("PROCESS_QUEUE_SIZE", PROCESS_WORKERS * 2))
+PROCESS_RETRY_AFTER = int(os.environ.get("PROCESS_RETRY_AFTER", 5))  # Секунд до повтора при переполнении
+
+# Кэш результатов обработки в S3: общий объём (байт) и время жизни записи без обращений (с)
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 50 * 1024 * 1024 * 1024))
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", 7 * 24 * 60 * 60))
+
+# Локальный кэш объектов S3 для обработки: каталог и общий объём (байт)
+OBJECT_CACHE_DIR = os.environ.get("OBJECT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "soundnormalization-cache"))
+OBJECT_CACHE_MAX_BYTES = int(os.environ.get("OBJECT_CACHE_MAX_BYTES", 10 * 1024 * 1024 * 1024))
+
+# Сборщик мусора хранилища: период запуска (с, 0 - отключён), сколько хранить удалённые данные (с)
+# и сколько записей обрабатывать за один проход
+GC_INTERVAL = float(os.environ.get("GC_INTERVAL", 15 * 60))
+GC_GRACE_PERIOD = float(os.environ.get("GC_GRACE_PERIOD", 24 * 60 * 60))
+GC_BATCH_SIZE = int(os.environ.get("GC_BATCH_SIZE", 1000))
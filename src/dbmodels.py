@@ -1,27 +1,74 @@
 from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
 
 
 
-@dataclass
+@dataclass(slots=True)
 class File:
     name: str
     status_id: int
     version: str
     path: str
     id:int=int()
+    deleted_at: Optional[datetime]=None
+    user_id: Optional[int]=None
 
-@dataclass
+@dataclass(slots=True)
+class Blob:
+    hash: str
+    key: str
+    size: int
+    refcount: int
+    id: int=int()
+
+@dataclass(slots=True)
+class Pointer:
+    user_id: int
+    name: str
+    blob_id: int
+    id: int=int()
+
+@dataclass(slots=True)
+class CachedResult:
+    key: str
+    object_key: str
+    size: int
+    details: str
+    id: int=int()
+
+@dataclass(slots=True)
+class UploadSession:
+    token: str
+    user_id: int
+    name: str
+    path: str
+    status_id: int
+    hash: str
+    size: int
+    part_size: int
+    key: str
+    upload_id: str
+    id: int=int()
+
+@dataclass(slots=True)
+class Job:
+    task_id: str
+    user_id: int
+    id: int=int()
+
+@dataclass(slots=True)
 class Role:
     name: str
     permissions: str
     id: int=int()
 
-@dataclass
+@dataclass(slots=True)
 class Status:
     name: str
     id: int=int()
 
-@dataclass
+@dataclass(slots=True)
 class CustomUser:
     name: str
     email: str
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from starlette.concurrency import run_in_threadpool
+
+from src.config import GC_INTERVAL, GC_GRACE_PERIOD, GC_BATCH_SIZE
+from src.dbmodels import File, UploadSession
+from src.file.result_cache import RESULT_PREFIX, result_cache
+from src.file.storage import BLOB_PREFIX, file_storage
+from src.user.S3Client import s3_client
+from util.repositories.db_repos import SQLAlchemyPostgresqlFileRepository, SQLAlchemyPostgresqlUploadRepository
+
+
+def is_upload_key(key):
+    # Только ключи загрузок по подписанным ссылкам (blobs/<sha256>-<uuid>) уникальны. Объект
+    # blobs/<sha256> может быть перезаписан повторной загрузкой прямо во время проверки,
+    # поэтому такие объекты удаляются только вместе со строкой blob
+    return "-" in key[len(BLOB_PREFIX):]
+
+
+@asynccontextmanager
+async def in_threadpool(context):
+    """
+    Синхронный контекстный менеджер (например, транзакция БД), вход в который и выход из которого
+    выполняются в пуле потоков, а тело блока - в цикле событий.
+    """
+    value = await run_in_threadpool(context.__enter__)
+    try:
+        yield value
+    except BaseException as e:
+        if not await run_in_threadpool(context.__exit__, type(e), e, e.__traceback__):
+            raise
+    else:
+        await run_in_threadpool(context.__exit__, None, None, None)
+
+
+class StorageCollector:
+    """
+    Фоновая сборка мусора хранилища. За один проход:
+    - окончательно удаляет строки файлов, помеченные удалёнными раньше grace секунд назад;
+    - удаляет из S3 и из таблицы blob содержимое, на которое нет ссылок дольше grace секунд;
+    - удаляет объекты под blobs/ и results/, для которых нет записей в БД (загрузки по подписанным
+      ссылкам, которые так и не завершили, результаты, не попавшие в кэш из-за сбоя);
+    - удаляет возобновляемые загрузки, в которые не поступало частей дольше grace секунд,
+      и прерывает multipart-загрузки старше grace секунд, кроме принадлежащих идущим загрузкам;
+    - вытесняет устаревшие записи кэша результатов.
+    Сборщик может работать в нескольких процессах одновременно: blob, который удаляет один
+    процесс, заблокирован (FOR UPDATE SKIP LOCKED) и пропускается остальными.
+    Синхронные репозитории вызываются в пуле потоков, чтобы не блокировать цикл событий API.
+    """
+
+    def __init__(self, s3, blob_repo, file_repo, upload_repo, result_cache, interval, grace, batch_size):
+        self.s3 = s3
+        self.blob_repo = blob_repo
+        self.file_repo = file_repo
+        self.upload_repo = upload_repo
+        self.result_cache = result_cache
+        self.interval = interval
+        self.grace = grace
+        self.batch_size = batch_size
+
+    async def _reclaim_blobs(self):
+        reclaimed = 0
+        while True:
+            # Строки удаляются только после удаления объектов; при ошибке транзакция откатывается
+            async with in_threadpool(self.blob_repo.reclaim(self.grace, self.batch_size)) as keys:
+                if keys:
+                    await self.s3.delete_objects(keys)
+            reclaimed += len(keys)
+            if len(keys) < self.batch_size:
+                return reclaimed
+
+    async def _sweep_orphans(self, prefix, known_keys, match=lambda key: True):
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.grace)
+        removed = 0
+
+        async def sweep(keys):
+            known = await run_in_threadpool(known_keys, keys)
+            orphans = [key for key in keys if key not in known]
+            if orphans:
+                await self.s3.delete_objects(orphans)
+            return len(orphans)
+
+        batch = []
+        async for obj in self.s3.iter_objects(prefix):
+            if obj["LastModified"] < cutoff and match(obj["Key"]):
+                batch.append(obj["Key"])
+            if len(batch) >= self.batch_size:
+                removed += await sweep(batch)
+                batch = []
+        if batch:
+            removed += await sweep(batch)
+        return removed
+
+    async def collect(self):
+        """Один проход сборки мусора. Возвращает число удалённых объектов по видам."""
+        stats = {
+            "files": await run_in_threadpool(self.file_repo.purge_deleted, self.grace),
+            "blobs": await self._reclaim_blobs(),
+            "orphans": await self._sweep_orphans(BLOB_PREFIX, self.blob_repo.known_keys, is_upload_key)
+                       + await self._sweep_orphans(RESULT_PREFIX, self.result_cache.repo.known_keys),
+            "sessions": await run_in_threadpool(self.upload_repo.purge_stale, self.grace),
+            "uploads": await self.s3.abort_stale_uploads(
+                datetime.now(timezone.utc) - timedelta(seconds=self.grace),
+                await run_in_threadpool(self.upload_repo.active_upload_ids)),
+        }
+        await self.result_cache.evict()
+        if any(stats.values()):
+            logging.info(f"Сборка мусора: {stats}")
+        return stats
+
+    async def run(self):
+        """Запускает collect каждые interval секунд, пока задачу не отменят."""
+        if self.interval <= 0:
+            return
+        while True:
+            try:
+                await self.collect()
+            except Exception as e:
+                logging.error(f"Ошибка сборки мусора: {e}")
+            await asyncio.sleep(self.interval)
+
+
+storage_collector = StorageCollector(
+    s3_client,
+    file_storage.repo,
+    SQLAlchemyPostgresqlFileRepository(File),
+    SQLAlchemyPostgresqlUploadRepository(UploadSession),
+    result_cache,
+    interval=GC_INTERVAL,
+    grace=GC_GRACE_PERIOD,
+    batch_size=GC_BATCH_SIZE,
+)
@@ -0,0 +1,134 @@
+import numpy as np
+
+BLOCK_SIZE = 65536  # Размер блока обработки в сэмплах (кратен HOP_SIZE)
+HOP_SIZE = 64  # Шаг управляющего сигнала огибающей в сэмплах
+MIN_LEVEL = 1e-10  # Нижняя граница уровня, чтобы не брать логарифм от нуля
+
+
+class Compressor:
+    """
+    Компрессор динамического диапазона, работающий блоками над массивами float32.
+
+    Блок имеет форму (frames, channels) со значениями в диапазоне [-1, 1].
+    Каналы связаны: уровень детектора берётся как максимум по всем каналам,
+    и одинаковое усиление применяется ко всем каналам, поэтому стереопанорама сохраняется.
+    Состояние огибающей переносится между вызовами process, так что длинный
+    сигнал можно подавать последовательными блоками.
+    """
+
+    def __init__(self, sample_rate, threshold=-30.0, ratio=4.0, attack=5.0, release=50.0,
+                 knee=0.0, makeup_gain=0.0, hop_size=HOP_SIZE):
+        if ratio < 1.0:
+            raise ValueError(f"Compression ratio must be >= 1, got {ratio}")
+        if knee < 0:
+            raise ValueError(f"Knee width must be >= 0, got {knee}")
+
+        self.sample_rate = sample_rate
+        self.threshold = float(threshold)
+        self.ratio = float(ratio)
+        self.knee = float(knee)
+        self.makeup_gain = float(makeup_gain)
+        self.hop_size = hop_size
+
+        # Коэффициенты сглаживания считаются на частоте управляющего сигнала (раз в hop_size сэмплов)
+        self._attack_coef = self._time_coefficient(attack)
+        self._release_coef = self._time_coefficient(release)
+        self.reset()
+
+    def _time_coefficient(self, time_ms):
+        if time_ms <= 0:
+            return 0.0
+        return float(np.exp(-self.hop_size / (self.sample_rate * time_ms / 1000.0)))
+
+    def reset(self):
+        """
+        Сбрасывает состояние огибающей (текущее ослабление в дБ).
+        """
+        self._gain_reduction = 0.0
+
+    def gain_computer(self, level_db):
+        """
+        Статическая характеристика: возвращает ослабление в дБ (<= 0) для уровня входа в дБ.
+        """
+        overshoot = level_db - self.threshold
+        slope = 1.0 / self.ratio - 1.0
+
+        if self.knee == 0:
+            return np.maximum(overshoot, 0.0) * slope
+
+        half_knee = self.knee / 2.0
+        return np.where(
+            overshoot <= -half_knee,
+            0.0,
+            np.where(
+                overshoot >= half_knee,
+                overshoot * slope,
+                slope * (overshoot + half_knee) ** 2 / (2.0 * self.knee),
+            ),
+        )
+
+    def _smooth(self, target):
+        """
+        Сглаживает ослабление атакой/восстановлением. Рекурсия идёт на частоте
+        управляющего сигнала, поэтому цикл в hop_size раз короче сигнала.
+        """
+        attack, release = self._attack_coef, self._release_coef
+        state = self._gain_reduction
+        smoothed = []
+        for value in target.tolist():
+            coef = attack if value < state else release
+            state = value + coef * (state - value)
+            smoothed.append(state)
+        self._gain_reduction = state
+        return np.array(smoothed)
+
+    def process(self, block):
+        """
+        Сжимает блок формы (frames, channels) или (frames,) и возвращает массив float32 той же формы.
+        """
+        block = np.asarray(block, dtype=np.float32)
+        frames = block.shape[0]
+        if frames == 0:
+            return block.copy()
+
+        # Связанный детектор: пиковое значение по всем каналам
+        peak = np.abs(block).max(axis=1) if block.ndim == 2 else np.abs(block)
+
+        hops = -(-frames // self.hop_size)
+        padded = np.zeros(hops * self.hop_size, dtype=np.float32)
+        padded[:frames] = peak
+        hop_peak = padded.reshape(hops, self.hop_size).max(axis=1)
+
+        level_db = 20.0 * np.log10(np.maximum(hop_peak, MIN_LEVEL))
+        previous = self._gain_reduction
+        smoothed = self._smooth(self.gain_computer(level_db))
+
+        # Линейная интерполяция усиления между точками управляющего сигнала
+        starts = np.concatenate(([previous], smoothed[:-1]))
+        ramp = np.arange(1, self.hop_size + 1, dtype=np.float64) / self.hop_size
+        gain_db = (starts[:, None] + (smoothed - starts)[:, None] * ramp[None, :]).ravel()[:frames]
+        gain = np.power(10.0, (gain_db + self.makeup_gain) / 20.0).astype(np.float32)
+
+        if block.ndim == 2:
+            return block * gain[:, None]
+        return block * gain
+
+
+def compress_array(samples, sample_rate, block_size=BLOCK_SIZE, **params):
+    """
+    Сжимает целочисленный PCM-массив формы (frames, channels) блоками и возвращает массив того же типа.
+    Блочная обработка ограничивает размер промежуточных float32-буферов.
+    """
+    compressor = Compressor(sample_rate, **params)
+    scale = float(np.iinfo(samples.dtype).max + 1) if samples.dtype.kind == "i" else 1.0
+    result = np.empty_like(samples)
+
+    for start in range(0, samples.shape[0], block_size):
+        block = samples[start:start + block_size].astype(np.float32) / scale
+        processed = compressor.process(block) * scale
+        if samples.dtype.kind == "i":
+            info = np.iinfo(samples.dtype)
+            processed = np.clip(np.rint(processed), info.min, info.max)
+        result[start:start + block_size] = processed
+
+    return result
@@ -0,0 +1,180 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from fractions import Fraction
+
+from src.config import FFMPEG_BINARY
+from src.file.decoder import spawn, stop_process
+from src.file.probe import probe
+from src.file.stream import AUDIO_CODECS, DEFAULT_AUDIO_CODEC, wait_process
+
+SMART_CUT_CODECS = {"AVC": "libx264", "HEVC": "libx265"}  # Кодеки, для которых возможна склейка с копированием
+MIN_SEGMENT = 0.001  # Отрезки короче этого (в секундах) не кодируются
+SEEK_MARGIN = MIN_SEGMENT / 2  # Сдвиг цели поиска от ключевого кадра, меньше интервала между кадрами
+SEGMENT_EXTENSION = ".ts"  # Контейнер промежуточных частей
+CONTAINER_START = re.compile(r"Duration: [^,]*, start: (-?\d+(?:\.\d+)?)")
+
+
+def _run(command, name):
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg {name} failed: {stderr.decode(errors='replace').strip()}")
+    return stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+
+def _container_start(log):
+    # Начало файла из описания входа ("Duration: ..., start: 1.400000, ..."); -ss отсчитывается от него
+    match = CONTAINER_START.search(log)
+    return Fraction(match.group(1)) if match else None
+
+
+def scan_packets(file):
+    """
+    Возвращает пакеты первой видеодорожки в порядке декодирования: пары (время в секундах, ключевой ли кадр).
+    Время отсчитывается в той же шкале, что и -ss: от начала файла (start_time контейнера), а не от первого
+    видеопакета - у TS и многих MP4 звук начинается раньше видео или шкала начинается не с нуля.
+    Пакеты читаются без декодирования через мультиплексор framecrc: у ключевых кадров
+    в строке пакета нет поля флагов "F=0x...".
+    """
+    output, log = _run([
+        FFMPEG_BINARY, "-nostdin", "-hide_banner", "-v", "info",
+        "-i", file, "-map", "0:v:0", "-c", "copy", "-copyts",
+        "-f", "framecrc", "-",
+    ], "keyframe scan")
+
+    time_base = None
+    packets = []
+    for line in output.splitlines():
+        if line.startswith("#tb 0:"):
+            time_base = Fraction(line.split(":", 1)[1].strip())
+        elif line and not line.startswith("#"):
+            fields = [field.strip() for field in line.split(",")]
+            is_key = not any(field.startswith("F=") for field in fields[6:])
+            packets.append((int(fields[2]), is_key))
+
+    if time_base is None or not packets:
+        return []
+    start = _container_start(log)
+    if start is None:
+        start = min(pts for pts, _ in packets) * time_base
+    return [(float(pts * time_base - start), is_key) for pts, is_key in packets]
+
+
+def list_keyframes(file):
+    """
+    Возвращает отсортированные времена (в секундах) ключевых кадров первой видеодорожки (см. scan_packets).
+    """
+    return sorted(time for time, is_key in scan_packets(file) if is_key)
+
+
+def _count_frames(packets, start, end):
+    return sum(1 for time, _ in packets if start <= time < end)
+
+
+def _encode_segment(file, start, end, res_file, video_encoder, frames, audio_codec=None):
+    # Число кадров (если известно) задаётся явно: по одному -t граница зависит от округления времени.
+    # Без audio_codec кодируется только видео
+    audio = ["-map", "0:a:0?", "-c:a", audio_codec] if audio_codec else ["-an"]
+    limit = ["-frames:v", str(frames)] if frames is not None else []
+    _run([
+        FFMPEG_BINARY, "-nostdin", "-y", "-v", "error",
+        "-ss", f"{start:.6f}", "-i", file, "-t", f"{end - start:.6f}",
+        "-map", "0:v:0", "-c:v", video_encoder, *limit, *audio,
+        res_file,
+    ], "segment encode")
+
+
+def _copy_segment(file, start, res_file, frames):
+    # -ss перед -i при копировании ищет последний ключевой кадр не позже цели, поэтому цель чуть позже start.
+    # Копия ограничена числом пакетов до следующего ключевого кадра, а не временем: из-за B-кадров
+    # пакеты идут не по порядку показа, и -t захватывал бы кадры следующей группы
+    _run([
+        FFMPEG_BINARY, "-nostdin", "-y", "-v", "error",
+        "-ss", f"{start + SEEK_MARGIN:.6f}", "-i", file,
+        "-map", "0:v:0", "-an", "-c:v", "copy", "-frames:v", str(frames),
+        "-avoid_negative_ts", "make_zero",
+        res_file,
+    ], "segment copy")
+
+
+def smart_cut(file, start, end, res_file):
+    """
+    Вырезает из видео фрагмент [start, end) секунд в res_file.
+    Группы кадров, целиком попадающие в диапазон, копируются без перекодирования;
+    перекодируются только неполные группы на границах, после чего части склеиваются.
+    """
+    media = probe(file)
+    end = min(end, media.duration) if media.duration else end
+    if end <= start:
+        raise ValueError(f"Invalid cut range: start={start}, end={end}")
+
+    audio_codec = AUDIO_CODECS.get(os.path.splitext(res_file)[1].lower(), DEFAULT_AUDIO_CODEC)
+    video_encoder = SMART_CUT_CODECS.get(media.video_codec)
+    packets = scan_packets(file) if video_encoder else []
+    keyframes = sorted(time for time, is_key in packets if is_key)
+    inner = [k for k in keyframes if start <= k <= end]
+
+    # Если внутри диапазона меньше двух ключевых кадров, копировать нечего - кодируем целиком
+    if len(inner) < 2:
+        frames = _count_frames(packets, start, end) if packets else None
+        _encode_segment(file, start, end, res_file, video_encoder or "libx264", frames, audio_codec)
+        return res_file
+
+    first_key, last_key = inner[0], inner[-1]
+    # Копируются пакеты от ключевого кадра first_key до пакета ключевого кадра last_key в порядке декодирования
+    key_index = {time: index for index, (time, is_key) in enumerate(packets) if is_key}
+    # Части пишутся рядом с результатом: каталог задачи и место под него уже зарезервировал вызывающий,
+    # повторный запрос квоты изнутри задачи мог бы ждать освобождения собственного резерва
+    workdir = tempfile.mkdtemp(prefix="cut-", dir=os.path.dirname(os.path.abspath(res_file)))
+    try:
+        # Части пишутся в MPEG-TS: параметры кодека передаются в самом потоке, поэтому
+        # перекодированные и скопированные части склеиваются без конфликтов заголовков
+        parts = []
+        if first_key - start > MIN_SEGMENT:
+            parts.append(os.path.join(workdir, "head" + SEGMENT_EXTENSION))
+            _encode_segment(file, start, first_key, parts[-1], video_encoder,
+                            _count_frames(packets, start, first_key))
+        parts.append(os.path.join(workdir, "middle" + SEGMENT_EXTENSION))
+        _copy_segment(file, first_key, parts[-1], key_index[last_key] - key_index[first_key])
+        if end - last_key > MIN_SEGMENT:
+            parts.append(os.path.join(workdir, "tail" + SEGMENT_EXTENSION))
+            # Цель поиска чуть раньше ключевого кадра, чтобы округление не отбросило сам кадр
+            _encode_segment(file, last_key - SEEK_MARGIN, end, parts[-1], video_encoder,
+                            _count_frames(packets, last_key, end))
+
+        concat_list = os.path.join(workdir, "parts.txt")
+        with open(concat_list, "w") as f:
+            f.writelines(f"file '{part}'\n" for part in parts)
+
+        # Части содержат только видео. Звук всего диапазона кодируется один раз при склейке:
+        # у каждой отдельно закодированной части AAC были бы свои паузы (priming) на стыках
+        process = spawn([
+            FFMPEG_BINARY, "-nostdin", "-y", "-v", "error",
+            "-f", "concat", "-safe", "0", "-i", concat_list,
+            "-ss", f"{start:.6f}", "-i", file, "-t", f"{end - start:.6f}",
+            "-map", "0:v:0", "-map", "1:a:0?",
+            "-c:v", "copy", "-c:a", audio_codec,
+            res_file,
+        ])
+        try:
+            wait_process(process, "concat")
+        finally:
+            stop_process(process)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return res_file
+
+
+def cut_audio(file, start, end, res_file):
+    """
+    Вырезает фрагмент [start, end) секунд из аудиофайла, не загружая его целиком в память.
+    """
+    _run([
+        FFMPEG_BINARY, "-nostdin", "-y", "-v", "error",
+        "-ss", f"{start:.6f}", "-i", file, "-t", f"{end - start:.6f}",
+        "-map", "0:a:0", res_file,
+    ], "audio cut")
+    return res_file
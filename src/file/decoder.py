@@ -0,0 +1,125 @@
+import mmap
+import shutil
+import subprocess
+import tempfile
+
+import numpy as np
+
+from src.config import FFMPEG_BINARY
+from src.file.probe import probe
+
+SAMPLE_FORMAT = "s16le"  # Формат PCM, который отдаёт декодер
+SAMPLE_DTYPE = np.int16
+SAMPLE_WIDTH = 2
+COPY_CHUNK_SIZE = 1024 * 1024  # Размер порции при записи PCM во временный файл
+
+
+def get_audio_params(file):
+    """
+    Возвращает частоту дискретизации и число каналов первой аудиодорожки файла.
+    """
+    media = probe(file)
+    if media.sample_rate and media.channels:
+        return media.sample_rate, media.channels
+    raise ValueError(f"File '{file}' has no audio track")
+
+
+def open_decoder(file, sample_rate, channels, sample_format=SAMPLE_FORMAT):
+    """
+    Запускает ffmpeg, который декодирует первую аудиодорожку файла в сырой PCM на stdout.
+    """
+    command = [
+        FFMPEG_BINARY, "-nostdin", "-v", "error",
+        "-i", file,
+        "-map", "0:a:0", "-vn",
+        "-f", sample_format, "-ar", str(sample_rate), "-ac", str(channels),
+        "pipe:1",
+    ]
+    return spawn(command, stdout=subprocess.PIPE)
+
+
+def spawn(command, **kwargs):
+    """
+    Запускает ffmpeg. Его stderr пишется во временный файл, а не в канал: канал stderr, который
+    никто не читает, пока читается stdout, переполнился бы при большом числе предупреждений,
+    и оба процесса остановились бы навсегда.
+    """
+    log = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(command, stderr=log, **kwargs)
+    except BaseException:
+        log.close()
+        raise
+    process.stderr_log = log
+    return process
+
+
+def read_errors(process):
+    """Вывод ffmpeg в stderr на текущий момент."""
+    log = getattr(process, "stderr_log", None)
+    if log is None:
+        return process.stderr.read().decode(errors="replace").strip() if process.stderr else ""
+    log.seek(0)
+    return log.read().decode(errors="replace").strip()
+
+
+def stop_process(process):
+    """Завершает процесс, если он ещё работает, и закрывает файл его stderr."""
+    if process.poll() is None:
+        process.kill()
+        process.wait()
+    log = getattr(process, "stderr_log", None)
+    if log is not None:
+        log.close()
+
+
+def _finish(process):
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg decoder failed: {read_errors(process)}")
+
+
+def _read_pcm(stream, max_memory):
+    # Пока PCM помещается в max_memory байт, он читается в память; длинная запись целиком уходит
+    # во временный файл и возвращается отображением файла (mmap) - страницы читаются с диска по мере
+    # обращения, поэтому в памяти одновременно не больше max_memory байт
+    if max_memory is None:
+        return stream.read()
+    data = stream.read(max_memory + 1)
+    if len(data) <= max_memory:
+        return data
+    with tempfile.TemporaryFile() as spill:
+        spill.write(data)
+        del data
+        shutil.copyfileobj(stream, spill, COPY_CHUNK_SIZE)
+        spill.flush()
+        # Отображение остаётся действительным после закрытия файла
+        return mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def decode_pcm(file, sample_rate=None, channels=None, max_memory=None):
+    """
+    Декодирует первую аудиодорожку аудио- или видеофайла одним вызовом ffmpeg.
+    Возвращает сырой PCM s16le, частоту дискретизации и число каналов.
+    По умолчанию сохраняются исходные частота и раскладка каналов.
+    Если PCM больше max_memory байт, вместо bytes возвращается mmap временного файла.
+    """
+    native_rate, native_channels = get_audio_params(file)
+    sample_rate = sample_rate or native_rate
+    channels = channels or native_channels
+
+    process = open_decoder(file, sample_rate, channels)
+    try:
+        data = _read_pcm(process.stdout, max_memory)
+        _finish(process)
+    finally:
+        stop_process(process)
+    return data, sample_rate, channels
+
+
+def decode_audio(file, sample_rate=None, channels=None, max_memory=None):
+    """
+    Декодирует звук файла в массив int16 формы (frames, channels) и возвращает его вместе с частотой.
+    Запись длиннее max_memory байт отображается с диска, а не занимает оперативную память.
+    """
+    data, sample_rate, channels = decode_pcm(file, sample_rate, channels, max_memory)
+    return np.frombuffer(data, dtype=SAMPLE_DTYPE).reshape(-1, channels), sample_rate
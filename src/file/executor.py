@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from src.config import PROCESS_WORKERS, PROCESS_QUEUE_SIZE, PROCESS_RETRY_AFTER
+
+
+class ExecutorBusy(Exception):
+    """
+    Очередь обработки заполнена (или пул остановлен). retry_after - через сколько секунд
+    клиенту имеет смысл повторить запрос.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ProcessExecutor:
+    """
+    Пул процессов для обработки звука.
+
+    Обработка в numpy/ffmpeg/pydub держит GIL, поэтому в пуле потоков она тормозит все
+    остальные запросы. Здесь каждая операция выполняется в отдельном процессе, а event loop
+    только ждёт результата. Одновременно допускается не больше workers + queue_size задач:
+    остальные сразу получают отказ, вместо того чтобы копиться в памяти.
+    """
+
+    def __init__(self, workers, queue_size, retry_after):
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.retry_after = retry_after
+        self._pool = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Создаёт пул и сразу запускает все процессы, чтобы первый запрос не ждал их импорта.
+        """
+        # spawn: форк процесса с запущенными потоками сервера небезопасен
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        for future in [self._pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        logging.info(f"Process pool started with {self.workers} workers")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def admit(self):
+        """
+        Занимает место в очереди на время блока with. Если мест нет, выбрасывает ExecutorBusy,
+        поэтому проверку стоит делать до приёма файла от клиента.
+        """
+        return _Admission(self)
+
+    def _enter(self):
+        with self._lock:
+            if self._pool is None:
+                raise ExecutorBusy("Process pool is not running", self.retry_after)
+            if self._pending >= self.limit:
+                raise ExecutorBusy(f"Processing queue is full ({self.limit} jobs)", self.retry_after)
+            self._pending += 1
+
+    def _exit(self):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Выполняет func(*args, **kwargs) в процессе пула. func и аргументы должны сериализоваться
+        через pickle, поэтому передаются функции уровня модуля, а не лямбды.
+        """
+        pool = self._pool
+        if pool is None:
+            raise ExecutorBusy("Process pool is not running", self.retry_after)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(pool, partial(func, *args, **kwargs))
+        except BrokenProcessPool:
+            # Процесс упал (например, по нехватке памяти) - пул больше не принимает задачи
+            logging.exception("Process pool is broken, restarting")
+            self._restart(pool)
+            raise
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._pool is not broken:
+                return
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+class _Admission:
+    def __init__(self, executor):
+        self.executor = executor
+
+    def __enter__(self):
+        self.executor._enter()
+        return self.executor
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.executor._exit()
+
+
+process_pool = ProcessExecutor(
+    workers=PROCESS_WORKERS,
+    queue_size=PROCESS_QUEUE_SIZE,
+    retry_after=PROCESS_RETRY_AFTER,
+)
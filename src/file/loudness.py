@@ -0,0 +1,172 @@
+import math
+
+import numpy as np
+from scipy.signal import firwin, sosfilt, upfirdn
+
+STEP_SECONDS = 0.1  # Шаг накопления энергии; блоки стробирования собираются из этих шагов
+MOMENTARY_STEPS = 4  # Блок 400 мс с перекрытием 75%
+SHORT_TERM_STEPS = 30  # Окно 3 с для расчёта LRA
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+LRA_RELATIVE_GATE = -20.0
+LRA_LOW_PERCENTILE = 10
+LRA_HIGH_PERCENTILE = 95
+SURROUND_WEIGHT = 1.41
+TRUE_PEAK_TAPS_PER_PHASE = 12
+
+
+def k_weighting_sos(sample_rate):
+    """
+    Коэффициенты K-фильтра (ITU-R BS.1770-4) для произвольной частоты дискретизации:
+    полочный фильтр верхних частот и ФВЧ RLB, в виде каскада биквадов.
+    """
+    # Полочный фильтр
+    k = math.tan(math.pi * 1681.974450955533 / sample_rate)
+    vh = 10 ** (3.999843853973347 / 20)
+    vb = vh ** 0.4996667741545416
+    q = 0.7071752369554196
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0,
+        2 * (k * k - vh) / a0,
+        (vh - vb * k / q + k * k) / a0,
+        1.0,
+        2 * (k * k - 1) / a0,
+        (1 - k / q + k * k) / a0,
+    ]
+
+    # Фильтр верхних частот
+    k = math.tan(math.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1 + k / q + k * k
+    highpass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    return np.array([shelf, highpass])
+
+
+def channel_weights(channels):
+    """
+    Весовые коэффициенты каналов: для 5.0/5.1 боковые каналы усиливаются, LFE не учитывается.
+    """
+    if channels == 5:
+        return np.array([1.0, 1.0, 1.0, SURROUND_WEIGHT, SURROUND_WEIGHT])
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, SURROUND_WEIGHT, SURROUND_WEIGHT])
+    return np.ones(channels)
+
+
+def energy_to_lufs(energy):
+    return -0.691 + 10 * np.log10(np.maximum(energy, 1e-20))
+
+
+class LoudnessMeter:
+    """
+    Потоковый измеритель громкости по EBU R128: интегральная громкость, LRA и истинный пик.
+
+    Блоки формы (frames, channels) подаются в process последовательно; состояние фильтров,
+    недобранный шаг и история передискретизации переносятся между вызовами,
+    поэтому результат не зависит от размера блоков.
+    """
+
+    def __init__(self, sample_rate, channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.step_size = int(round(sample_rate * STEP_SECONDS))
+
+        self._sos = k_weighting_sos(sample_rate)
+        self._zi = np.zeros((self._sos.shape[0], 2, channels))
+        self._weights = channel_weights(channels)
+        self._pending = np.zeros(0)
+        self._steps = []
+
+        # Истинный пик: передискретизация в 4 раза ниже 96 кГц, в 2 раза до 192 кГц
+        self._oversampling = 4 if sample_rate < 96000 else 2 if sample_rate < 192000 else 1
+        self._peak = 0.0
+        if self._oversampling > 1:
+            taps = firwin(TRUE_PEAK_TAPS_PER_PHASE * self._oversampling, 1.0 / self._oversampling)
+            self._fir = taps * self._oversampling
+            self._history = np.zeros((-(-len(self._fir) // self._oversampling), channels))
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.channels)
+        if block.shape[0] == 0:
+            return
+        self._update_peak(block)
+
+        filtered, self._zi = sosfilt(self._sos, block, axis=0, zi=self._zi)
+        power = (filtered * filtered) @ self._weights
+
+        # Энергия накапливается по шагам 100 мс; неполный шаг ждёт следующего блока
+        power = np.concatenate((self._pending, power))
+        complete = len(power) // self.step_size * self.step_size
+        if complete:
+            self._steps.extend(power[:complete].reshape(-1, self.step_size).mean(axis=1).tolist())
+        self._pending = power[complete:]
+
+    def _update_peak(self, block):
+        if self._oversampling == 1:
+            self._peak = max(self._peak, float(np.abs(block).max()))
+            return
+
+        extended = np.concatenate((self._history, block))
+        upsampled = upfirdn(self._fir, extended, up=self._oversampling, axis=0)
+        start = len(self._history) * self._oversampling
+        current = upsampled[start:start + block.shape[0] * self._oversampling]
+        self._peak = max(self._peak, float(np.abs(current).max()), float(np.abs(block).max()))
+        self._history = extended[-len(self._history):]
+
+    def _blocks(self, steps):
+        steps_energy = np.asarray(self._steps)
+        if len(steps_energy) < steps:
+            return np.zeros(0)
+        cumulative = np.concatenate(([0.0], np.cumsum(steps_energy)))
+        return (cumulative[steps:] - cumulative[:-steps]) / steps
+
+    def integrated_loudness(self):
+        blocks = self._blocks(MOMENTARY_STEPS)
+        blocks = blocks[energy_to_lufs(blocks) > ABSOLUTE_GATE]
+        if len(blocks) == 0:
+            return -math.inf
+        relative_gate = energy_to_lufs(blocks.mean()) + RELATIVE_GATE
+        blocks = blocks[energy_to_lufs(blocks) > relative_gate]
+        return float(energy_to_lufs(blocks.mean()))
+
+    def loudness_range(self):
+        blocks = self._blocks(SHORT_TERM_STEPS)
+        blocks = blocks[energy_to_lufs(blocks) > ABSOLUTE_GATE]
+        if len(blocks) == 0:
+            return 0.0
+        relative_gate = energy_to_lufs(blocks.mean()) + LRA_RELATIVE_GATE
+        loudness = energy_to_lufs(blocks[energy_to_lufs(blocks) > relative_gate])
+        low, high = np.percentile(loudness, [LRA_LOW_PERCENTILE, LRA_HIGH_PERCENTILE])
+        return float(high - low)
+
+    def true_peak(self):
+        """
+        Истинный пик в dBTP.
+        """
+        return 20 * math.log10(self._peak) if self._peak > 0 else -math.inf
+
+    def result(self):
+        """
+        Результаты измерения. У тишины громкость и пик равны -inf; в результате они заменяются
+        на None, потому что бесконечность нельзя передать в JSON.
+        """
+        result = {
+            "integrated": self.integrated_loudness(),
+            "loudness_range": self.loudness_range(),
+            "true_peak": self.true_peak(),
+        }
+        return {name: value if math.isfinite(value) else None for name, value in result.items()}
+
+
+def normalization_gain(measurement, target=-23.0, true_peak_limit=-1.0):
+    """
+    Усиление в дБ, приводящее громкость к target без превышения истинного пика true_peak_limit.
+    """
+    if measurement["integrated"] is None:
+        return 0.0  # Тишину усиливать бессмысленно
+    gain = target - measurement["integrated"]
+    if measurement["true_peak"] + gain > true_peak_limit:
+        gain = true_peak_limit - measurement["true_peak"]
+    return gain
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+from src.config import OBJECT_CACHE_DIR, OBJECT_CACHE_MAX_BYTES
+from src.file.locks import FileLock
+from src.user.S3Client import s3_client
+
+META_SUFFIX = ".json"
+PART_SUFFIX = ".part"  # Недокачанные файлы: <хэш ключа><расширение>.<uuid>.part
+
+
+def _link_or_copy(source, dest):
+    # Жёсткая ссылка не занимает места и переживает вытеснение файла из кэша
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+class ObjectCache:
+    """
+    Локальный кэш объектов на диске со сквозным чтением.
+
+    Объект скачивается один раз, при следующих обращениях копия проверяется условным
+    запросом по ETag (If-None-Match) и скачивается заново, только если объект изменился.
+    Общий объём ограничен max_bytes: вытесняются копии, к которым дольше всего не обращались.
+    Кэш может использоваться несколькими процессами одновременно: записи защищены
+    файловыми блокировками (256 блокировок по первым символам хэша ключа).
+
+    source - объект с методом download_file(key, path, if_none_match), как у S3Client.
+    """
+
+    def __init__(self, source, root, max_bytes):
+        self.source = source
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def _digest(self, key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _ensure_dirs(self):
+        os.makedirs(os.path.join(self.root, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(self.root, "locks"), exist_ok=True)
+
+    def _lock(self, digest):
+        return FileLock(os.path.join(self.root, "locks", digest[:2] + ".lock"))
+
+    def _meta_path(self, digest):
+        return os.path.join(self.root, "objects", digest + META_SUFFIX)
+
+    def _data_path(self, digest, key):
+        # Расширение сохраняется: по нему определяется тип файла при обработке
+        return os.path.join(self.root, "objects", digest + os.path.splitext(key)[1].lower())
+
+    def _read_meta(self, digest):
+        try:
+            with open(self._meta_path(digest), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, digest, meta):
+        path = self._meta_path(digest)
+        part = f"{path}.{uuid.uuid4().hex}{PART_SUFFIX}"
+        with open(part, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(part, path)
+
+    async def get(self, key, dest=None):
+        """
+        Возвращает путь к актуальной локальной копии объекта key, при необходимости скачивая её.
+        Если передан dest, копия связывается (или копируется) в dest и возвращается dest:
+        такой файл не пропадёт, если запись вытеснят из кэша во время обработки.
+        """
+        digest = self._digest(key)
+        self._ensure_dirs()
+        lock = self._lock(digest)
+        await run_in_threadpool(lock.acquire)
+        try:
+            path, downloaded = await self._refresh(key, digest)
+            if dest is not None:
+                await run_in_threadpool(_link_or_copy, path, dest)
+                path = dest
+        finally:
+            lock.release()
+        if downloaded:
+            await run_in_threadpool(self.evict)
+        return path
+
+    async def _refresh(self, key, digest):
+        # Вызывается под блокировкой записи
+        data_path = self._data_path(digest, key)
+        meta = self._read_meta(digest)
+        etag = meta["etag"] if meta and meta.get("key") == key and os.path.exists(data_path) else None
+
+        part = f"{data_path}.{uuid.uuid4().hex}{PART_SUFFIX}"
+        try:
+            new_etag = await self.source.download_file(key, part, if_none_match=etag)
+            if new_etag is None and etag is not None:
+                os.utime(data_path)  # Время изменения файла - время последнего обращения для LRU
+                return data_path, False
+            os.replace(part, data_path)
+        finally:
+            if os.path.exists(part):
+                os.remove(part)
+        self._write_meta(digest, {"key": key, "etag": new_etag, "size": os.path.getsize(data_path)})
+        logging.info(f"Объект '{key}' сохранён в локальный кэш.")
+        return data_path, True
+
+    def _entries(self):
+        objects = os.path.join(self.root, "objects")
+        entries = []
+        for name in os.listdir(objects):
+            if not name.endswith(META_SUFFIX):
+                continue
+            digest = name[:-len(META_SUFFIX)]
+            meta = self._read_meta(digest)
+            if meta is None:
+                continue
+            try:
+                stat = os.stat(self._data_path(digest, meta["key"]))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, digest, meta["key"]))
+        return entries
+
+    def evict(self):
+        """
+        Удаляет самые давние по обращению копии, пока объём кэша больше max_bytes.
+        Занятые другими процессами записи пропускаются. Возвращает число удалённых копий.
+        """
+        self._ensure_dirs()
+        evict_lock = FileLock(os.path.join(self.root, "locks", "evict.lock"))
+        if not evict_lock.acquire(blocking=False):
+            return 0  # Вытеснение уже выполняет другой процесс
+        removed = 0
+        try:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _, _ in entries)
+            for _, size, digest, key in entries:
+                if total <= self.max_bytes:
+                    break
+                lock = self._lock(digest)
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    os.remove(self._data_path(digest, key))
+                    os.remove(self._meta_path(digest))
+                except OSError as e:
+                    # На Windows нельзя удалить открытый файл
+                    logging.warning(f"Не удалось удалить '{key}' из локального кэша: {e}")
+                    continue
+                finally:
+                    lock.release()
+                total -= size
+                removed += 1
+            self._remove_stale_parts()
+        finally:
+            evict_lock.release()
+        if removed:
+            logging.info(f"Из локального кэша вытеснено объектов: {removed}")
+        return removed
+
+    def _remove_stale_parts(self):
+        # Недокачанные файлы остаются после аварийного завершения процесса
+        objects = os.path.join(self.root, "objects")
+        for name in os.listdir(objects):
+            path = os.path.join(objects, name)
+            if not name.endswith(PART_SUFFIX):
+                continue
+            lock = self._lock(name[:64])
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            finally:
+                lock.release()
+
+
+object_cache = ObjectCache(s3_client, OBJECT_CACHE_DIR, OBJECT_CACHE_MAX_BYTES)
@@ -0,0 +1,109 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from pymediainfo import MediaInfo
+
+PROBE_CACHE_SIZE = 256  # Максимальное число закэшированных результатов
+
+
+@dataclass(frozen=True)
+class MediaProbe:
+    path: str
+    file_type: str  # "Video", "Audio" или "Unknown"
+    duration: float  # Длительность в секундах
+    sample_rate: Optional[int]
+    channels: Optional[int]
+    audio_codec: Optional[str]
+    video_codec: Optional[str]
+    bit_rate: Optional[int]
+    audio_stream: Optional[int]  # Индекс первой аудиодорожки в контейнере
+    video_stream: Optional[int]  # Индекс первой видеодорожки в контейнере
+
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _cache_key(file):
+    stat = os.stat(file)
+    return os.path.realpath(file), stat.st_size, stat.st_mtime_ns
+
+
+def _int(value):
+    # MediaInfo может вернуть несколько значений через "/" (например, "44100 / 22050" у HE-AAC):
+    # берётся первое; значение, которое не разобрать, считается неизвестным
+    if value is None:
+        return None
+    try:
+        return int(float(str(value).split("/")[0]))
+    except ValueError:
+        return None
+
+
+def _stream_index(track):
+    # StreamOrder бывает составным ("0-1" у MPEG-TS: программа и дорожка) - такой индекс неизвестен
+    try:
+        return int(track.streamorder) if track.streamorder is not None else None
+    except ValueError:
+        return None
+
+
+def _parse(file):
+    general = audio = video = None
+    for track in MediaInfo.parse(file).tracks:
+        if track.track_type == "General" and general is None:
+            general = track
+        elif track.track_type == "Audio" and audio is None:
+            audio = track
+        elif track.track_type == "Video" and video is None:
+            video = track
+
+    if video is not None:
+        file_type = "Video"
+    elif audio is not None:
+        file_type = "Audio"
+    else:
+        file_type = "Unknown"
+
+    duration_ms = next((t.duration for t in (general, audio, video) if t is not None and t.duration), 0)
+    return MediaProbe(
+        path=file,
+        file_type=file_type,
+        duration=float(duration_ms) / 1000,
+        sample_rate=_int(audio.sampling_rate) if audio is not None else None,
+        channels=_int(audio.channel_s) if audio is not None else None,
+        audio_codec=audio.format if audio is not None else None,
+        video_codec=video.format if video is not None else None,
+        bit_rate=_int(general.overall_bit_rate) if general is not None else None,
+        audio_stream=_stream_index(audio) if audio is not None else None,
+        video_stream=_stream_index(video) if video is not None else None,
+    )
+
+
+def probe(file):
+    """
+    Возвращает метаданные файла, разбирая его через MediaInfo не более одного раза.
+    Результат кэшируется по пути, размеру и времени изменения файла (LRU), поэтому
+    перезаписанный файл с тем же именем разбирается заново.
+    """
+    key = _cache_key(file)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    result = _parse(file)
+    with _lock:
+        _cache[key] = result
+        _cache.move_to_end(key)
+        while len(_cache) > PROBE_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return result
+
+
+def clear_probe_cache():
+    with _lock:
+        _cache.clear()
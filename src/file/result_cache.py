@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+from starlette.concurrency import run_in_threadpool
+
+from src.config import RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL
+from src.dbmodels import CachedResult
+from src.file.sound_func import ENGINE_VERSION
+from src.user.S3Client import s3_client
+from util.repositories.db_repos import SQLAlchemyPostgresqlResultCacheRepository
+
+RESULT_PREFIX = "results/"  # Объекты кэша: results/<ключ кэша>/<uuid><расширение>
+
+# Значения параметров по умолчанию: запрос без параметра и запрос с тем же значением явно
+# должны давать один ключ
+OPERATION_DEFAULTS = {
+    "compress": {"threshold": -30, "ratio": 4.0, "attack": 5.0, "release": 50.0, "knee": 0.0, "makeup_gain": 0.0},
+    "normalize": {"target": -23.0, "true_peak": -1.0},
+    "cut": {},
+}
+
+
+def _normalize(value):
+    # Числа приводятся к float с округлением, чтобы -20, -20.0 и -20.0000001 совпадали
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return value
+    return round(float(value), 6)
+
+
+def cache_key(input_hash, operation, params, extension):
+    """
+    Детерминированный ключ результата: хэш исходного файла, операция, нормализованные
+    параметры, расширение результата и версия обработки.
+    """
+    params = {**OPERATION_DEFAULTS.get(operation, {}), **params}
+    payload = json.dumps({
+        "input": input_hash,
+        "operation": operation,
+        "params": {name: _normalize(value) for name, value in params.items()},
+        "extension": extension.lower(),
+        "engine": ENGINE_VERSION,
+    }, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    """
+    Кэш результатов обработки в S3 с индексом в таблице result_cache.
+    Объём ограничен max_bytes (вытесняются записи, к которым дольше всего не обращались),
+    записи без обращений дольше ttl секунд удаляются.
+    Запросы к БД выполняются в пуле потоков, чтобы не блокировать цикл событий.
+    """
+
+    def __init__(self, s3, repo, max_bytes, ttl):
+        self.s3 = s3
+        self.repo = repo
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    async def get(self, key):
+        """Запись кэша (CachedResult) или None."""
+        return await run_in_threadpool(self.repo.touch, key)
+
+    @staticmethod
+    def details(entry):
+        return json.loads(entry.details) if entry.details else None
+
+    async def fetch(self, entry, path):
+        """Скачивает закэшированный результат в локальный файл."""
+        await self.s3.download_file(entry.object_key, path)
+
+    async def put(self, key, path, extension, details=None):
+        """
+        Сохраняет результат из локального файла. Если тот же результат параллельно
+        сохранил другой запрос, загруженная копия удаляется.
+        """
+        object_key = f"{RESULT_PREFIX}{key}/{uuid.uuid4().hex}{extension.lower()}"
+        size = os.path.getsize(path)
+        await self.s3.upload_path(path, object_key)
+        entry = CachedResult(key, object_key, size, json.dumps(details) if details is not None else None)
+        if not await run_in_threadpool(self.repo.add_if_absent, entry):
+            await self.s3.delete_object(object_key)
+        await self.evict()
+
+    async def evict(self):
+        object_keys = await run_in_threadpool(self.repo.evict, self.max_bytes, self.ttl)
+        for object_key in object_keys:
+            await self.s3.delete_object(object_key)
+        if object_keys:
+            logging.info(f"Из кэша результатов удалено объектов: {len(object_keys)}")
+
+    async def store_quietly(self, key, path, extension, details=None):
+        """put для фоновой задачи: ошибка кэша не должна влиять на уже отправленный ответ."""
+        try:
+            await self.put(key, path, extension, details)
+        except Exception as e:
+            logging.error(f"Не удалось сохранить результат в кэш: {e}")
+
+
+result_cache = ResultCache(
+    s3_client,
+    SQLAlchemyPostgresqlResultCacheRepository(CachedResult),
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    ttl=RESULT_CACHE_TTL,
+)
@@ -1,43 +1,50 @@
 import logging
+import math
+import mimetypes
+import re
+import uuid
 
-from fastapi import APIRouter, Depends, HTTPException, UploadFile
+from botocore.exceptions import ClientError
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, Header, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi_users import FastAPIUsers
 import os
 
-from src.config import access_key, secret_key, endpoint_url, bucket_name
-from src.dbmodels import File, Status
-from src.user.S3Client import S3Client
+from src.dbmodels import File, UploadSession
+from src.file.schemas import PresignUpload, PresignComplete, PresignAbort, FileDelete, UploadCreate
+from src.file.storage import BLOB_PREFIX, ContentMismatch, file_storage
+from src.config import S3_PRESIGN_EXPIRES
+from src.database import async_session_maker
+from src.models import metadata
+from src.user.S3Client import MAX_LIST_KEYS, s3_client
 from src.user.base_config import current_user
 from src.user.models import User
-from util.repositories.db_repos import SQLAlchemyPostgresqlDataclassRepository
+from util.repositories.async_db_repos import SQLAlchemyPostgresqlAsyncFileRepository, \
+    SQLAlchemyPostgresqlAsyncUploadRepository
 
 router = APIRouter()
 
 logging.basicConfig(level=logging.INFO)
 
-# Инициализируем S3Client с использованием переменных окружения
-s3_client = S3Client(
-    access_key=access_key,
-    secret_key=secret_key,
-    endpoint_url=endpoint_url,
-    bucket_name=bucket_name,
-)
+SINGLE_RANGE = re.compile(r"^bytes=(\d+-\d*|-\d+)$")  # Поддерживается только один диапазон
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+LIST_PAGE_SIZE = 100  # Файлов на странице списка по умолчанию
 
-file_repo = SQLAlchemyPostgresqlDataclassRepository(File)
-status_repo = SQLAlchemyPostgresqlDataclassRepository(Status)
+file_repo = SQLAlchemyPostgresqlAsyncFileRepository(File, async_session_maker, metadata)
+upload_repo = SQLAlchemyPostgresqlAsyncUploadRepository(UploadSession, async_session_maker, metadata)
 
 
 @router.post("/uploadfile")
 async def upload_file(file: UploadFile, path: str, status: int , user: User = Depends(current_user)):
     logging.info(f"Received status: {status}")
     user_id = str(user.id)  # Получаем ID текущего пользователя
+    check_filename(file.filename)
     try:
-        await s3_client.create_directory(user_id)
-        object_name = f"{user_id}/{file.filename}"
-        file_cr = File(file.filename, status, 'v1.0', path)
+        # Одинаковое содержимое хранится в S3 один раз, повторная загрузка не отправляет байты
+        await file_storage.store_upload(user_id, file.filename, file)
+        file_cr = File(file.filename, status, 'v1.0', path, user_id=user.id)
         logging.info(f"File object created with status: {status}")
-        file_repo.add(file_cr)
-        await s3_client.upload_file(file, object_name)
+        await file_repo.add(file_cr)
         logging.info(f"File {file.filename} uploaded to S3")
         return {"message": f"Файл '{file.filename}' успешно загружен в Selectel S3"}
     except Exception as e:
@@ -46,32 +53,334 @@ async def upload_file(file: UploadFile, path: str, status: int , user: User = De
 @router.delete("/files/{filename}")
 async def delete_file(filename: str, user: User = Depends(current_user)):
     try:
-        await s3_client.delete_file(user_id=str(user.id), filename=filename)
-        file_repo.remove_by_name(filename)
+        await file_storage.remove(str(user.id), filename)
+        await file_repo.remove_by_name(filename, user.id)
         return {"message": f"Файл '{filename}' успешно удалён из директории пользователя."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка удаления файла: {str(e)}")
 
+@router.post("/files/delete")
+async def delete_files(request: FileDelete, user: User = Depends(current_user)):
+    """
+    Удаляет несколько файлов пользователя за один запрос. Строки файлов помечаются удалёнными,
+    содержимое без ссылок позже удаляет из S3 сборщик мусора.
+    """
+    names = list(dict.fromkeys(check_filename(name) for name in request.names))
+    try:
+        await file_storage.remove_many(str(user.id), names)
+        await file_repo.mark_deleted(names, user.id)
+        return {"message": f"Удалено файлов: {len(names)}", "deleted": names}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка удаления файлов: {str(e)}")
+
 @router.get("/files")
-async def get_user_files(user: User = Depends(current_user)):
+async def get_user_files(user: User = Depends(current_user),
+                         limit: int = Query(default=LIST_PAGE_SIZE, ge=1, le=MAX_LIST_KEYS),
+                         cursor: str | None = None,
+                         metadata: bool = False):
+    """
+    Список файлов пользователя постранично. cursor - значение next_cursor из предыдущего ответа;
+    с metadata=true вместо имён возвращаются name, size, last_modified и etag.
+    """
     try:
-        files = await s3_client.list_files(user_id=str(user.id))
-        return {"files": files}
+        page = await file_storage.list_page(str(user.id), limit, cursor)
+        files = page["files"] if metadata else [file["name"] for file in page["files"]]
+        return {"files": files, "next_cursor": page["next_cursor"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка получения списка файлов: {str(e)}")
 
 
+def content_type(filename, stored_type):
+    # S3 хранит тип, переданный при загрузке; если его не было - определяем по расширению
+    if stored_type and stored_type not in ("binary/octet-stream", DEFAULT_CONTENT_TYPE):
+        return stored_type
+    return mimetypes.guess_type(filename)[0] or DEFAULT_CONTENT_TYPE
+
+
 @router.get("/files/{filename}")
-async def get_file_by_name(filename: str, user: User = Depends(current_user)):
+async def get_file_by_name(filename: str, user: User = Depends(current_user),
+                           range: str | None = Header(default=None),
+                           if_none_match: str | None = Header(default=None)):
+    """
+    Отдаёт файл потоком из S3. Заголовок Range (один диапазон байт) передаётся в S3,
+    и ответ приходит с кодом 206 - так плееры могут перематывать, не скачивая файл целиком.
+    Несколько диапазонов не поддерживаются: в этом случае отдаётся весь файл.
+    С If-None-Match, совпадающим с ETag файла, возвращается 304 без тела - так клиенты
+    проверяют свои локальные копии.
+    """
+    requested = range.replace(" ", "") if range else None
+    byte_range = requested if requested and SINGLE_RANGE.match(requested) else None
     try:
-        # Retrieve the file from S3
-        file_content = await s3_client.get_file_by_name(user_id=str(user.id), filename=filename)
+        key = await file_storage.resolve_key(str(user.id), filename)
+        response, body = await s3_client.open_object(key, byte_range=byte_range, if_none_match=if_none_match)
+    except ClientError as e:
+        error = e.response.get("Error", {})
+        if error.get("Code") == "304":
+            return Response(status_code=304, headers={"ETag": if_none_match})
+        if error.get("Code") in ("NoSuchKey", "404"):
+            raise HTTPException(status_code=404, detail="Файл не найден.")
+        if error.get("Code") == "InvalidRange":
+            raise HTTPException(status_code=416, detail="Запрошенный диапазон недоступен.",
+                                headers={"Content-Range": f"bytes */{error.get('ActualObjectSize', '*')}"})
+        raise HTTPException(status_code=500, detail=f"Ошибка получения файла: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка получения файла: {str(e)}")
+
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Length": str(response["ContentLength"]),
+    }
+    if response.get("ETag"):
+        headers["ETag"] = response["ETag"]
+    if response.get("LastModified"):
+        headers["Last-Modified"] = response["LastModified"].strftime("%a, %d %b %Y %H:%M:%S GMT")
+    status_code = 200
+    if response.get("ContentRange"):
+        headers["Content-Range"] = response["ContentRange"]
+        status_code = 206
+
+    return StreamingResponse(body, status_code=status_code, headers=headers,
+                             media_type=content_type(filename, response.get("ContentType")))
+
 
-        if file_content is None:
+def check_filename(filename: str) -> str:
+    # Имя файла не должно содержать разделителей пути
+    if not filename or "/" in filename or "\\" in filename:
+        raise HTTPException(status_code=400, detail="Недопустимое имя файла.")
+    return filename
+
+
+@router.post("/presign/upload")
+async def presign_upload(request: PresignUpload, user: User = Depends(current_user)):
+    """
+    Выдаёт подписанные ссылки для загрузки файла напрямую в S3, минуя API.
+    Ссылка выдаётся всегда, даже если такое содержимое уже есть в хранилище: ответ не должен
+    раскрывать, какие файлы хранят другие пользователи. Лишняя копия удаляется при завершении.
+    Если size больше одной части, начинается multipart upload: каждая часть отправляется
+    PUT-запросом на свою ссылку. В обоих случаях после загрузки нужно вызвать /presign/complete.
+    """
+    check_filename(request.filename)
+    try:
+        key = file_storage.upload_key(request.sha256)
+        if request.size is not None and request.size > s3_client.part_size:
+            upload = await s3_client.presign_multipart_upload(key, request.size)
+            # Загрузка записывается за пользователем: завершить или отменить её может только он.
+            # Путь и статус файла передаются при завершении
+            await upload_repo.add(UploadSession(uuid.uuid4().hex, user.id, request.filename, request.filename,
+                                                None, request.sha256, request.size, upload["part_size"],
+                                                key, upload["upload_id"]))
+            return {"key": key, "method": "PUT", "expires_in": S3_PRESIGN_EXPIRES, **upload}
+        return {"key": key, "method": "PUT", "expires_in": S3_PRESIGN_EXPIRES,
+                "url": await s3_client.presign_upload(key)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка подписи ссылки: {str(e)}")
+
+
+async def load_multipart(key, upload_id, user):
+    session = await upload_repo.find_multipart(key, upload_id, user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Загрузка не найдена.")
+    return session
+
+
+@router.post("/presign/complete")
+async def presign_complete(request: PresignComplete, user: User = Depends(current_user)):
+    """
+    Подтверждает загрузку по подписанной ссылке: завершает multipart upload (если он был),
+    проверяет хэш загруженного содержимого и записывает файл в таблицу file.
+    """
+    check_filename(request.filename)
+    if not request.key.startswith(BLOB_PREFIX):
+        raise HTTPException(status_code=400, detail="Недопустимый ключ загрузки.")
+    session = None
+    if request.upload_id:
+        session = await load_multipart(request.key, request.upload_id, user)
+    try:
+        if session is not None:
+            await s3_client.complete_multipart_upload(request.key, request.upload_id)
+        await file_storage.complete_upload(str(user.id), request.filename, request.sha256, request.key)
+        await file_repo.add(File(request.filename, request.status, 'v1.0', request.path, user_id=user.id))
+        if session is not None:
+            await upload_repo.remove(session.id)
+        return {"message": f"Файл '{request.filename}' успешно загружен в Selectel S3"}
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Файл не загружен в хранилище.")
+    except ContentMismatch:
+        # Объект с неверным содержимым уже удалён - загрузку не продолжить
+        if session is not None:
+            await upload_repo.remove(session.id)
+        raise HTTPException(status_code=400, detail="Содержимое не совпадает с указанным sha256.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка завершения загрузки: {str(e)}")
+
+
+@router.post("/presign/abort")
+async def presign_abort(request: PresignAbort, user: User = Depends(current_user)):
+    if not request.key.startswith(BLOB_PREFIX):
+        raise HTTPException(status_code=400, detail="Недопустимый ключ загрузки.")
+    session = await load_multipart(request.key, request.upload_id, user)
+    try:
+        await s3_client.abort_multipart_upload(request.key, request.upload_id)
+        await upload_repo.remove(session.id)
+        return {"message": "Загрузка отменена."}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка отмены загрузки: {str(e)}")
+
+
+@router.get("/presign/download/{filename}")
+async def presign_download(filename: str, user: User = Depends(current_user)):
+    """
+    Выдаёт подписанную ссылку на скачивание файла напрямую из S3.
+    """
+    try:
+        key = await file_storage.resolve_key(str(user.id), filename)
+        if await s3_client.head_object(key) is None:
             raise HTTPException(status_code=404, detail="Файл не найден.")
+        return {"url": await s3_client.presign_download(key), "expires_in": S3_PRESIGN_EXPIRES}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка подписи ссылки: {str(e)}")
+
+
+def part_count(session):
+    return math.ceil(session.size / session.part_size)
+
+
+def part_length(session, number):
+    # Все части, кроме последней, ровно part_size байт
+    return min(session.part_size, session.size - (number - 1) * session.part_size)
+
+
+def upload_progress(session, parts):
+    """
+    Состояние загрузки: принятые части и offset - число байт от начала файла, принятых
+    без пропусков (с него продолжается последовательная загрузка после обрыва).
+    """
+    received = [number for number, _, _ in parts]
+    offset = 0
+    for expected, (number, size, _) in enumerate(parts, start=1):
+        if number != expected:
+            break
+        offset += size
+    return {"upload": session.token, "size": session.size, "part_size": session.part_size,
+            "parts": part_count(session), "received": received, "offset": offset}
 
-        # Optionally return the file content (e.g., as base64, or save to disk)
-        return {"filename": filename,
-                "content": file_content}  # Adjust according to how you want to return the file content
+
+async def load_upload(token, user):
+    session = await upload_repo.find(token, user.id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Загрузка не найдена.")
+    return session
+
+
+def is_missing_upload(error):
+    return error.response.get("Error", {}).get("Code") in ("NoSuchUpload", "404")
+
+
+@router.post("/uploads")
+async def create_upload(request: UploadCreate, user: User = Depends(current_user)):
+    """
+    Начинает возобновляемую загрузку большого файла. Файл отправляется частями по part_size байт
+    (последняя - остаток) запросами PUT /uploads/{upload}/parts/{номер}; части можно отправлять
+    параллельно и в любом порядке. После обрыва GET /uploads/{upload} показывает принятые части,
+    и загрузка продолжается с первой недостающей. Файл появляется у пользователя только
+    после POST /uploads/{upload}/finish.
+    Если у пользователя уже есть файл с таким sha256, загружать ничего не нужно (exists=true).
+    Содержимое других пользователей по одному хэшу не выдаётся: его нужно загрузить, и хэш
+    будет проверен при завершении.
+    """
+    check_filename(request.filename)
+    try:
+        if await file_storage.link_owned(str(user.id), request.filename, request.sha256):
+            await file_repo.add(File(request.filename, request.status, 'v1.0', request.path, user_id=user.id))
+            return {"exists": True}
+        key = file_storage.upload_key(request.sha256)
+        upload = await s3_client.create_multipart_upload(key, request.size)
+        session = UploadSession(uuid.uuid4().hex, user.id, request.filename, request.path, request.status,
+                                request.sha256, request.size, upload["part_size"], key, upload["upload_id"])
+        await upload_repo.add(session)
+        return {"exists": False, **upload_progress(session, [])}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ошибка получения файла: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка создания загрузки: {str(e)}")
+
+
+@router.get("/uploads/{token}")
+async def get_upload(token: str, user: User = Depends(current_user)):
+    session = await load_upload(token, user)
+    return upload_progress(session, await upload_repo.parts(session.id))
+
+
+@router.put("/uploads/{token}/parts/{number}")
+async def upload_part(token: str, number: int, request: Request, user: User = Depends(current_user),
+                      content_md5: str | None = Header(default=None)):
+    """
+    Принимает часть number (с 1) в теле запроса. Повторная отправка части заменяет прежнюю.
+    Content-MD5, если указан, проверяется S3.
+    """
+    session = await load_upload(token, user)
+    if not 1 <= number <= part_count(session):
+        raise HTTPException(status_code=400, detail=f"Номер части должен быть от 1 до {part_count(session)}.")
+    expected = part_length(session, number)
+    declared = request.headers.get("content-length")
+    if declared is not None and int(declared) != expected:
+        raise HTTPException(status_code=400, detail=f"Часть {number} должна содержать {expected} байт.")
+    body = await request.body()
+    if len(body) != expected:
+        raise HTTPException(status_code=400, detail=f"Часть {number} должна содержать {expected} байт.")
+    try:
+        etag = await s3_client.upload_part(session.key, session.upload_id, number, body, content_md5)
+        await upload_repo.record_part(session.id, number, len(body), etag)
+        return {"number": number, "etag": etag}
+    except ClientError as e:
+        if is_missing_upload(e):
+            raise HTTPException(status_code=404, detail="Загрузка не найдена.")
+        raise HTTPException(status_code=400, detail=f"Часть отклонена хранилищем: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки части: {str(e)}")
+
+
+@router.post("/uploads/{token}/finish")
+async def finish_upload(token: str, user: User = Depends(current_user)):
+    """
+    Завершает загрузку: собирает объект из частей, проверяет sha256 содержимого
+    и только после этого записывает файл в таблицу file.
+    """
+    session = await load_upload(token, user)
+    parts = await upload_repo.parts(session.id)
+    received = {number for number, _, _ in parts}
+    missing = [number for number in range(1, part_count(session) + 1) if number not in received]
+    if missing:
+        raise HTTPException(status_code=409, detail={"message": "Загружены не все части.", "missing": missing})
+    try:
+        try:
+            await s3_client.complete_multipart_upload(session.key, session.upload_id,
+                                                      [(number, etag) for number, _, etag in parts])
+        except ClientError as e:
+            # Повторный вызов после сбоя: объект уже собран
+            if not is_missing_upload(e) or await s3_client.head_object(session.key) is None:
+                raise
+        await file_storage.complete_upload(str(user.id), session.name, session.hash, session.key)
+        await file_repo.add(File(session.name, session.status_id, 'v1.0', session.path, user_id=user.id))
+        await upload_repo.remove(session.id)
+        return {"message": f"Файл '{session.name}' успешно загружен в Selectel S3"}
+    except ContentMismatch:
+        await upload_repo.remove(session.id)
+        raise HTTPException(status_code=400, detail="Содержимое не совпадает с указанным sha256.")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка завершения загрузки: {str(e)}")
+
+
+@router.delete("/uploads/{token}")
+async def abort_upload(token: str, user: User = Depends(current_user)):
+    session = await load_upload(token, user)
+    try:
+        try:
+            await s3_client.abort_multipart_upload(session.key, session.upload_id)
+        except ClientError as e:
+            if not is_missing_upload(e):
+                raise
+        await upload_repo.remove(session.id)
+        return {"message": "Загрузка отменена."}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка отмены загрузки: {str(e)}")
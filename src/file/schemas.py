@@ -0,0 +1,38 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+SHA256_PATTERN = r"^[0-9a-f]{64}$"
+MAX_DELETE_FILES = 10000  # Максимум файлов в одном запросе пакетного удаления
+
+
+class PresignUpload(BaseModel):
+    filename: str
+    sha256: str = Field(pattern=SHA256_PATTERN)  # Хэш содержимого, считается клиентом
+    size: Optional[int] = None  # Если задан и больше одной части - выдаются ссылки multipart upload
+
+
+class PresignComplete(BaseModel):
+    filename: str
+    status: int
+    path: str
+    sha256: str = Field(pattern=SHA256_PATTERN)
+    key: str  # Ключ из ответа /presign/upload
+    upload_id: Optional[str] = None  # Только для multipart upload
+
+
+class PresignAbort(BaseModel):
+    key: str
+    upload_id: str
+
+
+class FileDelete(BaseModel):
+    names: list[str] = Field(min_length=1, max_length=MAX_DELETE_FILES)
+
+
+class UploadCreate(BaseModel):
+    filename: str
+    status: int
+    path: str
+    sha256: str = Field(pattern=SHA256_PATTERN)
+    size: int = Field(gt=0)
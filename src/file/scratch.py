@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from src.config import SCRATCH_DIR, SCRATCH_TMPFS_DIR, SCRATCH_TMPFS_MAX_SIZE, SCRATCH_QUOTA, SCRATCH_WAIT_TIMEOUT
+from src.file.locks import FileLock
+
+JOB_PREFIX = "job-"  # Каталоги задач называются job-<pid>-<случайный суффикс>
+STALE_AGE = 24 * 60 * 60  # Без проверки pid каталог считается брошенным через сутки
+LEDGER_FILE = "quota.json"  # Общий учёт квоты: {каталог задачи: зарезервировано байт}
+LEDGER_LOCK = "quota.lock"
+POLL_INTERVAL = 0.5  # Как часто (в секундах) ожидающая задача перечитывает учёт квоты
+
+
+class ScratchQuotaExceeded(Exception):
+    pass
+
+
+class ScratchJob:
+    """
+    Отдельный рабочий каталог задачи. Удаляется вместе с содержимым при close()
+    или при выходе из блока with, после чего зарезервированный объём возвращается в квоту.
+    """
+
+    def __init__(self, space, path, size):
+        self.space = space
+        self.path = path
+        self.size = size
+        self._closed = False
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.space.release(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ScratchSpace:
+    """
+    Выдаёт каждой задаче собственный временный каталог.
+
+    Небольшие задачи размещаются в tmpfs (/dev/shm), крупные - на диске. Суммарный
+    зарезервированный объём ограничен квотой: если места нет, acquire ждёт освобождения,
+    что ограничивает число одновременно обрабатываемых файлов.
+
+    Квота общая для всех процессов с тем же root (воркеры uvicorn, пул процессов, celery):
+    резервы записываются в файл учёта в root под файловой блокировкой. Резерв снимается
+    при закрытии задачи, а также когда её каталог удалён или создавший её процесс завершился.
+    """
+
+    def __init__(self, root, tmpfs_root=None, tmpfs_max_size=0, quota=0, wait_timeout=None):
+        self.root = root
+        self.tmpfs_root = tmpfs_root
+        self.tmpfs_max_size = tmpfs_max_size
+        self.quota = quota
+        self.wait_timeout = wait_timeout
+        # Будит ожидающих в этом процессе сразу после release, другие процессы замечают его при опросе
+        self._condition = threading.Condition()
+
+    def _roots(self):
+        roots = [self.root]
+        if self.tmpfs_root and os.path.isdir(self.tmpfs_root):
+            roots.append(os.path.join(self.tmpfs_root, os.path.basename(self.root.rstrip(os.sep))))
+        return roots
+
+    def _choose_root(self, size):
+        roots = self._roots()
+        if len(roots) > 1 and size <= self.tmpfs_max_size:
+            tmpfs = roots[1]
+            os.makedirs(tmpfs, exist_ok=True)
+            if shutil.disk_usage(tmpfs).free > size:
+                return tmpfs
+        os.makedirs(self.root, exist_ok=True)
+        return self.root
+
+    def _ledger(self, update):
+        """
+        Передаёт update действующие резервы всех процессов и сохраняет сделанные им изменения.
+        Файл учёта читается и пишется под блокировкой, поэтому проверка и резервирование атомарны.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, LEDGER_FILE)
+        lock = FileLock(os.path.join(self.root, LEDGER_LOCK))
+        lock.acquire()
+        try:
+            try:
+                with open(path) as f:
+                    ledger = json.load(f)
+            except (OSError, ValueError):
+                ledger = {}
+            reserved = {job: size for job, size in ledger.items() if _is_reserved(job)}
+            result = update(reserved)
+            if reserved != ledger:
+                part = f"{path}.{os.getpid()}"
+                with open(part, "w") as f:
+                    json.dump(reserved, f)
+                os.replace(part, path)
+            return result
+        finally:
+            lock.release()
+
+    def reserve(self, job, size):
+        """
+        Записывает за каталогом задачи job size байт квоты. Ждёт, пока квоты не хватает.
+        """
+        if self.quota and size > self.quota:
+            raise ScratchQuotaExceeded(f"Job needs {size} bytes, scratch quota is {self.quota} bytes")
+
+        def add(reserved):
+            if self.quota and sum(reserved.values()) + size > self.quota:
+                return False
+            reserved[job] = size
+            return True
+
+        deadline = None if self.wait_timeout is None else time.monotonic() + self.wait_timeout
+        with self._condition:
+            while not self._ledger(add):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise ScratchQuotaExceeded(f"Timed out waiting for {size} bytes of scratch space")
+                self._condition.wait(POLL_INTERVAL if remaining is None else min(remaining, POLL_INTERVAL))
+
+    def release(self, job):
+        self._ledger(lambda reserved: reserved.pop(job, None))
+        with self._condition:
+            self._condition.notify_all()
+
+    def acquire(self, size=0):
+        """
+        Создаёт каталог задачи и резервирует за ним size байт квоты. Ждёт, пока квоты не хватает.
+        """
+        path = tempfile.mkdtemp(prefix=f"{JOB_PREFIX}{os.getpid()}-", dir=self._choose_root(size))
+        try:
+            self.reserve(path, size)
+        except BaseException:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+        return ScratchJob(self, path, size)
+
+    @property
+    def used(self):
+        return self._ledger(lambda reserved: sum(reserved.values()))
+
+    def cleanup_stale(self):
+        """
+        Удаляет каталоги задач, оставшиеся после аварийно завершённых процессов.
+        Вызывается при старте: каталоги с pid текущего процесса тоже считаются брошенными.
+        """
+        removed = 0
+        for root in self._roots():
+            if not os.path.isdir(root):
+                continue
+            for entry in os.listdir(root):
+                path = os.path.join(root, entry)
+                if entry.startswith(JOB_PREFIX) and _is_stale(entry, path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed += 1
+        if removed:
+            logging.info(f"Removed {removed} stale scratch directories")
+        return removed
+
+
+def _job_pid(entry):
+    try:
+        return int(entry[len(JOB_PREFIX):].split("-", 1)[0])
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_stale(entry, path):
+    pid = _job_pid(entry)
+    if pid is None or pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # На Windows os.kill завершает процесс, поэтому ориентируемся на возраст каталога
+        return time.time() - os.path.getmtime(path) > STALE_AGE
+    return not _pid_alive(pid)
+
+
+def _is_reserved(job):
+    # Резерв действует, пока есть каталог задачи и жив создавший его процесс
+    if not os.path.isdir(job):
+        return False
+    pid = _job_pid(os.path.basename(job))
+    return pid is not None and (os.name == "nt" or _pid_alive(pid))
+
+
+scratch_space = ScratchSpace(
+    root=SCRATCH_DIR,
+    tmpfs_root=SCRATCH_TMPFS_DIR,
+    tmpfs_max_size=SCRATCH_TMPFS_MAX_SIZE,
+    quota=SCRATCH_QUOTA,
+    wait_timeout=SCRATCH_WAIT_TIMEOUT,
+)
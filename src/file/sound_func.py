@@ -1,13 +1,23 @@
 import enum
-import os
 import shutil
 from pathlib import Path
 
+import numpy as np
 from pydub import AudioSegment
-from moviepy.editor import VideoFileClip, AudioFileClip
-from pymediainfo import MediaInfo
+from moviepy.editor import VideoFileClip
 
-SIZE_THRESHOLD = 50 * 1024 * 1024  # Пример порога для большого файла (50MB)
+from src.config import DECODE_MAX_MEMORY
+from src.file.cut import cut_audio, smart_cut
+from src.file.compressor import BLOCK_SIZE, Compressor, compress_array
+from src.file.decoder import SAMPLE_WIDTH, decode_pcm, get_audio_params
+from src.file.probe import probe
+from src.file.scratch import scratch_space
+from src.file.loudness import LoudnessMeter, normalization_gain
+from src.file.stream import replace_audio, stream_analyse, stream_process
+
+# Версия обработки: входит в ключ кэша результатов, увеличивается при любом изменении,
+# меняющем результат (алгоритмы, значения по умолчанию, параметры кодирования)
+ENGINE_VERSION = 1
 
 class FileType(enum.Enum):
     Video = "Video",
@@ -16,115 +26,150 @@ class FileType(enum.Enum):
 def get_file_type(file):
     """
     Определяет тип файла: видео, аудио или неизвестный.
+    Метаданные берутся из кэша probe, поэтому повторные вызовы не разбирают файл заново.
     """
-    media_info = MediaInfo.parse(file)
-    has_video = False
-    has_audio = False
-    for track in media_info.tracks:
-        if track.track_type == FileType.Video.name:
-            has_video = True
-        elif track.track_type == FileType.Audio.name:
-            has_audio = True
-
-    if has_video:
-        return FileType.Video.name
-    elif has_audio:
-        return FileType.Audio.name
-    return "Unknown"
+    return probe(file).file_type
 
 
 def get_sound(file):
     """
     Загружает звуковой файл (или извлекает аудио из видеофайла).
-    Если файл большой, извлекает аудио во временный файл.
+    Звук декодируется один раз напрямую из ffmpeg, без промежуточных WAV-файлов.
     """
     file_type = get_file_type(file)
 
-    # Получаем размер файла
-    file_size = os.path.getsize(file)
-
     # Проверка типа файла
     if file_type == "Unknown":
         raise ValueError(f"Unsupported file type: '{file}'. Please upload a valid audio or video file.")
 
-    if file_type == FileType.Audio.name:
-        print(f"Loading audio from audio file ...")
-        return load_audio(file, file_type)
-
-    if file_size > SIZE_THRESHOLD:
-        print(f"File is large ({file_size / (1024 * 1024):.2f} MB), using temporary file...")
-        return extract_audio_to_temp_file(file, file_type)
-    else:
-        print(f"File is small ({file_size / (1024 * 1024):.2f} MB), using memory processing...")
-        return load_audio(file, file_type)
+    print(f"Loading audio from {file_type.lower()} file ...")
+    return load_audio(file, file_type)
 
 
 def load_audio(file, file_type):
     """
     Загружает аудио из файла, независимо от его типа (видео или аудио).
-    Если видео, извлекает аудио.
+    Сохраняются исходные частота дискретизации и раскладка каналов. Длинная запись
+    (больше DECODE_MAX_MEMORY байт PCM) отображается из временного файла, а не читается в память.
     """
-    if file_type == FileType.Video.name:
-        print("Extracting audio from video file...")
-        video = VideoFileClip(file)
-        audio = video.audio
-        temp_audio_path = "temp_audio.wav"
-        audio.write_audiofile(temp_audio_path, codec='pcm_s16le', fps=44100)
-        sound = AudioSegment.from_file(temp_audio_path)
-        os.remove(temp_audio_path)  # Удаляем временный файл
-    elif file_type == FileType.Audio.name:
-        print("Loading audio from audio file...")
-        sound = AudioSegment.from_file(file)
-    else:
+    if file_type not in (FileType.Video.name, FileType.Audio.name):
         raise ValueError("Unsupported file type")
 
-    return sound
+    data, sample_rate, channels = decode_pcm(file, max_memory=DECODE_MAX_MEMORY)
+    return AudioSegment(data=data, sample_width=SAMPLE_WIDTH, frame_rate=sample_rate, channels=channels)
 
 
-def extract_audio_to_temp_file(file, file_type):
+def segment_to_array(audio):
     """
-    Извлекает аудио и сохраняет его во временный файл для больших файлов.
+    Возвращает PCM-сэмплы AudioSegment как массив формы (frames, channels) без копирования.
     """
-    sound = load_audio(file, file_type)
-    temp_audio_path = "temp_audio.wav"
-    sound.export(temp_audio_path, format="wav")  # Экспортируем в WAV
-    sound_from_file = AudioSegment.from_file(temp_audio_path)
-    os.remove(temp_audio_path)  # Удаляем временный файл
-    return sound_from_file
+    dtype = {1: np.int8, 2: np.int16, 4: np.int32}[audio.sample_width]
+    return np.frombuffer(audio.raw_data, dtype=dtype).reshape(-1, audio.channels)
 
 
-def apply_compression(audio, threshold=-30, ratio=4.0):
+def array_to_segment(samples, template):
+    """
+    Создаёт AudioSegment из массива (frames, channels) с параметрами исходного сегмента.
+    """
+    return template._spawn(np.ascontiguousarray(samples).tobytes())
+
+
+def apply_compression(audio, threshold=-30, ratio=4.0, attack=5.0, release=50.0, knee=0.0, makeup_gain=0.0):
     # Применение компрессии с настройкой порога и соотношения
-    compressed_audio = compress_dynamic_range(audio, threshold=threshold, ratio=ratio)
+    compressed_audio = compress_dynamic_range(audio, threshold=threshold, ratio=ratio, attack=attack,
+                                              release=release, knee=knee, makeup_gain=makeup_gain)
     return compressed_audio
 
 
-def compress_dynamic_range(audio, threshold, ratio):
+def compress_dynamic_range(audio, threshold, ratio, **params):
     """
     Применяет компрессию для уменьшения динамического диапазона.
+    Стереоканалы обрабатываются связанно, без сведения в моно.
     """
-    audio = audio.set_channels(1)  # Для упрощения работы, ставим моно
-    compressed = audio.compress_dynamic_range(threshold=threshold, ratio=ratio)
-    return compressed
+    compressed = compress_array(segment_to_array(audio), audio.frame_rate,
+                                threshold=threshold, ratio=ratio, **params)
+    return array_to_segment(compressed, audio)
+
+
+def frame_progress(file, progress, start=0.0, share=1.0):
+    """
+    Переводит число обработанных сэмплов в долю выполнения [0, 1] для callback-а progress.
+    start и share позволяют отвести проходу часть общей шкалы.
+    """
+    if progress is None:
+        return None
+    media = probe(file)
+    total = max(media.duration * (media.sample_rate or 1), 1)
+    return lambda frames: progress(start + share * min(frames / total, 1.0))
+
+
+def stream_compression(file, res_file, threshold=-30, ratio=4.0, block_size=BLOCK_SIZE, progress=None, **params):
+    """
+    Сжимает звук файла потоково: ffmpeg декодирует PCM в канал, компрессор обрабатывает его
+    блоками фиксированного размера, сохраняя состояние огибающей, и результат сразу кодируется в res_file.
+    Для видео обработанный звук подставляется в исходное видео.
+    """
+    file_type = get_file_type(file)
+    if file_type == "Unknown":
+        raise ValueError(f"Unsupported file type: '{file}'. Please upload a valid audio or video file.")
+
+    sample_rate, channels = get_audio_params(file)
+    compressor = Compressor(sample_rate, threshold=threshold, ratio=ratio, **params)
+    video = file if file_type == FileType.Video.name else None
+    return stream_process(file, res_file, sample_rate, channels, compressor.process, block_size, video,
+                          frame_progress(file, progress))
+
+
+def measure_loudness(file, block_size=BLOCK_SIZE, progress=None):
+    """
+    Измеряет громкость файла по EBU R128 за один потоковый проход:
+    интегральная громкость (LUFS), диапазон громкости LRA (LU) и истинный пик (dBTP).
+    """
+    sample_rate, channels = get_audio_params(file)
+    meter = LoudnessMeter(sample_rate, channels)
+    stream_analyse(file, sample_rate, channels, meter.process, block_size, frame_progress(file, progress))
+    return meter.result()
+
+
+def normalize_loudness(file, res_file, target=-23.0, true_peak=-1.0, block_size=BLOCK_SIZE, progress=None):
+    """
+    Нормализует громкость в два прохода: сначала измеряет файл, затем потоково применяет
+    постоянное усиление, приводящее его к target LUFS без превышения true_peak dBTP.
+    Возвращает результаты измерения и применённое усиление.
+    """
+    file_type = get_file_type(file)
+    if file_type == "Unknown":
+        raise ValueError(f"Unsupported file type: '{file}'. Please upload a valid audio or video file.")
+
+    # Измерение занимает первую половину шкалы выполнения, применение усиления - вторую
+    measure_progress = None if progress is None else lambda done: progress(done / 2)
+    measurement = measure_loudness(file, block_size, measure_progress)
+    gain = normalization_gain(measurement, target, true_peak)
+    scale = 10 ** (gain / 20)
+
+    sample_rate, channels = get_audio_params(file)
+    video = file if file_type == FileType.Video.name else None
+    stream_process(file, res_file, sample_rate, channels, lambda block: block * scale, block_size, video,
+                   frame_progress(file, progress, 0.5, 0.5))
+
+    measurement["gain"] = gain
+    return measurement
 
 
 def save_or_replace_audio(file, audio, file_type, res_file="compressed file"):
     """
     Сохраняет или заменяет аудио в зависимости от типа файла, удаляя временные файлы.
     """
-    # Сохраняем обработанное аудио во временный файл
-    temp_audio_path = "temp_compressed_audio.wav"
-    audio.export(temp_audio_path, format="wav")
+    # Сохраняем обработанное аудио во временный файл в отдельном рабочем каталоге
+    job = scratch_space.acquire(len(audio.raw_data))
+    temp_audio_path = job.file("compressed_audio.wav")
 
     try:
+        audio.export(temp_audio_path, format="wav")
         if file_type == FileType.Video.name:
             print("Replacing audio in video file...")
-            video = VideoFileClip(file)
-            audio_clip = AudioFileClip(temp_audio_path)
-            video = video.set_audio(audio_clip)
-            output_video_path = res_file
-            video.write_videofile(output_video_path, codec="libx264", audio_codec="aac")
-            return output_video_path
+            # Видеопоток копируется без перекодирования, кодируется только новый звук
+            return replace_audio(file, temp_audio_path, res_file)
 
         elif file_type == FileType.Audio.name:
             output_audio_path = res_file
@@ -135,23 +180,34 @@ def save_or_replace_audio(file, audio, file_type, res_file="compressed file"):
             raise ValueError("Unsupported file type")
 
     finally:
-        # Удаляем временный файл
-        if os.path.exists(temp_audio_path):
-            os.remove(temp_audio_path)
-            print(f"Temporary file {temp_audio_path} deleted.")
+        # Удаляем рабочий каталог вместе с временным файлом
+        job.close()
 
 def cut_from_file(file, start, end):
-    if get_file_type(file) == FileType.Video.name:
+    file_type = get_file_type(file)
+    if file_type == FileType.Video.name:
         print("VIDEO")
         clip = VideoFileClip(file)
         clip = clip.subclip(start, end)
         return clip
-    elif get_file_type(file) == FileType.Audio.name:
+    elif file_type == FileType.Audio.name:
         print("AUDIO")
         audio = AudioSegment.from_file(file)
         trimmed_audio = audio[start * 1000:end * 1000]
         return trimmed_audio
 
+def cut_media(file, start, end, res_file):
+    """
+    Вырезает фрагмент [start, end) секунд в res_file без загрузки файла в память.
+    Для видео перекодируются только неполные группы кадров на границах фрагмента.
+    """
+    file_type = get_file_type(file)
+    if file_type == FileType.Video.name:
+        return smart_cut(file, start, end, res_file)
+    elif file_type == FileType.Audio.name:
+        return cut_audio(file, start, end, res_file)
+    raise ValueError(f"Unsupported file type: '{file}'. Please upload a valid audio or video file.")
+
 def save_file(fragment, name="output"):
     if isinstance(fragment, AudioSegment):
         if not name.endswith(".mp3") and not name.endswith(".wav"):
@@ -164,9 +220,10 @@ def save_file(fragment, name="output"):
 
 def save_result(file, path):
     if path.endswith not in (".mp3", '.mp4'):
-        if get_file_type(file) == FileType.Audio.name:
+        file_type = get_file_type(file)
+        if file_type == FileType.Audio.name:
             path += ".mp3"
-        elif get_file_type(file) == FileType.Video.name:
+        elif file_type == FileType.Video.name:
             path += ".mp4"
     shutil.copy(file, path)
 
@@ -0,0 +1,225 @@
+import hashlib
+import logging
+import uuid
+
+from botocore.exceptions import ClientError
+from starlette.concurrency import run_in_threadpool
+
+from src.config import S3_LIST_CACHE_TTL, S3_LIST_CACHE_SIZE
+from src.dbmodels import Blob
+from src.user.S3Client import s3_client
+from src.user.listing_cache import ListingCache
+from util.repositories.db_repos import SQLAlchemyPostgresqlBlobRepository
+
+BLOB_PREFIX = "blobs/"  # Объекты с содержимым файлов: blobs/<sha256>
+HASH_CHUNK_SIZE = 1024 * 1024  # Размер порции при подсчёте хэша
+
+
+class ContentMismatch(Exception):
+    pass
+
+
+def blob_key(digest):
+    return f"{BLOB_PREFIX}{digest}"
+
+
+def hash_stream(stream):
+    """
+    Считает sha256 и размер файлового объекта с текущей позиции, после чего возвращает позицию назад.
+    """
+    start = stream.tell()
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := stream.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+        size += len(chunk)
+    stream.seek(start)
+    return digest.hexdigest(), size
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hash_stream(f)
+
+
+class FileStorage:
+    """
+    Хранилище файлов пользователей с дедупликацией по содержимому.
+
+    Содержимое хранится в S3 один раз под ключом blobs/<sha256>, а имя файла пользователя -
+    это запись в таблице pointer со ссылкой на blob. Если такое содержимое уже есть, байты
+    в S3 не отправляются. Файлы, загруженные до появления дедупликации, лежат под ключами
+    <user_id>/<имя> и по-прежнему доступны.
+    """
+
+    def __init__(self, s3, repo):
+        self.s3 = s3
+        self.repo = repo
+        self.listing_cache = ListingCache(S3_LIST_CACHE_TTL, S3_LIST_CACHE_SIZE)
+
+    async def _store(self, user_id, name, digest, upload):
+        """
+        Привязывает имя к содержимому digest. upload() вызывается, только если такого содержимого
+        ещё нет: он загружает объект и возвращает (ключ, размер). Возвращает True, если объект
+        пришлось загрузить. Запросы к БД (link блокирует строку blob) выполняются в пуле потоков.
+        """
+        retained = await run_in_threadpool(self.repo.retain, digest)
+        try:
+            if retained:
+                await run_in_threadpool(self.repo.link, int(user_id), name, digest, retained=True)
+                return False
+            key, size = await upload()
+            stored_key = await run_in_threadpool(self.repo.link, int(user_id), name, digest,
+                                                 retained=False, key=key, size=size)
+            if stored_key != key:
+                # То же содержимое успели сохранить параллельно под другим ключом - наша копия лишняя
+                await self.s3.delete_object(key)
+            return True
+        except BaseException:
+            if retained:
+                await run_in_threadpool(self.repo.release, digest)
+            raise
+        finally:
+            self.listing_cache.invalidate(str(user_id))
+
+    async def store_upload(self, user_id, name, file):
+        """Сохраняет загруженный через API файл (UploadFile)."""
+        digest, size = await run_in_threadpool(hash_stream, file.file)
+
+        async def upload():
+            await self.s3.upload_stream(file.read, blob_key(digest), size)
+            return blob_key(digest), size
+
+        uploaded = await self._store(user_id, name, digest, upload)
+        logging.info(f"Файл '{name}' пользователя '{user_id}' сохранён, sha256={digest}, "
+                     f"{'загружен' if uploaded else 'уже был в хранилище'}.")
+        return digest
+
+    async def store_path(self, user_id, name, path):
+        """Сохраняет локальный файл (например, результат обработки)."""
+        digest, size = await run_in_threadpool(hash_file, path)
+
+        async def upload():
+            await self.s3.upload_path(path, blob_key(digest))
+            return blob_key(digest), size
+
+        await self._store(user_id, name, digest, upload)
+        return digest
+
+    def upload_key(self, digest):
+        """
+        Ключ для загрузки клиентом по подписанной ссылке. Уникален для каждой загрузки,
+        чтобы клиент не мог перезаписать уже проверенный объект с тем же хэшем.
+        """
+        return f"{blob_key(digest)}-{uuid.uuid4().hex}"
+
+    async def link_owned(self, user_id, name, digest):
+        """
+        Привязывает имя к содержимому, которое у пользователя уже есть под другим именем, без загрузки.
+        Хэш, присланный клиентом, не доказывает, что у него есть эти байты, поэтому чужое содержимое
+        так не привязывается. Возвращает False, если такого содержимого у пользователя нет.
+        """
+        if not await run_in_threadpool(self.repo.owns, int(user_id), digest):
+            return False
+
+        async def upload():
+            # Пользователь успел удалить файл, и содержимое забрал сборщик мусора
+            raise FileNotFoundError(f"Content {digest} is not in storage")
+
+        try:
+            await self._store(user_id, name, digest, upload)
+        except FileNotFoundError:
+            return False
+        return True
+
+    async def _hash_object(self, key):
+        try:
+            response, body = await self.s3.open_object(key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                raise FileNotFoundError(f"Object {key} is not uploaded")
+            raise
+        digest = hashlib.sha256()
+        async for chunk in body:
+            digest.update(chunk)
+        return digest.hexdigest(), response["ContentLength"]
+
+    async def complete_upload(self, user_id, name, digest, key):
+        """
+        Привязывает имя к содержимому, загруженному клиентом напрямую в S3 под ключом key.
+        Хэш объекта считается сервером всегда, даже если такое содержимое уже есть в хранилище:
+        только так клиент доказывает, что у него есть эти байты.
+        """
+        if not key.startswith(f"{blob_key(digest)}-"):
+            raise FileNotFoundError(f"Content {digest} is not in storage")
+        actual, size = await self._hash_object(key)
+        if actual != digest:
+            await self.s3.delete_object(key)
+            raise ContentMismatch(f"Uploaded content hash {actual} does not match {digest}")
+
+        async def upload():
+            return key, size
+
+        uploaded = await self._store(user_id, name, digest, upload)
+        if not uploaded and not await run_in_threadpool(self.repo.known_keys, [key]):
+            # Содержимое уже было в хранилище - загруженная клиентом копия не нужна. Если key уже
+            # принадлежит blob (повтор завершения той же загрузки), объект удалять нельзя
+            await self.s3.delete_object(key)
+
+    async def resolve_key(self, user_id, name):
+        """Ключ объекта в S3 с содержимым файла пользователя."""
+        return await run_in_threadpool(self.repo.resolve, int(user_id), name) or f"{user_id}/{name}"
+
+    async def remove(self, user_id, name):
+        """
+        Удаляет имя файла. Объект с содержимым остаётся, пока на него ссылаются другие имена;
+        blob без ссылок удаляет сборщик мусора.
+        """
+        try:
+            if not await run_in_threadpool(self.repo.unlink, int(user_id), name):
+                await self.s3.delete_file(str(user_id), name)
+        finally:
+            self.listing_cache.invalidate(str(user_id))
+
+    async def remove_many(self, user_id, names):
+        """
+        Удаляет несколько имён файлов: ссылки на blob снимаются одним запросом к БД,
+        файлы, загруженные до дедупликации, удаляются из S3 пакетами.
+        """
+        names = list(dict.fromkeys(names))
+        try:
+            linked = set(await run_in_threadpool(self.repo.unlink_many, int(user_id), names))
+            legacy = [f"{user_id}/{name}" for name in names if name not in linked]
+            if legacy:
+                await self.s3.delete_objects(legacy)
+        finally:
+            self.listing_cache.invalidate(str(user_id))
+
+    async def list_page(self, user_id, limit, cursor=None):
+        """
+        Страница списка файлов пользователя (см. S3Client.list_page): имена из таблицы pointer
+        объединяются с файлами, загруженными до дедупликации. В etag для файлов с дедупликацией
+        возвращается sha256 содержимого.
+        """
+        user_id = str(user_id)
+        cached = self.listing_cache.get(user_id, cursor, limit)
+        if cached is not None:
+            return cached
+
+        generation = self.listing_cache.generation(user_id)
+        pointers = await run_in_threadpool(self.repo.list_pointers, int(user_id), limit + 1, cursor)
+        legacy = await self.s3.list_page(user_id, limit, cursor)
+
+        entries = {file["name"]: file for file in legacy["files"]}
+        for name, size, created_at, digest in pointers:
+            entries[name] = {"name": name, "size": size, "last_modified": created_at.isoformat(), "etag": digest}
+        names = sorted(entries)
+        files = [entries[name] for name in names[:limit]]
+        has_more = len(names) > limit or len(pointers) > limit or legacy["next_cursor"] is not None
+
+        page = {"files": files, "next_cursor": files[-1]["name"] if has_more and files else None}
+        self.listing_cache.put(user_id, cursor, limit, page, generation)
+        return page
+
+
+file_storage = FileStorage(s3_client, SQLAlchemyPostgresqlBlobRepository(Blob))
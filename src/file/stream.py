@@ -0,0 +1,125 @@
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+from src.config import FFMPEG_BINARY
+from src.file.decoder import open_decoder, read_errors, spawn, stop_process
+
+SAMPLE_FORMAT = "f32le"  # Формат сырого PCM в каналах ffmpeg
+SAMPLE_DTYPE = np.float32
+DEFAULT_AUDIO_CODEC = "aac"
+AUDIO_CODECS = {  # Кодек звука для контейнеров, в которые не кладётся AAC
+    ".webm": "libopus",
+    ".ogv": "libvorbis",
+}
+
+
+def open_encoder(res_file, sample_rate, channels, video=None):
+    """
+    Запускает ffmpeg, который читает сырой PCM float32 со stdin и кодирует его в res_file.
+    Если передан video, аудио подставляется в качестве звуковой дорожки этого видео.
+    """
+    command = [FFMPEG_BINARY, "-nostdin", "-y", "-v", "error"]
+    if video is not None:
+        command += ["-i", video]
+    command += ["-f", SAMPLE_FORMAT, "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0"]
+    if video is not None:
+        command += remux_options(res_file)
+    command.append(res_file)
+    return spawn(command, stdin=subprocess.PIPE)
+
+
+def remux_options(res_file):
+    """
+    Опции ffmpeg для замены звука: видеопоток первого входа копируется без перекодирования,
+    кодируется только звук второго входа.
+    """
+    audio_codec = AUDIO_CODECS.get(Path(res_file).suffix.lower(), DEFAULT_AUDIO_CODEC)
+    return ["-map", "0:v", "-map", "1:a:0", "-c:v", "copy", "-c:a", audio_codec, "-shortest"]
+
+
+def replace_audio(video, audio, res_file):
+    """
+    Заменяет звуковую дорожку video на audio и пишет результат в res_file, копируя видео побитово.
+    """
+    command = [
+        FFMPEG_BINARY, "-nostdin", "-y", "-v", "error",
+        "-i", video, "-i", audio,
+        *remux_options(res_file),
+        res_file,
+    ]
+    process = spawn(command)
+    try:
+        wait_process(process, "remux")
+    finally:
+        stop_process(process)
+    return res_file
+
+
+def read_blocks(stream, channels, block_size):
+    """
+    Читает из потока блоки формы (block_size, channels); последний блок может быть короче.
+    """
+    frame_bytes = channels * np.dtype(SAMPLE_DTYPE).itemsize
+    while True:
+        data = stream.read(block_size * frame_bytes)
+        if not data:
+            return
+        frames = len(data) // frame_bytes
+        yield np.frombuffer(data[:frames * frame_bytes], dtype=SAMPLE_DTYPE).reshape(frames, channels)
+
+
+def wait_process(process, name):
+    """
+    Дожидается завершения ffmpeg и поднимает ошибку с его выводом, если он завершился неудачно.
+    """
+    if process.wait() != 0:
+        raise RuntimeError(f"ffmpeg {name} failed: {read_errors(process)}")
+
+
+def stream_process(file, res_file, sample_rate, channels, processor, block_size, video=None, progress=None):
+    """
+    Пропускает звук из file через processor блоками фиксированного размера и кодирует результат в res_file.
+    В памяти одновременно находится не больше одного блока, поэтому потребление не зависит от длины файла.
+    progress, если передан, вызывается после каждого блока с числом обработанных сэмплов.
+    """
+    frames = 0
+    decoder = open_decoder(file, sample_rate, channels, SAMPLE_FORMAT)
+    encoder = open_encoder(res_file, sample_rate, channels, video)
+    try:
+        try:
+            for block in read_blocks(decoder.stdout, channels, block_size):
+                processed = np.clip(processor(block), -1.0, 1.0).astype(SAMPLE_DTYPE, copy=False)
+                encoder.stdin.write(processed.tobytes())
+                frames += len(block)
+                if progress is not None:
+                    progress(frames)
+            encoder.stdin.close()
+        except BrokenPipeError:
+            # Кодировщик завершился раньше времени: причина - в его выводе, а не в оборванном канале
+            encoder.wait()
+            raise RuntimeError(f"ffmpeg encoder failed: {read_errors(encoder)}") from None
+        wait_process(decoder, "decoder")
+        wait_process(encoder, "encoder")
+    finally:
+        for process in (decoder, encoder):
+            stop_process(process)
+    return res_file
+
+
+def stream_analyse(file, sample_rate, channels, consumer, block_size, progress=None):
+    """
+    Декодирует звук file и передаёт его в consumer блоками фиксированного размера, ничего не кодируя.
+    """
+    frames = 0
+    decoder = open_decoder(file, sample_rate, channels, SAMPLE_FORMAT)
+    try:
+        for block in read_blocks(decoder.stdout, channels, block_size):
+            consumer(block)
+            frames += len(block)
+            if progress is not None:
+                progress(frames)
+        wait_process(decoder, "decoder")
+    finally:
+        stop_process(decoder)
@@ -0,0 +1,68 @@
+import uuid
+
+from celery.result import AsyncResult
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import RedirectResponse
+
+from src.database import async_session_maker
+from src.file.router import check_filename
+from src.dbmodels import Job
+from src.jobs.schemas import JobCreate, JobRead
+from src.jobs.worker import EAGER, celery, process_file
+from src.models import metadata
+from src.user.base_config import current_user
+from src.user.models import User
+from util.repositories.async_db_repos import SQLAlchemyPostgresqlAsyncJobRepository
+
+router = APIRouter()
+
+job_repo = SQLAlchemyPostgresqlAsyncJobRepository(Job, async_session_maker, metadata)
+
+
+async def get_owned_result(job_id: str, user: User) -> AsyncResult:
+    # Владелец хранится отдельно от результата: в состояниях PENDING и FAILURE в результате его нет
+    if await job_repo.owner(job_id) != user.id:
+        raise HTTPException(status_code=404, detail="Задача не найдена.")
+    return AsyncResult(job_id, app=celery)
+
+
+@router.post("", response_model=JobRead)
+async def submit_job(job: JobCreate, background_tasks: BackgroundTasks, user: User = Depends(current_user)):
+    check_filename(job.filename)
+    job_id = str(uuid.uuid4())
+    await job_repo.add(Job(job_id, user.id))
+    args = (str(user.id), job.filename, job.operation, job.params)
+    if EAGER:
+        # В локальном режиме задача запускается после отправки ответа, чтобы клиент сразу получил
+        # идентификатор; обработка идёт в пуле процессов API (см. src.jobs.worker.execute)
+        background_tasks.add_task(process_file.apply_async, args, task_id=job_id)
+        return JobRead(job_id=job_id, state="PENDING")
+    # Отправка в брокер не блокирует цикл событий
+    result = await run_in_threadpool(process_file.apply_async, args, task_id=job_id)
+    return JobRead(job_id=result.id, state=result.state)
+
+
+@router.get("/{job_id}", response_model=JobRead)
+async def get_job(job_id: str, user: User = Depends(current_user)):
+    result = await get_owned_result(job_id, user)
+    if result.failed():
+        return JobRead(job_id=job_id, state=result.state, error=str(result.result))
+
+    info = result.info if isinstance(result.info, dict) else {}
+    return JobRead(
+        job_id=job_id,
+        state=result.state,
+        progress=info.get("progress", 0.0),
+        filename=info.get("filename"),
+        details=info.get("details"),
+    )
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str, user: User = Depends(current_user)):
+    result = await get_owned_result(job_id, user)
+    if not result.successful():
+        raise HTTPException(status_code=409, detail=f"Задача ещё не завершена: {result.state}")
+    # Результат лежит в каталоге пользователя в S3 и отдаётся обычным маршрутом скачивания
+    return RedirectResponse(url=f"/files/files/{result.result['filename']}", status_code=303)
@@ -0,0 +1,59 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, model_validator
+
+
+class CompressParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    threshold: float = -30.0
+    ratio: float = Field(default=4.0, ge=1.0)
+    attack: float = Field(default=5.0, gt=0)
+    release: float = Field(default=50.0, gt=0)
+    knee: float = Field(default=0.0, ge=0)
+    makeup_gain: float = 0.0
+
+
+class NormalizeParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    target: float = -23.0
+    true_peak: float = -1.0
+
+
+class CutParams(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    start: float = Field(ge=0)
+    end: float
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.end <= self.start:
+            raise ValueError("end must be greater than start")
+        return self
+
+
+OPERATION_PARAMS = {"compress": CompressParams, "normalize": NormalizeParams, "cut": CutParams}
+
+
+class JobCreate(BaseModel):
+    filename: str
+    operation: Literal["compress", "normalize", "cut"]
+    params: dict = {}
+
+    @model_validator(mode="after")
+    def check_params(self):
+        # Параметры проверяются при отправке: неизвестные ключи и неверные значения дают 422,
+        # а в задачу (и в ключ кэша результатов) попадают только полные параметры операции
+        self.params = OPERATION_PARAMS[self.operation](**self.params).model_dump()
+        return self
+
+
+class JobRead(BaseModel):
+    job_id: str
+    state: str
+    progress: float = 0.0
+    filename: Optional[str] = None
+    details: Optional[dict] = None
+    error: Optional[str] = None
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from pathlib import Path
+
+from anyio import from_thread
+from celery import Celery
+
+from src.config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND, CELERY_TASK_ALWAYS_EAGER
+from src.dbmodels import File, Status
+from src.file.executor import process_pool
+from src.file.object_cache import object_cache
+from src.file.result_cache import cache_key, result_cache
+from src.file.scratch import scratch_space
+from src.file.storage import file_storage, hash_file
+from src.file.sound_func import stream_compression, normalize_loudness, cut_media
+from util.repositories.db_repos import SQLAlchemyPostgresqlDataclassRepository, SQLAlchemyPostgresqlFileRepository
+
+RESULT_STATUS = "completed"  # Статус, с которым результат записывается в таблицу file
+RESULT_VERSION = "v1.0"
+PROGRESS_STEP = 0.01  # Прогресс сохраняется не чаще, чем раз в 1%
+
+# С брокером memory:// задачи выполняются прямо в процессе API, а сама обработка - в его пуле процессов
+EAGER = CELERY_TASK_ALWAYS_EAGER or CELERY_BROKER_URL.startswith("memory://")
+
+# Результаты в памяти видны только записавшему их процессу: если задачи выполняет отдельный воркер,
+# API никогда не увидел бы их завершения
+if not EAGER and CELERY_RESULT_BACKEND.split("+")[-1].startswith("memory://"):
+    raise RuntimeError(f"Result backend '{CELERY_RESULT_BACKEND}' is local to one process and cannot be used "
+                       f"with broker '{CELERY_BROKER_URL}'; set CELERY_RESULT_BACKEND to a shared backend")
+
+celery = Celery("sound_normalization", broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+celery.conf.update(
+    task_always_eager=EAGER,
+    # Без этого выполненные на месте задачи не попадают в хранилище результатов и навсегда остаются в PROGRESS
+    task_store_eager_result=True,
+    task_track_started=True,
+    result_extended=True,
+)
+
+OPERATIONS = {
+    "compress": lambda source, res_file, params, progress: stream_compression(
+        source, res_file, progress=progress, **params),
+    "normalize": lambda source, res_file, params, progress: normalize_loudness(
+        source, res_file, progress=progress, **params),
+    "cut": lambda source, res_file, params, progress: cut_media(
+        source, params["start"], params["end"], res_file),
+}
+
+
+def run_operation(operation, source, res_file, params, progress=None):
+    """
+    Применяет операцию к файлу. Функция уровня модуля, чтобы её можно было передать в пул процессов.
+    """
+    return OPERATIONS[operation](source, res_file, params, progress)
+
+
+def result_filename(filename, operation):
+    path = Path(filename)
+    return f"{path.stem}_{operation}{path.suffix}"
+
+
+def get_status_id(name):
+    status_repo = SQLAlchemyPostgresqlDataclassRepository(Status)
+    for status in status_repo.list():
+        if status.name.lower() == name:
+            return status.id
+    raise ValueError(f"Status '{name}' not found")
+
+
+def execute(operation, source, res_file, params, progress):
+    if EAGER:
+        # Задача выполняется в потоке API (BackgroundTasks): обработка уходит в общий пул процессов,
+        # место в очереди которого занято ещё при приёме задачи (AdmissionMiddleware).
+        # Прогресс из другого процесса не передаётся
+        return from_thread.run(process_pool.run, run_operation, operation, source, res_file, params)
+    return run_operation(operation, source, res_file, params, progress)
+
+
+@celery.task(bind=True, name="jobs.process_file")
+def process_file(self, user_id: str, filename: str, operation: str, params: dict):
+    """
+    Обрабатывает файл пользователя из S3: скачивает его в рабочий каталог, применяет операцию,
+    загружает результат обратно в каталог пользователя и записывает его в таблицу file.
+    """
+    last_reported = -PROGRESS_STEP
+
+    def report(progress):
+        nonlocal last_reported
+        if progress - last_reported >= PROGRESS_STEP:
+            last_reported = progress
+            self.update_state(state="PROGRESS", meta={"user_id": user_id, "progress": progress})
+
+    report(0.0)
+    result_name = result_filename(filename, operation)
+    result_key = f"{user_id}/{result_name}"
+
+    with scratch_space.acquire() as job:
+        source = job.file("source" + Path(filename).suffix)
+        res_file = job.file("result" + Path(filename).suffix)
+        source_key = asyncio.run(file_storage.resolve_key(user_id, filename))
+        # Исходник берётся из локального кэша: повторная обработка не скачивает его заново
+        asyncio.run(object_cache.get(source_key, source))
+        key = cache_key(hash_file(source), operation, params, Path(filename).suffix)
+        cached = asyncio.run(result_cache.get(key))
+        if cached is not None:
+            asyncio.run(result_cache.fetch(cached, res_file))
+            details = result_cache.details(cached)
+        else:
+            details = execute(operation, source, res_file, params, report)
+            asyncio.run(result_cache.store_quietly(key, res_file, Path(filename).suffix,
+                                                   details if isinstance(details, dict) else None))
+        asyncio.run(file_storage.store_path(user_id, result_name, res_file))
+
+    file_repo = SQLAlchemyPostgresqlFileRepository(File)
+    file_repo.add(File(result_name, get_status_id(RESULT_STATUS), RESULT_VERSION, result_key,
+                      user_id=int(user_id)))
+    logging.info(f"Job {self.request.id}: '{filename}' -> '{result_name}'")
+
+    return {
+        "user_id": user_id,
+        "progress": 1.0,
+        "filename": result_name,
+        "details": details if isinstance(details, dict) else None,
+    }
@@ -1,13 +1,25 @@
-import tempfile
+import asyncio
+import shutil
+from contextlib import asynccontextmanager
 from typing import Annotated
 from fastapi import FastAPI, Depends, UploadFile, Form
-from starlette.responses import FileResponse
+from starlette.background import BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, JSONResponse, StreamingResponse
 
 from fastapi_users import FastAPIUsers
 
-from src.file.router import router as file_router
-from src.file.sound_func import get_file_extension, apply_compression, load_audio, get_file_type, save_or_replace_audio
+from src.file.router import router as file_router, content_type
+from src.file.collector import storage_collector
+from src.jobs.router import router as jobs_router
+from src.jobs.worker import EAGER
+from src.file.executor import ExecutorBusy, process_pool
+from src.file.result_cache import cache_key, result_cache
+from src.file.scratch import ScratchQuotaExceeded, scratch_space
+from src.file.sound_func import get_file_extension, stream_compression, cut_media, normalize_loudness, measure_loudness
+from src.file.storage import hash_file
 from src.user.base_config import auth_backend, current_user
+from src.user.S3Client import s3_client
 from src.user.manager import get_user_manager
 from src.user.models import User
 from src.user.schemas import UserRead, UserCreate
@@ -19,9 +31,63 @@ fastapi_users = FastAPIUsers[User, int](
     [auth_backend],
 )
 
+UPLOAD_SIZE_FACTOR = 3  # Резерв рабочего места: исходный файл, результат и промежуточные файлы
+DEFAULT_EXTENSION = ".mp4"
+# Маршруты, принимающие файл на обработку в пуле процессов
+PROCESSING_PATHS = {"/file/compress", "/file/normalize", "/file/loudness", "/file/cut"}
+if EAGER:
+    # Локальные задачи обрабатываются в том же пуле процессов. Фоновая задача выполняется
+    # до завершения ответа, поэтому место в очереди занято, пока задача не закончится
+    PROCESSING_PATHS.add("/jobs")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Удаляем рабочие каталоги, оставшиеся после аварийного завершения прошлых запусков
+    scratch_space.cleanup_stale()
+    process_pool.start()
+    await s3_client.start()
+    # Сборщик мусора хранилища работает в фоне, пока запущено приложение
+    collector = asyncio.create_task(storage_collector.run())
+    yield
+    collector.cancel()
+    await s3_client.close()
+    process_pool.shutdown()
+
+
+class AdmissionMiddleware:
+    """
+    Занимает место в очереди обработки до того, как будет прочитано тело запроса:
+    при заполненной очереди клиент получает 429 сразу, а не после загрузки всего файла.
+    Место освобождается, когда отправлен ответ.
+    """
+
+    def __init__(self, app, pool, paths):
+        self.app = app
+        self.pool = pool
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        admission = self.pool.admit()
+        try:
+            admission.__enter__()
+        except ExecutorBusy as e:
+            await busy_response(e)(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            admission.__exit__(None, None, None)
+
+
 app = FastAPI(
-    title="Sound Normalization"
+    title="Sound Normalization",
+    lifespan=lifespan,
 )
+app.add_middleware(AdmissionMiddleware, pool=process_pool, paths=PROCESSING_PATHS)
 
 
 
@@ -46,34 +112,197 @@ app.include_router(
     tags=["files"],  # Тэг для маршрутов
 )
 
+# Асинхронная обработка файлов через очередь задач
+app.include_router(
+    jobs_router,
+    prefix="/jobs",
+    tags=["jobs"],
+)
+
 @app.get("/protected-route")
 def protected_route(user: User = Depends(current_user)):
     return f"Hello, {user.name}"
 
+
+@app.get("/users/me", response_model=UserRead)
+def get_me(user: User = Depends(current_user)):
+    # Только чтение: клиенту нужен свой id, менять данные через этот маршрут нельзя
+    return user
+
+def save_upload(file: UploadFile, job):
+    """
+    Сохраняет загруженный файл в рабочий каталог задачи и возвращает путь к нему.
+    """
+    file_path = job.file("uploaded" + (get_file_extension(file.filename or "") or DEFAULT_EXTENSION))
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(file.file, f)
+    return file_path
+
+
+def acquire_job(file: UploadFile):
+    return scratch_space.acquire((file.size or 0) * UPLOAD_SIZE_FACTOR)
+
+
+def job_response(job, path, headers=None, key=None, details=None):
+    # После отправки ответа результат сохраняется в кэш (если передан ключ), затем рабочий каталог удаляется
+    tasks = BackgroundTasks()
+    if key is not None:
+        tasks.add_task(result_cache.store_quietly, key, path, get_file_extension(path), details)
+    tasks.add_task(job.close)
+    return FileResponse(path, headers=headers, background=tasks)
+
+
+async def find_cached(file_path, operation, params):
+    """
+    Ищет готовый результат операции над загруженным файлом. Возвращает ключ кэша
+    и запись (CachedResult) или None, если результата ещё нет.
+    """
+    input_hash = await run_in_threadpool(hash_file, file_path)
+    key = cache_key(input_hash, operation, params, get_file_extension(file_path))
+    return key, await result_cache.get(key)
+
+
+async def cached_response(entry, headers=None):
+    # Закэшированный результат отдаётся потоком прямо из S3
+    response, body = await s3_client.open_object(entry.object_key)
+    headers = {"Content-Length": str(response["ContentLength"]), **(headers or {})}
+    return StreamingResponse(body, headers=headers,
+                             media_type=content_type(entry.object_key, response.get("ContentType")))
+
+
+def loudness_headers(result):
+    # Результаты измерения передаются в заголовках, тело ответа - обработанный файл.
+    # Неопределённые значения (громкость и пик тишины) передаются как -inf
+    def header(value):
+        return f"{value:.2f}" if value is not None else "-inf"
+
+    return {
+        "X-Integrated-Loudness": header(result['integrated']),
+        "X-Loudness-Range": header(result['loudness_range']),
+        "X-True-Peak": header(result['true_peak']),
+        "X-Gain": header(result['gain']),
+    }
+
+
+def busy_response(error):
+    """
+    Ответ при перегрузке: 429, если заполнена очередь обработки, и 503, если не хватает
+    рабочего места на диске. Retry-After подсказывает клиенту, когда повторить запрос.
+    """
+    if isinstance(error, ExecutorBusy):
+        status_code, retry_after = 429, error.retry_after
+    else:
+        status_code, retry_after = 503, process_pool.retry_after
+    return JSONResponse({"message": str(error)}, status_code=status_code,
+                        headers={"Retry-After": str(retry_after)})
+
+
+async def receive_job(file: UploadFile):
+    """
+    Резервирует рабочий каталог и сохраняет в него загруженный файл.
+    Ожидание квоты и запись на диск блокируют, поэтому выполняются в пуле потоков.
+    """
+    job = await run_in_threadpool(acquire_job, file)
+    try:
+        return job, await run_in_threadpool(save_upload, file, job)
+    except:
+        job.close()
+        raise
+
+
 @app.post("/file/compress")
-def compress_file(file: UploadFile,
-                  thresh: Annotated[int, Form()],
-                  ratio: Annotated[float, Form()]
-                  ):
+async def compress_file(file: UploadFile,
+                        thresh: Annotated[int, Form()],
+                        ratio: Annotated[float, Form()]
+                        ):
+    job = None
     try:
         print(thresh, ratio)
         print(file.filename)
         # Добавить проверку на тип файла
         # Тоже самое для обрезания
 
-        file_path = "uploaded.mp4"
-        with open(file_path, "wb") as f:
-            f.write(file.file.read())
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f"{get_file_extension(file_path)}")
-        temp_file.close()
-        result = apply_compression(load_audio(file_path, get_file_type(file_path)), thresh, ratio)
-        save_or_replace_audio(
-            file_path,
-            result,
-            get_file_type(file_path),
-            temp_file.name
-        )
-        return FileResponse(temp_file.name)
+        job, file_path = await receive_job(file)
+        key, cached = await find_cached(file_path, "compress", {"threshold": thresh, "ratio": ratio})
+        if cached is None:
+            res_file = job.file("result" + get_file_extension(file_path))
+            await process_pool.run(stream_compression, file_path, res_file, thresh, ratio)
+        if cached is not None:
+            job.close()
+            return await cached_response(cached)
+        return job_response(job, res_file, key=key)
+    except (ExecutorBusy, ScratchQuotaExceeded) as e:
+        if job is not None:
+            job.close()
+        return busy_response(e)
     except:
+        if job is not None:
+            job.close()
         return {"message": "Error!"}
 
+
+@app.post("/file/normalize")
+async def normalize_file(file: UploadFile,
+                         target: Annotated[float, Form()] = -23.0,
+                         true_peak: Annotated[float, Form()] = -1.0
+                         ):
+    job = None
+    try:
+        job, file_path = await receive_job(file)
+        key, cached = await find_cached(file_path, "normalize", {"target": target, "true_peak": true_peak})
+        if cached is None:
+            res_file = job.file("result" + get_file_extension(file_path))
+            result = await process_pool.run(normalize_loudness, file_path, res_file, target, true_peak)
+        if cached is not None:
+            job.close()
+            return await cached_response(cached, loudness_headers(result_cache.details(cached)))
+        return job_response(job, res_file, loudness_headers(result), key=key, details=result)
+    except (ExecutorBusy, ScratchQuotaExceeded) as e:
+        if job is not None:
+            job.close()
+        return busy_response(e)
+    except:
+        if job is not None:
+            job.close()
+        return {"message": "Error!"}
+
+
+@app.post("/file/loudness")
+async def loudness_file(file: UploadFile):
+    job = None
+    try:
+        job, file_path = await receive_job(file)
+        return await process_pool.run(measure_loudness, file_path)
+    except (ExecutorBusy, ScratchQuotaExceeded) as e:
+        return busy_response(e)
+    except:
+        return {"message": "Error!"}
+    finally:
+        if job is not None:
+            job.close()
+
+
+@app.post("/file/cut")
+async def cut_file(file: UploadFile,
+                   start: Annotated[float, Form()],
+                   end: Annotated[float, Form()]
+                   ):
+    job = None
+    try:
+        job, file_path = await receive_job(file)
+        key, cached = await find_cached(file_path, "cut", {"start": start, "end": end})
+        if cached is None:
+            res_file = job.file("result" + get_file_extension(file_path))
+            await process_pool.run(cut_media, file_path, start, end, res_file)
+        if cached is not None:
+            job.close()
+            return await cached_response(cached)
+        return job_response(job, res_file, key=key)
+    except (ExecutorBusy, ScratchQuotaExceeded) as e:
+        if job is not None:
+            job.close()
+        return busy_response(e)
+    except:
+        if job is not None:
+            job.close()
+        return {"message": "Error!"}
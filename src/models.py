@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from sqlalchemy import MetaData, Table, Column, String, Integer, TIMESTAMP, ForeignKey, Boolean
+from sqlalchemy import MetaData, Table, Column, String, Integer, TIMESTAMP, ForeignKey, Boolean, BigInteger, UniqueConstraint, Index, func, text
 
 metadata = MetaData()
 
@@ -26,4 +26,86 @@ file = Table(
     Column("status_id", Integer, ForeignKey(status.c.id)),
     Column("version", String),
     Column("parameters_id", Integer, ForeignKey(parameters.c.id)),
+    Column("deleted_at", TIMESTAMP, index=True),  # Файл удалён; строку позже удаляет сборщик мусора
+    Column("user_id", Integer),  # Владелец; у файлов, загруженных до появления столбца, может быть не задан
+    # Имя уникально среди неудалённых файлов пользователя: удалённые строки ждут сборщика мусора
+    Index("ix_file_user_id_name", "user_id", "name", unique=True, postgresql_where=text("deleted_at IS NULL")),
+    Index("ix_file_user_id_status_id", "user_id", "status_id"),
+)
+
+# Содержимое файлов хранится в S3 один раз, под ключом, начинающимся с blobs/<sha256>
+blob = Table(
+    "blob",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("hash", String, nullable=False, unique=True),
+    Column("key", String, nullable=False),  # Ключ объекта в S3
+    Column("size", BigInteger, nullable=False),
+    Column("refcount", Integer, nullable=False, server_default="0"),
+    Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+    Column("released_at", TIMESTAMP, index=True),  # Когда refcount стал нулевым
+)
+
+# Имя файла пользователя, ссылающееся на содержимое
+pointer = Table(
+    "pointer",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False),
+    Column("name", String, nullable=False),
+    Column("blob_id", Integer, ForeignKey(blob.c.id), nullable=False, index=True),
+    Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+    UniqueConstraint("user_id", "name"),
+)
+
+# Кэш результатов обработки: объект results/<key> в S3 для каждого ключа
+result_cache = Table(
+    "result_cache",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("key", String, nullable=False, unique=True),
+    Column("object_key", String, nullable=False),
+    Column("size", BigInteger, nullable=False),
+    Column("details", String),  # Дополнительные результаты операции в JSON
+    Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+    Column("accessed_at", TIMESTAMP, nullable=False, server_default=func.now(), index=True),
+)
+
+# Возобновляемая загрузка: multipart upload в S3, части которого клиент отправляет через API
+upload_session = Table(
+    "upload_session",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("token", String, nullable=False, unique=True),  # Идентификатор загрузки для клиента
+    Column("user_id", Integer, nullable=False),
+    Column("name", String, nullable=False),
+    Column("path", String, nullable=False),
+    Column("status_id", Integer, ForeignKey(status.c.id)),
+    Column("hash", String, nullable=False),  # Ожидаемый sha256 содержимого
+    Column("size", BigInteger, nullable=False),
+    Column("part_size", BigInteger, nullable=False),
+    Column("key", String, nullable=False),
+    Column("upload_id", String, nullable=False),  # UploadId multipart upload в S3
+    Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+    Column("updated_at", TIMESTAMP, nullable=False, server_default=func.now(), index=True),
+)
+
+# Принятые части возобновляемой загрузки
+upload_part = Table(
+    "upload_part",
+    metadata,
+    Column("session_id", Integer, ForeignKey(upload_session.c.id, ondelete="CASCADE"), primary_key=True),
+    Column("number", Integer, primary_key=True),
+    Column("size", BigInteger, nullable=False),
+    Column("etag", String, nullable=False),
+)
+
+# Владелец фоновой задачи: записывается до отправки задачи, поэтому известен в любом её состоянии
+job = Table(
+    "job",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("task_id", String, nullable=False, unique=True),  # Идентификатор задачи celery
+    Column("user_id", Integer, nullable=False),
+    Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
 )
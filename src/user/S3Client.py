@@ -1,46 +1,146 @@
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+import math
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from aiobotocore.config import AioConfig
 from aiobotocore.session import get_session
 from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+from src.config import (access_key, secret_key, endpoint_url, bucket_name,
+                        S3_PART_SIZE, S3_UPLOAD_CONCURRENCY, S3_MAX_POOL_CONNECTIONS, S3_KEEPALIVE_TIMEOUT,
+                        S3_MAX_ATTEMPTS, S3_RETRY_MODE, S3_CONNECT_TIMEOUT, S3_READ_TIMEOUT,
+                        S3_LIST_CACHE_TTL, S3_LIST_CACHE_SIZE, S3_PRESIGN_EXPIRES)
+from src.user.listing_cache import ListingCache
 
 logging.basicConfig(level=logging.INFO)  # Настройка логирования
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Размер порции при скачивании объекта на диск
+MIN_PART_SIZE = 5 * 1024 * 1024  # Минимальный размер части multipart-загрузки в S3 (кроме последней)
+MAX_PARTS = 10000  # Максимальное число частей в одной multipart-загрузке
+MAX_LIST_KEYS = 1000  # Максимум объектов в одном ответе list_objects_v2
+MAX_DELETE_KEYS = 1000  # Максимум ключей в одном запросе delete_objects
+
 class S3Client:
-    def __init__(self, access_key: str, secret_key: str, endpoint_url: str, bucket_name: str):
+    """
+    Клиент S3 приложения. После start() все операции идут через один долгоживущий клиент
+    с общим пулом соединений (без нового TLS-рукопожатия на каждый запрос); close() закрывает его.
+    Клиент привязан к циклу событий, в котором создан: в другом цикле (asyncio.run в задачах
+    Celery) и без start() клиент создаётся на время одной операции.
+    """
+
+    def __init__(self, access_key: str, secret_key: str, endpoint_url: str, bucket_name: str,
+                 part_size: int = S3_PART_SIZE, upload_concurrency: int = S3_UPLOAD_CONCURRENCY,
+                 max_pool_connections: int = S3_MAX_POOL_CONNECTIONS, keepalive_timeout: float = S3_KEEPALIVE_TIMEOUT,
+                 max_attempts: int = S3_MAX_ATTEMPTS, retry_mode: str = S3_RETRY_MODE):
         self.config = {
             "aws_access_key_id": access_key,
             "aws_secret_access_key": secret_key,
             "endpoint_url": endpoint_url,
+            "config": AioConfig(
+                max_pool_connections=max_pool_connections,
+                connect_timeout=S3_CONNECT_TIMEOUT,
+                read_timeout=S3_READ_TIMEOUT,
+                retries={"max_attempts": max_attempts, "mode": retry_mode},
+                connector_args={"keepalive_timeout": keepalive_timeout},
+            ),
         }
         self.bucket_name = bucket_name
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.upload_concurrency = upload_concurrency
         self.session = get_session()
+        self.listing_cache = ListingCache(S3_LIST_CACHE_TTL, S3_LIST_CACHE_SIZE)
+        self._client = None
+        self._exit_stack = None
+        self._loop = None
+
+    async def start(self):
+        if self._client is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._exit_stack = AsyncExitStack()
+        self._client = await self._exit_stack.enter_async_context(self.session.create_client("s3", **self.config))
+        logging.info("Клиент S3 создан.")
+
+    async def close(self):
+        if self._client is None:
+            return
+        stack = self._exit_stack
+        self._client = self._exit_stack = self._loop = None
+        await stack.aclose()
+        logging.info("Клиент S3 закрыт.")
 
     @asynccontextmanager
     async def get_client(self):
+        if self._client is not None and asyncio.get_running_loop() is self._loop:
+            yield self._client
+            return
         async with self.session.create_client("s3", **self.config) as client:
             yield client
 
-    async def create_directory(self, user_id: str):
-        async with self.get_client() as client:
-            # Добавляем ключ с конечной косой чертой, что интерпретируется как "папка"
-            key = f"{user_id}/"
-            try:
-                response = await client.put_object(Bucket=self.bucket_name, Key=key, Body=b"")
-                if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-                    logging.info(f"Директория для пользователя '{user_id}' создана успешно.")
-                else:
-                    logging.error(f"Не удалось создать директорию. Код ответа: {response['ResponseMetadata']['HTTPStatusCode']}")
-            except Exception as e:
-                logging.error(f"Ошибка при создании директории: {e}")
-
     async def upload_file(self, file: UploadFile, object_name: str):
+        """Загружает файл в S3 частями, не читая его целиком в память."""
+        await self.upload_stream(file.read, object_name, file.size)
+
+    def _part_size(self, size):
+        # Для очень больших файлов часть увеличивается, чтобы уложиться в MAX_PARTS
+        if size:
+            return max(self.part_size, math.ceil(size / MAX_PARTS))
+        return self.part_size
+
+    async def upload_stream(self, read, key: str, size: int = None):
+        """
+        Загружает в S3 данные, читаемые через await read(n).
+        Файл меньше одной части отправляется одним put_object, остальные - через multipart upload:
+        одновременно загружается не больше upload_concurrency частей, поэтому в памяти
+        находится лишь несколько частей. При ошибке загрузка отменяется (abort_multipart_upload).
+        """
+        part_size = self._part_size(size)
         async with self.get_client() as client:
-            file_content = await file.read()  # Чтение содержимого файла
-            await client.put_object(
-                Bucket=self.bucket_name,
-                Key=object_name,
-                Body=file_content
-            )
+            chunk = await read(part_size)
+            if len(chunk) < part_size:
+                await client.put_object(Bucket=self.bucket_name, Key=key, Body=chunk)
+                self._invalidate_listing(key)
+                return
+
+            upload = await client.create_multipart_upload(Bucket=self.bucket_name, Key=key)
+            upload_id = upload["UploadId"]
+            semaphore = asyncio.Semaphore(self.upload_concurrency)
+            tasks = []
+
+            async def upload_part(number, body):
+                try:
+                    response = await client.upload_part(
+                        Bucket=self.bucket_name, Key=key, UploadId=upload_id, PartNumber=number, Body=body
+                    )
+                    return {"PartNumber": number, "ETag": response["ETag"]}
+                finally:
+                    semaphore.release()
+
+            try:
+                number = 1
+                while chunk:
+                    # Ждём свободный слот, прежде чем читать следующую часть
+                    await semaphore.acquire()
+                    failed = next((t for t in tasks if t.done() and t.exception()), None)
+                    if failed is not None:
+                        raise failed.exception()
+                    tasks.append(asyncio.create_task(upload_part(number, chunk)))
+                    chunk = await read(part_size)
+                    number += 1
+                parts = await asyncio.gather(*tasks)
+                await client.complete_multipart_upload(
+                    Bucket=self.bucket_name, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+                )
+                self._invalidate_listing(key)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+                logging.error(f"Загрузка '{key}' прервана, multipart upload {upload_id} отменён.")
+                raise
 
     async def delete_file(self, user_id: str, filename: str):
         """Удаляет файл из S3 в директории пользователя."""
@@ -48,6 +148,7 @@ class S3Client:
         async with self.get_client() as client:
             try:
                 response = await client.delete_object(Bucket=self.bucket_name, Key=key)
+                self._invalidate_listing(key)
                 if response['ResponseMetadata']['HTTPStatusCode'] == 204:
                     logging.info(f"Файл '{filename}' пользователя '{user_id}' успешно удалён.")
                 else:
@@ -57,32 +158,285 @@ class S3Client:
                 logging.error(f"Ошибка при удалении файла: {e}")
                 raise e  # Для правильного перехвата и обработки исключения в маршруте
 
-    async def list_files(self, user_id: str):
+    def _invalidate_listing(self, key):
+        self.listing_cache.invalidate(key.split("/", 1)[0])
+
+    async def delete_object(self, key: str):
+        async with self.get_client() as client:
+            await client.delete_object(Bucket=self.bucket_name, Key=key)
+        self._invalidate_listing(key)
+
+    async def delete_objects(self, keys):
+        """
+        Удаляет объекты пакетами по MAX_DELETE_KEYS ключей за запрос. Отсутствующие объекты
+        считаются удалёнными. Если какие-то объекты удалить не удалось, после обработки всех
+        пакетов выбрасывается исключение со списком их ключей.
+        """
+        keys = list(dict.fromkeys(keys))
+        failed = []
+        async with self.get_client() as client:
+            for start in range(0, len(keys), MAX_DELETE_KEYS):
+                batch = keys[start:start + MAX_DELETE_KEYS]
+                response = await client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+                failed.extend(error["Key"] for error in response.get("Errors", []))
+        for key in keys:
+            self._invalidate_listing(key)
+        if failed:
+            raise RuntimeError(f"Не удалось удалить объекты: {', '.join(failed)}")
+        logging.info(f"Удалено объектов: {len(keys)}")
+
+    async def iter_objects(self, prefix: str):
+        """Перебирает все объекты с префиксом prefix (элементы Contents ответа list_objects_v2)."""
+        params = {"Bucket": self.bucket_name, "Prefix": prefix, "MaxKeys": MAX_LIST_KEYS}
+        async with self.get_client() as client:
+            while True:
+                response = await client.list_objects_v2(**params)
+                for obj in response.get("Contents", []):
+                    yield obj
+                if not response.get("IsTruncated", False):
+                    break
+                params["ContinuationToken"] = response["NextContinuationToken"]
+
+    async def abort_stale_uploads(self, before, keep=()):
+        """
+        Прерывает multipart-загрузки, начатые раньше before (datetime с часовым поясом), кроме
+        загрузок с UploadId из keep: их части занимают место в бакете, пока загрузка не завершена
+        или не прервана. Возвращает число прерванных загрузок.
+        """
+        aborted = 0
+        params = {"Bucket": self.bucket_name}
+        async with self.get_client() as client:
+            while True:
+                response = await client.list_multipart_uploads(**params)
+                for upload in response.get("Uploads", []):
+                    if upload["Initiated"] < before and upload["UploadId"] not in keep:
+                        await client.abort_multipart_upload(
+                            Bucket=self.bucket_name, Key=upload["Key"], UploadId=upload["UploadId"]
+                        )
+                        aborted += 1
+                if not response.get("IsTruncated", False):
+                    break
+                params["KeyMarker"] = response["NextKeyMarker"]
+                params["UploadIdMarker"] = response["NextUploadIdMarker"]
+        return aborted
+
+    async def list_page(self, user_id: str, limit: int = MAX_LIST_KEYS, cursor: str = None):
+        """
+        Возвращает страницу файлов пользователя: не больше limit файлов, идущих по алфавиту
+        после cursor (имени последнего файла предыдущей страницы), и курсор следующей страницы
+        (None, если страница последняя). Каждый файл - словарь с name, size, last_modified и etag.
+        Если limit больше MAX_LIST_KEYS, запросы продолжаются по ContinuationToken.
+        """
+        cached = self.listing_cache.get(user_id, cursor, limit)
+        if cached is not None:
+            return cached
+
+        generation = self.listing_cache.generation(user_id)
         prefix = f"{user_id}/"
+        params = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if cursor:
+            params["StartAfter"] = prefix + cursor
+        files = []
+        truncated = False
         async with self.get_client() as client:
+            while len(files) < limit:
+                response = await client.list_objects_v2(MaxKeys=min(limit - len(files), MAX_LIST_KEYS), **params)
+                for obj in response.get("Contents", []):
+                    # Пустое имя - маркер "директории", который создавался при регистрации раньше
+                    if obj["Key"] == prefix:
+                        continue
+                    files.append({
+                        "name": obj["Key"][len(prefix):],
+                        "size": obj["Size"],
+                        "last_modified": obj["LastModified"].isoformat(),
+                        "etag": obj["ETag"].strip('"'),
+                    })
+                truncated = response.get("IsTruncated", False)
+                if not truncated:
+                    break
+                params["ContinuationToken"] = response["NextContinuationToken"]
+
+        page = {"files": files, "next_cursor": files[-1]["name"] if truncated and files else None}
+        self.listing_cache.put(user_id, cursor, limit, page, generation)
+        return page
+
+    async def list_files(self, user_id: str):
+        """Возвращает имена всех файлов пользователя."""
+        try:
+            names = []
+            cursor = None
+            while True:
+                page = await self.list_page(user_id, MAX_LIST_KEYS, cursor)
+                names.extend(file["name"] for file in page["files"])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            logging.info(f"Файлы пользователя '{user_id}' успешно получены.")
+            return names
+        except Exception as e:
+            logging.error(f"Ошибка при получении списка файлов: {e}")
+            raise
+
+    async def open_object(self, key: str, byte_range: str = None, if_none_match: str = None):
+        """
+        Открывает объект для потоковой отдачи. byte_range (значение заголовка Range)
+        и if_none_match (If-None-Match) передаются в get_object как есть. Возвращает ответ
+        get_object (метаданные) и асинхронный генератор тела порциями по DOWNLOAD_CHUNK_SIZE;
+        соединение закрывается, когда генератор дочитан или закрыт.
+        """
+        params = {"Bucket": self.bucket_name, "Key": key}
+        if byte_range:
+            params["Range"] = byte_range
+        if if_none_match:
+            params["IfNoneMatch"] = if_none_match
+
+        stack = AsyncExitStack()
+        client = await stack.enter_async_context(self.get_client())
+        try:
+            response = await client.get_object(**params)
+        except Exception:
+            await stack.aclose()
+            raise
+
+        async def body():
             try:
-                response = await client.list_objects_v2(Bucket=self.bucket_name, Prefix=prefix)
-                files = [
-                    obj["Key"].replace(prefix, "") for obj in response.get("Contents", [])
-                ]
-                logging.info(f"Файлы пользователя '{user_id}' успешно получены.")
-                return files
-            except Exception as e:
-                logging.error(f"Ошибка при получении списка файлов: {e}")
+                while chunk := await response["Body"].read(DOWNLOAD_CHUNK_SIZE):
+                    yield chunk
+            finally:
+                response["Body"].close()
+                await stack.aclose()
+
+        return response, body()
+
+    async def download_file(self, key: str, path: str, if_none_match: str = None):
+        """
+        Скачивает объект из S3 в локальный файл порциями, не загружая его целиком в память,
+        и возвращает его ETag. Если передан if_none_match (ETag локальной копии) и объект
+        не изменился, файл не создаётся и возвращается None.
+        """
+        params = {"Bucket": self.bucket_name, "Key": key}
+        if if_none_match:
+            params["IfNoneMatch"] = if_none_match
+        async with self.get_client() as client:
+            try:
+                response = await client.get_object(**params)
+            except client.exceptions.ClientError as e:
+                if if_none_match and e.response.get("Error", {}).get("Code") == "304":
+                    return None
                 raise
+            try:
+                with open(path, "wb") as f:
+                    while chunk := await response["Body"].read(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            finally:
+                response["Body"].close()
+        logging.info(f"Объект '{key}' скачан в '{path}'.")
+        return response.get("ETag")
 
-    async def get_file_by_name(self, user_id: str, filename: str):
-        """Получает файл по имени из S3 в директории пользователя."""
-        key = f"{user_id}/{filename}"  # Формируем путь к файлу на основе user_id и имени файла
+    async def upload_path(self, path: str, key: str):
+        """Загружает локальный файл в S3 под ключом key."""
+        with open(path, "rb") as f:
+            async def read(n):
+                return await run_in_threadpool(f.read, n)
+            await self.upload_stream(read, key, os.fstat(f.fileno()).st_size)
+        logging.info(f"Файл '{path}' загружен в S3 как '{key}'.")
+
+
+    async def presign_upload(self, key: str, expires_in: int = S3_PRESIGN_EXPIRES):
+        """Ссылка для загрузки объекта одним PUT напрямую в S3."""
+        async with self.get_client() as client:
+            return await client.generate_presigned_url(
+                "put_object", Params={"Bucket": self.bucket_name, "Key": key}, ExpiresIn=expires_in
+            )
+
+    async def presign_download(self, key: str, expires_in: int = S3_PRESIGN_EXPIRES):
+        """Ссылка для скачивания объекта напрямую из S3 (поддерживает Range)."""
+        async with self.get_client() as client:
+            return await client.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket_name, "Key": key}, ExpiresIn=expires_in
+            )
+
+    async def presign_multipart_upload(self, key: str, size: int, expires_in: int = S3_PRESIGN_EXPIRES):
+        """
+        Начинает multipart upload и подписывает ссылки на загрузку каждой части.
+        Клиент отправляет i-ю часть (part_size байт, последняя - остаток) PUT-запросом на urls[i].
+        """
+        part_size = self._part_size(size)
+        parts = max(math.ceil(size / part_size), 1)
+        async with self.get_client() as client:
+            upload = await client.create_multipart_upload(Bucket=self.bucket_name, Key=key)
+            upload_id = upload["UploadId"]
+            urls = [
+                await client.generate_presigned_url(
+                    "upload_part",
+                    Params={"Bucket": self.bucket_name, "Key": key, "UploadId": upload_id, "PartNumber": number},
+                    ExpiresIn=expires_in,
+                )
+                for number in range(1, parts + 1)
+            ]
+        return {"upload_id": upload_id, "part_size": part_size, "urls": urls}
+
+    async def create_multipart_upload(self, key: str, size: int):
+        """Начинает multipart upload объекта размером size. Возвращает upload_id и размер части."""
+        async with self.get_client() as client:
+            upload = await client.create_multipart_upload(Bucket=self.bucket_name, Key=key)
+        return {"upload_id": upload["UploadId"], "part_size": self._part_size(size)}
+
+    async def upload_part(self, key: str, upload_id: str, number: int, body: bytes, content_md5: str = None):
+        """Загружает одну часть multipart upload и возвращает её ETag."""
+        params = {"Bucket": self.bucket_name, "Key": key, "UploadId": upload_id, "PartNumber": number, "Body": body}
+        if content_md5:
+            params["ContentMD5"] = content_md5  # S3 отклонит часть, повреждённую при передаче
+        async with self.get_client() as client:
+            response = await client.upload_part(**params)
+        return response["ETag"]
+
+    async def complete_multipart_upload(self, key: str, upload_id: str, parts=None):
+        """
+        Завершает multipart upload. parts - пары (номер части, ETag); если они не переданы
+        (загрузка по подписанным ссылкам), список частей берётся из S3 (list_parts).
+        """
+        params = {"Bucket": self.bucket_name, "Key": key, "UploadId": upload_id}
+        async with self.get_client() as client:
+            if parts is not None:
+                await client.complete_multipart_upload(
+                    MultipartUpload={"Parts": [{"PartNumber": number, "ETag": etag} for number, etag in parts]},
+                    **params,
+                )
+                self._invalidate_listing(key)
+                return
+            parts = []
+            while True:
+                response = await client.list_parts(**params)
+                parts.extend({"PartNumber": part["PartNumber"], "ETag": part["ETag"]}
+                             for part in response.get("Parts", []))
+                if not response.get("IsTruncated"):
+                    break
+                params["PartNumberMarker"] = response["NextPartNumberMarker"]
+            await client.complete_multipart_upload(MultipartUpload={"Parts": parts}, **params)
+        self._invalidate_listing(key)
+
+    async def abort_multipart_upload(self, key: str, upload_id: str):
+        async with self.get_client() as client:
+            await client.abort_multipart_upload(Bucket=self.bucket_name, Key=key, UploadId=upload_id)
+
+    async def head_object(self, key: str):
+        """Возвращает метаданные объекта или None, если его нет."""
         async with self.get_client() as client:
             try:
-                # Получаем объект из S3
-                response = await client.get_object(Bucket=self.bucket_name, Key=key)
-                file_content = await response['Body'].read()  # Чтение содержимого файла
-                print(file_content)
-                logging.info(f"Файл '{filename}' пользователя '{user_id}' успешно получен.")
-                return file_content
-            except Exception as e:
-                logging.error(f"Ошибка при получении файла: {e}")
-                raise e  # Исключение для правильного перехвата и обработки в маршруте
+                return await client.head_object(Bucket=self.bucket_name, Key=key)
+            except client.exceptions.ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    return None
+                raise
+
 
+s3_client = S3Client(
+    access_key=access_key,
+    secret_key=secret_key,
+    endpoint_url=endpoint_url,
+    bucket_name=bucket_name,
+)
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ListingCache:
+    """
+    Кэш страниц списка файлов пользователей (LRU с ограничением по времени жизни).
+
+    Загрузка и удаление файла сбрасывают все страницы пользователя. Чтобы список,
+    запрошенный до изменения, не попал в кэш после сброса, у каждого пользователя есть
+    номер поколения: страница сохраняется, только если поколение за время запроса не менялось.
+    Кэш локален для процесса, поэтому изменения из других процессов (воркеры Celery)
+    становятся видны не позже чем через ttl секунд.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (user_id, cursor, limit) -> (время сохранения, страница)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def get(self, user_id, cursor, limit):
+        key = (user_id, cursor, limit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, page = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return page
+
+    def put(self, user_id, cursor, limit, page, generation):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            if self._generations.get(user_id, 0) != generation:
+                return
+            self._entries[(user_id, cursor, limit)] = (time.monotonic(), page)
+            self._entries.move_to_end((user_id, cursor, limit))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
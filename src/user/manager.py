@@ -3,10 +3,8 @@ from typing import Optional
 from fastapi import Depends, Request
 from fastapi_users import BaseUserManager, IntegerIDMixin, schemas, models, exceptions
 
-from src.config import access_key, secret_key, endpoint_url, bucket_name
 from src.user.models import User
 from src.user.utils import get_user_db
-from src.user.S3Client import S3Client  # Импортируем S3Client
 
 SECRET = "SECRET"
 
@@ -37,19 +35,6 @@ class UserManager(IntegerIDMixin, BaseUserManager[User, int]):
 
         created_user = await self.user_db.create(user_dict)
 
-        # Создаем экземпляр S3Client и создаем директорию для пользователя
-        s3_client = S3Client(
-            access_key=access_key,
-            secret_key=secret_key,
-            endpoint_url=endpoint_url,
-            bucket_name=bucket_name,
-        )
-
-        try:
-            await s3_client.create_directory(str(created_user.id))
-        except Exception as e:
-            print(f"Ошибка при создании директории: {str(e)}")
-
         await self.on_after_register(created_user, request)
         return created_user
 
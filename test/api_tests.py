@@ -0,0 +1,407 @@
+"""API tests: фоновые задачи и загрузки в S3.
+
+Нужны БД с применёнными миграциями (DB_* в окружении или .env) и ENDPOINT_URL вида
+http://127.0.0.1:<порт>: на этом порту поднимается S3 из moto. Без них тесты пропускаются.
+"""
+import copy
+import hashlib
+import io
+import os
+import random
+import socket
+import wave
+from urllib.parse import urlparse
+
+import boto3
+import numpy as np
+import pytest
+
+os.environ.setdefault("GC_INTERVAL", "0")  # Сборщик мусора хранилища в тестах не нужен
+os.environ.setdefault("S3_PART_SIZE", str(5 * 1024 * 1024))  # Наименьшая часть, которую принимает S3
+
+from src.config import bucket_name, endpoint_url, access_key, secret_key, DB_HOST, DB_PORT
+
+
+def _reachable(host, port):
+    try:
+        socket.create_connection((host, int(port)), timeout=1).close()
+        return True
+    except (OSError, TypeError, ValueError):
+        return False
+
+
+S3_ENDPOINT = urlparse(endpoint_url or "")
+if S3_ENDPOINT.hostname not in ("127.0.0.1", "localhost") or not _reachable(DB_HOST, DB_PORT):
+    pytest.skip("Нужны БД и локальный ENDPOINT_URL для S3 из moto", allow_module_level=True)
+
+moto_server = pytest.importorskip("moto.server")
+
+import requests
+from fastapi.testclient import TestClient
+
+from src.main import app
+from src.user.S3Client import s3_client
+from src.user.base_config import current_user
+
+
+class FakeUser:
+    def __init__(self, id):
+        self.id = id
+
+
+@pytest.fixture(scope="module")
+def s3():
+    server = moto_server.ThreadedMotoServer(ip_address=S3_ENDPOINT.hostname, port=S3_ENDPOINT.port)
+    server.start()
+    client = boto3.client("s3", endpoint_url=endpoint_url, aws_access_key_id=access_key,
+                          aws_secret_access_key=secret_key, region_name="us-east-1")
+    client.create_bucket(Bucket=bucket_name)
+    yield client
+    server.stop()
+
+
+@pytest.fixture(scope="module")
+def client(s3):
+    with TestClient(app) as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def user(client):
+    # У каждого теста свой пользователь: имена файлов разных тестов не пересекаются
+    user = FakeUser(random.randint(10 ** 6, 10 ** 9))
+    app.dependency_overrides[current_user] = lambda: user
+    return user
+
+
+def login(user):
+    app.dependency_overrides[current_user] = lambda: user
+
+
+def tone(user, seconds=1.0, sample_rate=44100):
+    # Частота зависит от пользователя: содержимое уникально, и хранилище не найдёт его у прошлых запусков
+    frequency = 200 + user.id % 10 ** 6 / 1000
+    samples = (0.5 * np.sin(2 * np.pi * frequency * np.arange(int(seconds * sample_rate)) / sample_rate) * 32767)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+def upload(client, name, content):
+    response = client.post("/files/uploadfile", params={"path": name, "status": 1},
+                           files={"file": (name, content, "audio/wav")})
+    assert response.status_code == 200, response.text
+
+
+def content(size):
+    # Случайные байты: содержимое не совпадёт с уже загруженным в прошлых запусках
+    data = os.urandom(size)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def download(client, name):
+    response = client.get(f"/files/files/{name}")
+    assert response.status_code == 200, response.text
+    return response.content
+
+
+def pending_uploads(s3, key):
+    return s3.list_multipart_uploads(Bucket=bucket_name, Prefix=key).get("Uploads", [])
+
+
+def test_storage_shares_content_between_names(client, user, s3):
+    data, digest = content(1024)
+    upload(client, "first.bin", data)
+    upload(client, "second.bin", data)
+    assert s3.head_object(Bucket=bucket_name, Key=f"blobs/{digest}")["ContentLength"] == len(data)
+
+    files = client.get("/files/files", params={"metadata": True}).json()["files"]
+    assert [(file["name"], file["etag"]) for file in files] == [("first.bin", digest), ("second.bin", digest)]
+
+    # Удаление одного имени не затрагивает содержимое, на которое ссылается другое
+    assert client.delete("/files/files/first.bin").status_code == 200
+    assert client.get("/files/files/first.bin").status_code == 404
+    assert download(client, "second.bin") == data
+
+
+def test_presign_single_upload(client, user, s3):
+    data, digest = content(1024)
+    upload = client.post("/files/presign/upload", json={"filename": "small.bin", "sha256": digest}).json()
+    assert requests.put(upload["url"], data=data).status_code == 200
+
+    response = client.post("/files/presign/complete", json={"filename": "small.bin", "status": 1, "path": "small.bin",
+                                                            "sha256": digest, "key": upload["key"]})
+    assert response.status_code == 200, response.text
+    assert download(client, "small.bin") == data
+
+    # Ответ не выдаёт, что такое содержимое уже хранится: другой пользователь получает обычную ссылку,
+    # а его копия после проверки хэша удаляется
+    login(FakeUser(user.id + 1))
+    upload = client.post("/files/presign/upload", json={"filename": "copy.bin", "sha256": digest}).json()
+    assert "exists" not in upload
+    assert requests.put(upload["url"], data=data).status_code == 200
+    response = client.post("/files/presign/complete", json={"filename": "copy.bin", "status": 1, "path": "copy.bin",
+                                                            "sha256": digest, "key": upload["key"]})
+    assert response.status_code == 200, response.text
+    assert download(client, "copy.bin") == data
+    assert s3.list_objects_v2(Bucket=bucket_name, Prefix=f"blobs/{digest}")["KeyCount"] == 1
+
+
+def test_presign_complete_requires_uploaded_content(client, user):
+    data, digest = content(1024)
+    upload(client, "owned.bin", data)
+
+    # Хэш чужого содержимого без загруженных байт не даёт доступа к нему
+    login(FakeUser(user.id + 1))
+    complete = {"filename": "stolen.bin", "status": 1, "path": "stolen.bin", "sha256": digest}
+    assert client.post("/files/presign/complete", json=complete).status_code == 422
+    response = client.post("/files/presign/complete", json={**complete, "key": f"blobs/{digest}-{'0' * 32}"})
+    assert response.status_code == 404
+    assert client.get("/files/files/stolen.bin").status_code == 404
+
+
+def test_presign_multipart_upload(client, user):
+    data, digest = content(s3_client.part_size + 1024)
+    upload = client.post("/files/presign/upload",
+                         json={"filename": "large.bin", "sha256": digest, "size": len(data)}).json()
+    assert len(upload["urls"]) == 2
+
+    for number, url in enumerate(upload["urls"]):
+        part = data[number * upload["part_size"]:(number + 1) * upload["part_size"]]
+        assert requests.put(url, data=part).status_code == 200
+
+    # ETag частей сервер берёт из S3: клиент передаёт только upload_id
+    response = client.post("/files/presign/complete", json={"filename": "large.bin", "status": 1, "path": "large.bin",
+                                                            "sha256": digest, "key": upload["key"],
+                                                            "upload_id": upload["upload_id"]})
+    assert response.status_code == 200, response.text
+    assert download(client, "large.bin") == data
+
+
+def test_presign_complete_rejects_wrong_hash(client, user):
+    _, digest = content(1024)
+    upload = client.post("/files/presign/upload", json={"filename": "wrong.bin", "sha256": digest}).json()
+    requests.put(upload["url"], data=b"not the announced content")
+
+    response = client.post("/files/presign/complete", json={"filename": "wrong.bin", "status": 1, "path": "wrong.bin",
+                                                            "sha256": digest, "key": upload["key"]})
+    assert response.status_code == 400
+    assert client.get("/files/files/wrong.bin").status_code == 404
+
+
+def test_presign_abort(client, user, s3):
+    data, digest = content(s3_client.part_size + 1024)
+    upload = client.post("/files/presign/upload",
+                         json={"filename": "aborted.bin", "sha256": digest, "size": len(data)}).json()
+    requests.put(upload["urls"][0], data=data[:upload["part_size"]])
+    assert pending_uploads(s3, upload["key"])
+
+    # Отменить загрузку может только тот, кто её начал
+    abort = {"key": upload["key"], "upload_id": upload["upload_id"]}
+    login(FakeUser(user.id + 1))
+    assert client.post("/files/presign/abort", json=abort).status_code == 404
+    assert pending_uploads(s3, upload["key"])
+    login(user)
+
+    response = client.post("/files/presign/abort", json={"key": upload["key"], "upload_id": upload["upload_id"]})
+    assert response.status_code == 200
+    assert not pending_uploads(s3, upload["key"])
+    assert client.post("/files/presign/abort", json={"key": "other/key", "upload_id": "x"}).status_code == 400
+
+
+def create_upload(client, name, data, digest):
+    response = client.post("/files/uploads", json={"filename": name, "status": 1, "path": name,
+                                                   "sha256": digest, "size": len(data)})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def send_part(client, upload, data, number):
+    part = data[(number - 1) * upload["part_size"]:number * upload["part_size"]]
+    return client.put(f"/files/uploads/{upload['upload']}/parts/{number}", content=part)
+
+
+def test_resumable_upload_completes_from_recorded_etags(client, user):
+    data, digest = content(s3_client.part_size + 1024)
+    upload = create_upload(client, "resumable.bin", data, digest)
+    assert upload["parts"] == 2
+
+    # Части можно отправлять в любом порядке; ETag каждой сохраняется на сервере
+    etags = [send_part(client, upload, data, number).json()["etag"] for number in (2, 1)]
+    assert all(etags)
+
+    response = client.post(f"/files/uploads/{upload['upload']}/finish")
+    assert response.status_code == 200, response.text
+    assert download(client, "resumable.bin") == data
+    assert client.get(f"/files/uploads/{upload['upload']}").status_code == 404
+
+
+def test_resumable_upload_resumes_after_missing_part(client, user):
+    data, digest = content(s3_client.part_size + 1024)
+    upload = create_upload(client, "resumed.bin", data, digest)
+    assert send_part(client, upload, data, 2).status_code == 200
+
+    response = client.post(f"/files/uploads/{upload['upload']}/finish")
+    assert response.status_code == 409
+    assert response.json()["detail"]["missing"] == [1]
+
+    # После обрыва клиент узнаёт принятые части и дозагружает недостающую
+    progress = client.get(f"/files/uploads/{upload['upload']}").json()
+    assert progress["received"] == [2]
+    assert progress["offset"] == 0
+    assert send_part(client, upload, data, 1).status_code == 200
+    assert client.get(f"/files/uploads/{upload['upload']}").json()["offset"] == len(data)
+
+    assert client.post(f"/files/uploads/{upload['upload']}/finish").status_code == 200
+    assert download(client, "resumed.bin") == data
+
+
+def test_resumable_upload_rejects_wrong_part_size(client, user):
+    data, digest = content(s3_client.part_size + 1024)
+    upload = create_upload(client, "partial.bin", data, digest)
+    response = client.put(f"/files/uploads/{upload['upload']}/parts/1", content=data[:1024])
+    assert response.status_code == 400
+    assert client.put(f"/files/uploads/{upload['upload']}/parts/3", content=data[:1024]).status_code == 400
+
+
+def test_resumable_upload_abort(client, user, s3):
+    data, digest = content(s3_client.part_size + 1024)
+    upload = create_upload(client, "aborted.bin", data, digest)
+    send_part(client, upload, data, 1)
+    assert len(pending_uploads(s3, f"blobs/{digest}")) == 1
+
+    assert client.delete(f"/files/uploads/{upload['upload']}").status_code == 200
+    assert not pending_uploads(s3, f"blobs/{digest}")
+    assert client.get(f"/files/uploads/{upload['upload']}").status_code == 404
+
+    # Загрузка видна только её владельцу
+    other = create_upload(client, "other.bin", data, digest)
+    login(FakeUser(user.id + 1))
+    assert client.get(f"/files/uploads/{other['upload']}").status_code == 404
+    assert client.delete(f"/files/uploads/{other['upload']}").status_code == 404
+
+
+def test_resumable_upload_links_only_owned_content(client, user):
+    data, digest = content(s3_client.part_size + 1024)
+    upload(client, "owned.bin", data)
+
+    # Владелец содержимого получает копию без загрузки
+    assert create_upload(client, "copy.bin", data, digest) == {"exists": True}
+    assert download(client, "copy.bin") == data
+
+    # Другому пользователю одного хэша недостаточно: ему выдаётся обычная загрузка
+    login(FakeUser(user.id + 1))
+    other = create_upload(client, "stolen.bin", data, digest)
+    assert other["exists"] is False
+    assert client.post(f"/files/uploads/{other['upload']}/finish").status_code == 409
+    assert client.get("/files/files/stolen.bin").status_code == 404
+
+
+def test_job_local_mode_reports_result(client, user):
+    upload(client, "tone.wav", tone(user))
+
+    response = client.post("/jobs", json={"filename": "tone.wav", "operation": "normalize", "params": {}})
+    assert response.status_code == 200
+    job_id = response.json()["job_id"]
+
+    job = client.get(f"/jobs/{job_id}").json()
+    assert job["state"] == "SUCCESS"
+    assert job["progress"] == 1.0
+    assert job["filename"] == "tone_normalize.wav"
+
+    response = client.get(f"/jobs/{job_id}/result", follow_redirects=False)
+    assert response.status_code == 303
+    assert response.headers["location"].endswith("/tone_normalize.wav")
+    assert client.get(response.headers["location"]).status_code == 200
+
+
+@pytest.mark.parametrize("job", [
+    {"filename": "tone.wav", "operation": "cut", "params": {}},
+    {"filename": "tone.wav", "operation": "cut", "params": {"start": 2, "end": 1}},
+    {"filename": "tone.wav", "operation": "compress", "params": {"unknown": 1}},
+    {"filename": "tone.wav", "operation": "normalize", "params": {"target": "loud"}},
+])
+def test_job_params_validated_on_submit(client, user, job):
+    assert client.post("/jobs", json=job).status_code == 422
+
+
+def test_job_rejects_path_in_filename(client, user):
+    response = client.post("/jobs", json={"filename": "../1/tone.wav", "operation": "normalize"})
+    assert response.status_code == 400
+
+
+def test_job_hidden_from_other_users(client, user):
+    # Задача с несуществующим файлом завершается ошибкой: её текст тоже не должен быть виден чужим
+    job_id = client.post("/jobs", json={"filename": "missing.wav", "operation": "normalize"}).json()["job_id"]
+    assert client.get(f"/jobs/{job_id}").json()["state"] == "FAILURE"
+
+    login(FakeUser(user.id + 1))
+    assert client.get(f"/jobs/{job_id}").status_code == 404
+    assert client.get(f"/jobs/{job_id}/result").status_code == 404
+    assert client.get("/jobs/unknown").status_code == 404
+
+
+def test_processing_queue_full_rejects_before_reading_body(client, user, monkeypatch):
+    from src.file.executor import process_pool
+
+    monkeypatch.setattr(process_pool, "limit", 0)
+    read = []
+
+    def body():
+        read.append(True)
+        yield b"--boundary--\r\n"
+
+    response = client.post("/file/compress", content=body(),
+                           headers={"Content-Type": "multipart/form-data; boundary=boundary"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert not read
+
+
+def test_local_jobs_share_processing_queue(client, user, monkeypatch):
+    from src.file.executor import process_pool
+
+    monkeypatch.setattr(process_pool, "limit", 0)
+    response = client.post("/jobs", json={"filename": "tone.wav", "operation": "normalize"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+
+def test_result_cache_serves_repeated_request(client, user, s3):
+    data = tone(user)
+    form = {"target": "-20", "true_peak": "-1"}
+    first = client.post("/file/normalize", data=form, files={"file": ("tone.wav", data, "audio/wav")})
+    assert first.status_code == 200
+    assert s3.list_objects_v2(Bucket=bucket_name, Prefix="results/")["KeyCount"] >= 1
+
+    second = client.post("/file/normalize", data=form, files={"file": ("tone.wav", data, "audio/wav")})
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["X-Integrated-Loudness"] == first.headers["X-Integrated-Loudness"]
+
+
+def test_collector_reclaims_unreferenced_content(client, user, s3):
+    from src.file.collector import storage_collector
+
+    data, digest = content(1024)
+    upload(client, "garbage.bin", data)
+    assert client.delete("/files/files/garbage.bin").status_code == 200
+
+    collector = copy.copy(storage_collector)
+    collector.grace = 0
+    stats = client.portal.call(collector.collect)
+    assert stats["blobs"] >= 1
+    assert s3.list_objects_v2(Bucket=bucket_name, Prefix=f"blobs/{digest}")["KeyCount"] == 0
+
+
+def test_cut_audio(client, user):
+    response = client.post("/file/cut", data={"start": "0.25", "end": "0.75"},
+                           files={"file": ("tone.wav", tone(user), "audio/wav")})
+    assert response.status_code == 200
+    with wave.open(io.BytesIO(response.content)) as f:
+        assert f.getnframes() / f.getframerate() == pytest.approx(0.5, abs=0.01)
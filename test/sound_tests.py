@@ -1,8 +1,22 @@
 """Basic sound tests"""
+import json
+import subprocess
+import sys
+import tempfile
+import wave
+
+import numpy as np
 import pytest
 from pydub import AudioSegment
 
+from src.file.compressor import compress_array
+from src.file.cut import list_keyframes, smart_cut
+from src.file.decoder import decode_pcm
+from src.file.loudness import LoudnessMeter, normalization_gain
 from src.file.sound_func import get_file_type, get_sound, apply_compression, cut_from_file, save_file, FileType
+from src.file.probe import probe
+from src.file.scratch import ScratchQuotaExceeded, ScratchSpace
+from src.file.stream import stream_process
 
 
 @pytest.mark.parametrize("name",
@@ -41,4 +55,160 @@ def test_apply_compression():
     assert compressed_audio.dBFS < audio.dBFS
 
 def test_sound_cut():
-    save_file(cut_from_file("sounds\\perfomance.mp4", 2,5))
\ No newline at end of file
+    save_file(cut_from_file("sounds\\perfomance.mp4", 2,5))
+
+@pytest.mark.parametrize("threshold, ratio", [(-20, 4.0), (-30, 2.0)])
+def test_compressor_static_curve(threshold, ratio):
+    sample_rate = 44100
+    t = np.arange(sample_rate) / sample_rate
+    tone = 0.9 * np.sin(2 * np.pi * 440 * t)
+    samples = (np.stack([tone, 0.5 * tone], axis=1) * 32767).astype(np.int16)
+
+    compressed = compress_array(samples, sample_rate, threshold=threshold, ratio=ratio)
+
+    steady = compressed[sample_rate // 2:].astype(np.float64) / 32768
+    input_db = 20 * np.log10(0.9)
+    expected_db = threshold + (input_db - threshold) / ratio
+    assert compressed.shape == samples.shape
+    assert abs(20 * np.log10(np.abs(steady[:, 0]).max()) - expected_db) < 0.5
+    assert np.abs(steady[:, 1]).max() == pytest.approx(np.abs(steady[:, 0]).max() / 2, rel=0.01)
+
+
+@pytest.mark.parametrize("sample_rate, block_size", [(48000, 4096), (44100, 1000)])
+def test_loudness_reference_tone(sample_rate, block_size):
+    # Стерео синус 1 кГц с амплитудой -23 dBFS в каждом канале должен давать -23 LUFS
+    t = np.arange(sample_rate * 10) / sample_rate
+    tone = 10 ** (-23 / 20) * np.sin(2 * np.pi * 1000 * t)
+    samples = np.stack([tone, tone], axis=1)
+
+    meter = LoudnessMeter(sample_rate, 2)
+    for start in range(0, len(samples), block_size):
+        meter.process(samples[start:start + block_size])
+    result = meter.result()
+
+    assert result["integrated"] == pytest.approx(-23.0, abs=0.1)
+    assert result["loudness_range"] == pytest.approx(0.0, abs=0.1)
+    assert result["true_peak"] == pytest.approx(-23.0, abs=0.1)
+
+
+def test_loudness_silent_input():
+    # У тишины громкость и пик не определены: вместо -inf - None, чтобы результат сериализовался в JSON
+    meter = LoudnessMeter(48000, 2)
+    meter.process(np.zeros((48000 * 5, 2)))
+    result = meter.result()
+
+    assert result == {"integrated": None, "loudness_range": 0.0, "true_peak": None}
+    json.dumps(result, allow_nan=False)
+    assert normalization_gain(result) == 0.0
+
+
+def write_tone(path, seconds, sample_rate=44100, amplitude=0.5):
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    samples = (amplitude * np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(samples.tobytes())
+    return path
+
+
+def test_stream_process_reports_encoder_error(tmp_path):
+    # Кодировщик не может открыть выход: в ошибке должен быть вывод ffmpeg, а не BrokenPipeError
+    source = write_tone(str(tmp_path / "tone.wav"), seconds=30)
+    with pytest.raises(RuntimeError, match=r"ffmpeg encoder failed: \S"):
+        stream_process(source, str(tmp_path / "result.unknown"), 44100, 1, lambda block: block, 4096)
+
+
+def test_decode_pcm_spills_long_audio_to_disk(tmp_path):
+    source = write_tone(str(tmp_path / "tone.wav"), seconds=3)
+    in_memory, sample_rate, channels = decode_pcm(source)
+    mapped, _, _ = decode_pcm(source, max_memory=4096)
+
+    assert isinstance(in_memory, bytes)
+    assert not isinstance(mapped, bytes)
+    assert mapped[:] == in_memory
+    audio = AudioSegment(data=mapped, sample_width=2, frame_rate=sample_rate, channels=channels)
+    assert len(audio) == 3000
+
+
+def test_probe_mpegts(tmp_path):
+    # В MPEG-TS MediaInfo отдаёт StreamOrder вида "0-1"
+    path = str(tmp_path / "clip.ts")
+    subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=1:size=160x120",
+                    "-f", "lavfi", "-i", "sine=duration=1", "-c:v", "libx264", "-c:a", "aac", "-f", "mpegts", path],
+                   check=True)
+    media = probe(path)
+
+    assert media.file_type == FileType.Video.name
+    assert media.sample_rate == 44100
+    assert media.channels == 1
+    assert media.video_stream is None
+    assert media.audio_stream is None
+
+
+def test_probe_stream_indexes(tmp_path):
+    path = str(tmp_path / "clip.mp4")
+    subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=1:size=160x120",
+                    "-f", "lavfi", "-i", "sine=duration=1", "-c:v", "libx264", "-c:a", "aac", path], check=True)
+    media = probe(path)
+
+    assert media.video_stream == 0
+    assert media.audio_stream == 1
+
+
+def test_list_keyframes_uses_container_start(tmp_path):
+    # Звук в MP4 начинается раньше первого видеокадра, поэтому start_time контейнера не равен
+    # времени первого видеопакета; ключевые кадры должны отсчитываться от него, как и -ss
+    path = str(tmp_path / "clip.mp4")
+    subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=4:size=160x120:rate=25",
+                    "-f", "lavfi", "-i", "sine=duration=4", "-c:v", "libx264", "-g", "25", "-c:a", "aac",
+                    "-output_ts_offset", "7", path], check=True)
+    keyframes = list_keyframes(path)
+
+    assert len(keyframes) == 4
+    assert keyframes[0] > 0
+    assert keyframes[1] - keyframes[0] == pytest.approx(1.0)
+
+
+def test_scratch_quota_shared_between_instances(tmp_path):
+    # Экземпляры с общим каталогом ведут себя как разные процессы: учёт квоты у них общий
+    first = ScratchSpace(str(tmp_path), quota=100, wait_timeout=0)
+    second = ScratchSpace(str(tmp_path), quota=100, wait_timeout=0)
+
+    job = first.acquire(60)
+    with pytest.raises(ScratchQuotaExceeded):
+        second.acquire(60)
+    assert second.used == 60
+
+    job.close()
+    with second.acquire(60):
+        assert first.used == 60
+    assert first.used == 0
+
+
+def test_scratch_quota_drops_reservations_of_dead_processes(tmp_path):
+    space = ScratchSpace(str(tmp_path), quota=100, wait_timeout=0)
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    # Каталог и резерв, оставшиеся от аварийно завершившегося процесса
+    space.reserve(tempfile.mkdtemp(prefix=f"job-{process.pid}-", dir=str(tmp_path)), 80)
+
+    with space.acquire(80):
+        assert space.used == 80
+
+
+@pytest.mark.parametrize("start, end, frames", [(1.3, 7.7, 160), (0.9, 4.1, 80), (2.5, 8.5, 150)])
+def test_smart_cut_keeps_exact_frames(tmp_path, start, end, frames):
+    # B-кадры: пакеты идут не по порядку показа, и копирование по времени захватывало кадры соседних групп
+    path = str(tmp_path / "clip.mp4")
+    subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=10:size=160x120:rate=25",
+                    "-f", "lavfi", "-i", "sine=duration=10", "-c:v", "libx264", "-g", "25", "-bf", "2",
+                    "-c:a", "aac", path], check=True)
+    res_file = smart_cut(path, start, end, str(tmp_path / "cut.mp4"))
+
+    output = subprocess.run(["ffmpeg", "-nostdin", "-v", "error", "-i", res_file, "-map", "0:v:0", "-f", "framemd5", "-"],
+                            check=True, capture_output=True, text=True).stdout
+    assert sum(1 for line in output.splitlines() if line and not line.startswith("#")) == frames
+    assert probe(res_file).duration == pytest.approx(end - start, abs=0.1)
+    assert probe(res_file).audio_codec == "AAC"
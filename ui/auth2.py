@@ -1,21 +1,26 @@
+import asyncio
 import os
 import tempfile
 
-from pydub import AudioSegment
-
 from src.file.router import upload_file
 from src.file.sound_func import cut_from_file, save_file, apply_compression, load_audio, get_file_type, save_or_replace_audio, get_file_extension, save_result
+from src.file.object_cache import ObjectCache
+from src.file.probe import probe
 import requests
 import flet as ft
 
 from src.dbmodels import File
-from util.repositories.db_repos import SQLAlchemyPostgresqlDataclassRepository
+from util.repositories.db_repos import SQLAlchemyPostgresqlFileRepository
 
 LOGIN_URL = "http://127.0.0.1:8000/auth/jwt/login"
 PROTECTED_ROUTE_URL = "http://127.0.0.1:8000//protected-route"
 REGISTER_ROUTER = "http://127.0.0.1:8000/auth/register"
 API_URL = "http://127.0.0.1:8000"
+USER_URL = "http://127.0.0.1:8000/users/me"
+DOWNLOAD_CACHE_DIR = os.path.join(tempfile.gettempdir(), "soundnormalization-files")
+DOWNLOAD_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
 logged_data = []
+logged_user = {}  # id вошедшего пользователя: запросы к таблице file выбирают только его файлы
 
 
 def main(page: ft.Page):
@@ -161,6 +166,12 @@ def main(page: ft.Page):
 
 
 
+def get_user_id(cookies):
+    response = requests.get(USER_URL, cookies=cookies)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
 def login_page(page: ft.Page):
     page.title = "Login Page"
     page.bgcolor = ft.colors.BLACK  # Темный фон страницы
@@ -212,6 +223,7 @@ def login_page(page: ft.Page):
         logged_data.append(my_cookies)
 
         if response.status_code == 200 or response.status_code == 204:
+            logged_user["id"] = get_user_id(my_cookies)
             status_text.value = "Авторизация успешна"
             print(type(logged_data[0]))
             status_text.color = ft.colors.GREEN_400
@@ -406,20 +418,22 @@ def registration_page(page: ft.Page):
         )
     )
 
-file_repo = SQLAlchemyPostgresqlDataclassRepository(File)
+file_repo = SQLAlchemyPostgresqlFileRepository(File)
+FILES_PAGE_SIZE = 100  # Файлов, загружаемых в список за один раз
 
-def load_files_from_repo(status):
+def load_files_from_repo(status, after=None):
+    """
+    Страница имён файлов с указанным статусом после курсора after.
+    Возвращает (имена, курсор следующей страницы или None).
+    """
     try:
-        if status == "all":
-            files = file_repo.list_name()
-        else:
-            files = file_repo.list_files_by_status(status)
-            # Извлекаем только имена файлов из результата запроса
-            files = [file['name'] for file in files]
-        return files
+        filters = {} if status == "all" else {"status_name": status}
+        rows, cursor = file_repo.page(after=after, limit=FILES_PAGE_SIZE, fields=("name",),
+                                      user_id=logged_user["id"], **filters)
+        return [name for name, in rows], cursor
     except Exception as ex:
         print(f"Error fetching files: {str(ex)}")
-        return []
+        return [], None
 
 def files_page(page: ft.Page, cookies: dict):
     page.title = "File Management"
@@ -443,46 +457,60 @@ def files_page(page: ft.Page, cookies: dict):
         sound_proc(page, f_name)
         page.update()
 
+    def file_card(file_name):
+        return ft.Card(
+            content=ft.Container(
+                content=ft.Row(
+                    [
+                        ft.Text(file_name, color=ft.colors.WHITE, size=14),
+                        ft.IconButton(
+                            icon=ft.icons.DELETE_OUTLINE,
+                            tooltip="Delete file",
+                            on_click=lambda e, fname=file_name: delete_file(fname),
+                            icon_color=ft.colors.RED_400
+                        )
+                    ],
+                    alignment=ft.MainAxisAlignment.SPACE_BETWEEN
+
+                ),
+                on_click=lambda e, fname=file_name: go_to_proc(e, fname),
+                padding=10,
+                bgcolor=ft.colors.GREY_900,
+                border_radius=10
+            )
+        )
+
+    # Текущий статус в списке и курсор следующей страницы файлов
+    listing = {"status": "all", "after": None}
+
     # Функция для загрузки списка файлов из репозитория по статусу
     def load_files(status="all"):
         files_list_view.controls.clear()
+        listing["status"], listing["after"] = status, None
         try:
-            files = load_files_from_repo(status)
+            files, listing["after"] = load_files_from_repo(status)
             if not files:
                 files_list_view.controls.append(
                     ft.Text("\ud83d\udeab No files found", color=ft.colors.GREY_400)
                 )
             else:
-                for file_name in files:
-                    files_list_view.controls.append(
-                        ft.Card(
-                            content=ft.Container(
-                                content=ft.Row(
-                                    [
-                                        ft.Text(file_name, color=ft.colors.WHITE, size=14),
-                                        ft.IconButton(
-                                            icon=ft.icons.DELETE_OUTLINE,
-                                            tooltip="Delete file",
-                                            on_click=lambda e, fname=file_name: delete_file(fname),
-                                            icon_color=ft.colors.RED_400
-                                        )
-                                    ],
-                                    alignment=ft.MainAxisAlignment.SPACE_BETWEEN
-
-                                ),
-                                on_click=lambda e, fname=file_name: go_to_proc(e, fname),
-                                padding=10,
-                                bgcolor=ft.colors.GREY_900,
-                                border_radius=10
-                            )
-                        )
-                    )
+                files_list_view.controls.extend(file_card(file_name) for file_name in files)
 
         except Exception as ex:
             status_text.value = f"\ud83d\udeab Error: {str(ex)}"
             status_text.color = ft.colors.RED_400
+        more_button.visible = listing["after"] is not None
+        page.update()
+
+    # Следующая страница добавляется в конец списка
+    def load_more_files(e):
+        files, listing["after"] = load_files_from_repo(listing["status"], listing["after"])
+        files_list_view.controls.extend(file_card(file_name) for file_name in files)
+        more_button.visible = listing["after"] is not None
         page.update()
 
+    more_button = ft.TextButton("Load more", icon=ft.icons.EXPAND_MORE, on_click=load_more_files, visible=False)
+
     status_dialog = None
 
     def show_status_dialog():
@@ -620,6 +648,7 @@ def files_page(page: ft.Page, cookies: dict):
                 ft.Row([upload_button, status_dropdown], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                 loading_container,
                 files_list_view,
+                more_button,
                 status_text,
                 file_picker
             ],
@@ -631,6 +660,43 @@ def files_page(page: ft.Page, cookies: dict):
     # Загрузка списка файлов при инициализации страницы
     load_files()
 
+class ApiFileSource:
+    """
+    Источник для ObjectCache: скачивает файлы пользователя через API.
+    Сервер отвечает 304, если локальная копия не изменилась.
+    """
+
+    def __init__(self, cookies):
+        self.cookies = cookies
+
+    def _download(self, filename, path, if_none_match):
+        headers = {"If-None-Match": if_none_match} if if_none_match else {}
+        url = f"{API_URL}/files/files/{requests.utils.quote(filename)}"
+        with requests.get(url, headers=headers, cookies=self.cookies, stream=True) as r:
+            if r.status_code == 304:
+                return None
+            r.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+            return r.headers.get("ETag")
+
+    async def download_file(self, filename, path, if_none_match=None):
+        return await asyncio.to_thread(self._download, filename, path, if_none_match)
+
+
+def get_local_copy(filename):
+    """
+    Путь к файлу для обработки. Если исходного файла на этом компьютере нет (загружен
+    с другого компьютера, перемещён или удалён), он скачивается с сервера в локальный кэш.
+    """
+    file_path = file_repo.get_path(filename, logged_user["id"])
+    if file_path and os.path.exists(file_path):
+        return file_path
+    cache = ObjectCache(ApiFileSource(logged_data[0]), DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES)
+    return asyncio.run(cache.get(filename))
+
+
 def sound_proc(page: ft.Page, filename):
     page.title = "Audio/Video Editor"
     page.theme_mode = ft.ThemeMode.DARK
@@ -662,8 +728,9 @@ def sound_proc(page: ft.Page, filename):
         page.update()
 
     def update_cut_slider(file_path):
-        cut_slider.max = round(len(AudioSegment.from_file(file_path)) / 1000, 1)
-        cut_slider.divisions = len(AudioSegment.from_file(file_path)) // 100
+        duration = probe(file_path).duration
+        cut_slider.max = round(duration, 1)
+        cut_slider.divisions = int(duration * 10)
 
     def update_video_player(file_path):
         nonlocal video
@@ -840,9 +907,15 @@ def sound_proc(page: ft.Page, filename):
 
             print(f"Cutting file: {selected_file}, start={start}, end={end}")
 
-            # Сохраняем обработанный файл в новый временный файл
-            result = cut_from_file(selected_file, start, end)
-            save_file(result, temp_file.name)
+            # Обрезка выполняется на сервере, результат скачиваем в новый временный файл
+            url = "http://127.0.0.1:8000/file/cut"
+            data = {'start': start, 'end': end}
+            with open(selected_file, 'rb') as source:
+                with requests.post(url, stream=True, files={'file': source}, data=data) as r:
+                    r.raise_for_status()
+                    with open(temp_file.name, 'wb') as f:
+                        for chunk in r.iter_content(chunk_size=8192):
+                            f.write(chunk)
 
             print(f"File saved as {temp_file.name}")
             selected_file = temp_file.name
@@ -910,7 +983,13 @@ def sound_proc(page: ft.Page, filename):
         )
     )
 
-    file_path = file_repo.get_path(filename)
+    try:
+        file_path = get_local_copy(filename)
+    except Exception as ex:
+        print(f"Error downloading file: {str(ex)}")
+        row1.content = ft.Text("Не удалось загрузить файл")
+        page.update()
+        return
     selected_file = file_path
     original_file = file_path
     row1.content = update_video_player(file_path)
@@ -2,7 +2,8 @@ import shutil
 import tempfile
 
 import flet as ft
-from pydub import AudioSegment
+import requests
+from src.file.probe import probe
 from src.file.sound_func import cut_from_file, save_file, apply_compression, load_audio, get_file_type, \
     save_or_replace_audio, get_file_extension, save_result
 
@@ -26,8 +27,9 @@ def main(page: ft.Page):
         page.update()
 
     def update_cut_slider(file_path):
-        cut_slider.max = round(len(AudioSegment.from_file(file_path)) / 1000, 1)
-        cut_slider.divisions = len(AudioSegment.from_file(file_path)) // 100
+        duration = probe(file_path).duration
+        cut_slider.max = round(duration, 1)
+        cut_slider.divisions = int(duration * 10)
 
     def update_video_player(file_path):
         nonlocal video
@@ -169,7 +171,6 @@ def main(page: ft.Page):
 
     def compress_file_sound(e):
         nonlocal selected_file
-        import requests
         url = "http://127.0.0.1:8000/file/compress"
         files = {'file': open(selected_file, 'rb')}
         data = {'thresh': -threshold_slider.value, 'ratio': ratio_slider.value}
@@ -198,9 +199,15 @@ def main(page: ft.Page):
 
         print(f"Cutting file: {selected_file}, start={start}, end={end}")
 
-        # Сохраняем обработанный файл в новый временный файл
-        result = cut_from_file(selected_file, start, end)
-        save_file(result, temp_file.name)
+        # Обрезка выполняется на сервере, результат скачиваем в новый временный файл
+        url = "http://127.0.0.1:8000/file/cut"
+        data = {'start': start, 'end': end}
+        with open(selected_file, 'rb') as source:
+            with requests.post(url, stream=True, files={'file': source}, data=data) as r:
+                r.raise_for_status()
+                with open(temp_file.name, 'wb') as f:
+                    for chunk in r.iter_content(chunk_size=8192):
+                        f.write(chunk)
 
         print(f"File saved as {temp_file.name}")
         selected_file = temp_file.name
@@ -0,0 +1,220 @@
+from abc import ABC
+from dataclasses import asdict
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+
+from util.repositories.base_repo import BaseRepository
+
+
+class SQLAlchemyPostgresqlAsyncDataclassRepository(BaseRepository, ABC):
+    """
+    Асинхронный вариант SQLAlchemyPostgresqlDataclassRepository: запросы выполняются через
+    сессии session_maker (async_sessionmaker на движке asyncpg) и не блокируют цикл событий.
+    Таблицы берутся из metadata моделей, поэтому при создании репозитория к БД не обращаемся.
+    """
+
+    primary_field_name = "id"
+
+    def __init__(self, reference_type, session_maker, metadata):
+        super().__init__(reference_type)
+        self.session_maker = session_maker
+        self.metadata = metadata
+
+    def _get_table_name(self):
+        return self._reference_type.__name__.lower()
+
+    def _table(self):
+        return self.metadata.tables[self._get_table_name()]
+
+    def _columns(self, table):
+        # Только поля датакласса: в таблице могут быть столбцы, которых в нём нет
+        return [getattr(table.c, name) for name in self._reference_type.__annotations__]
+
+    def _select(self, table):
+        return select(*self._columns(table))
+
+    async def add(self, obj) -> None:
+        table = self._table()
+        dictation_of_object = asdict(obj)
+        del dictation_of_object[self.primary_field_name]
+        async with self.session_maker() as session:
+            await session.execute(insert(table).values(**dictation_of_object))
+            await session.commit()
+
+    async def get(self, reference: int):
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(
+                self._select(table).where(getattr(table.c, self.primary_field_name) == reference)
+            )
+            row = result.mappings().first()
+        if row is None:
+            raise Exception(f"Object of {self._reference_type} with {reference=} not found!")
+        return self._reference_type(**row)
+
+    async def update(self, obj) -> None:
+        table = self._table()
+        reference = getattr(obj, self.primary_field_name)
+        dictation_of_object = asdict(obj)
+        del dictation_of_object[self.primary_field_name]
+        async with self.session_maker() as session:
+            await session.execute(
+                update(table).where(getattr(table.c, self.primary_field_name) == reference)
+                .values(**dictation_of_object)
+            )
+            await session.commit()
+
+    async def remove(self, reference: int) -> None:
+        table = self._table()
+        async with self.session_maker() as session:
+            await session.execute(delete(table).where(getattr(table.c, self.primary_field_name) == reference))
+            await session.commit()
+
+    async def list(self):
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(self._select(table))
+            return [self._reference_type(**item) for item in result.mappings().all()]
+
+
+class SQLAlchemyPostgresqlAsyncFileRepository(SQLAlchemyPostgresqlAsyncDataclassRepository):
+    """
+    Асинхронный вариант SQLAlchemyPostgresqlFileRepository: файлы с мягким удалением,
+    с user_id выборки ограничиваются файлами пользователя.
+    """
+
+    owner_fields = ("user_id", "name")
+
+    def _visible(self, query, table, user_id=None):
+        query = query.where(table.c.deleted_at.is_(None))
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        return query
+
+    async def add(self, obj) -> None:
+        # Повторная загрузка файла с тем же именем заменяет запись, а не добавляет вторую
+        table = self._table()
+        dictation_of_object = asdict(obj)
+        del dictation_of_object[self.primary_field_name]
+        statement = insert(table).values(**dictation_of_object)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(self.owner_fields), index_where=table.c.deleted_at.is_(None),
+            set_={name: statement.excluded[name] for name in dictation_of_object if name not in self.owner_fields},
+        )
+        async with self.session_maker() as session:
+            await session.execute(statement)
+            await session.commit()
+
+    async def list(self, user_id=None):
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(self._visible(self._select(table), table, user_id))
+            return [self._reference_type(**item) for item in result.mappings().all()]
+
+    async def list_name(self, user_id=None):
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(self._visible(select(table.c.name), table, user_id))
+            return result.scalars().all()
+
+    async def list_files_by_status(self, status_name: str, user_id=None):
+        file_table = self._table()
+        status_table = self.metadata.tables["status"]
+        query = (
+            select(file_table.c.name)
+            .join(status_table, file_table.c.status_id == status_table.c.id)
+            .where(status_table.c.name == status_name)
+        )
+        async with self.session_maker() as session:
+            result = await session.execute(self._visible(query, file_table, user_id))
+            return result.mappings().all()
+
+    async def get_path(self, file_name: str, user_id=None) -> str:
+        table = self._table()
+        query = self._visible(select(table.c.path).where(table.c.name == file_name), table, user_id)
+        async with self.session_maker() as session:
+            result = (await session.execute(query.limit(1))).scalar()
+        if result is None:
+            raise Exception(f"Файл с именем '{file_name}' не найден!")
+        return result
+
+    async def remove_by_name(self, name: str, user_id=None) -> None:
+        await self.mark_deleted([name], user_id)
+
+    async def mark_deleted(self, names, user_id=None) -> int:
+        """Помечает файлы с указанными именами удалёнными одним запросом. Возвращает число строк."""
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(
+                self._visible(update(table).where(table.c.name.in_(list(names))), table, user_id)
+                .values(deleted_at=func.now())
+            )
+            await session.commit()
+            return result.rowcount
+
+
+class SQLAlchemyPostgresqlAsyncUploadRepository(SQLAlchemyPostgresqlAsyncDataclassRepository):
+    """
+    Асинхронный вариант SQLAlchemyPostgresqlUploadRepository: возобновляемые загрузки (upload_session)
+    и принятые части (upload_part). Части удаляются вместе с загрузкой (ON DELETE CASCADE).
+    """
+
+    def _get_table_name(self):
+        return "upload_session"
+
+    async def find(self, token: str, user_id: int):
+        """Загрузка пользователя по идентификатору или None."""
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(
+                self._select(table).where(table.c.token == token, table.c.user_id == user_id)
+            )
+            row = result.mappings().first()
+        return self._reference_type(**row) if row is not None else None
+
+    async def find_multipart(self, key: str, upload_id: str, user_id: int):
+        """Загрузка пользователя по ключу и UploadId multipart upload в S3 или None."""
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(
+                self._select(table).where(table.c.key == key, table.c.upload_id == upload_id,
+                                          table.c.user_id == user_id)
+            )
+            row = result.mappings().first()
+        return self._reference_type(**row) if row is not None else None
+
+    async def record_part(self, session_id: int, number: int, size: int, etag: str) -> None:
+        """Отмечает часть принятой. Повторно отправленная часть заменяет прежнюю."""
+        part, upload = self.metadata.tables["upload_part"], self._table()
+        async with self.session_maker() as session:
+            await session.execute(
+                insert(part).values(session_id=session_id, number=number, size=size, etag=etag)
+                .on_conflict_do_update(index_elements=[part.c.session_id, part.c.number],
+                                       set_={"size": size, "etag": etag})
+            )
+            await session.execute(update(upload).where(upload.c.id == session_id).values(updated_at=func.now()))
+            await session.commit()
+
+    async def parts(self, session_id: int):
+        """Принятые части по порядку: кортежи (number, size, etag)."""
+        part = self.metadata.tables["upload_part"]
+        async with self.session_maker() as session:
+            result = await session.execute(
+                select(part.c.number, part.c.size, part.c.etag)
+                .where(part.c.session_id == session_id).order_by(part.c.number)
+            )
+            return result.all()
+
+
+class SQLAlchemyPostgresqlAsyncJobRepository(SQLAlchemyPostgresqlAsyncDataclassRepository):
+    """
+    Владельцы фоновых задач.
+    """
+
+    async def owner(self, task_id: str):
+        """Пользователь, отправивший задачу task_id, или None, если такой задачи нет."""
+        table = self._table()
+        async with self.session_maker() as session:
+            result = await session.execute(select(table.c.user_id).where(table.c.task_id == task_id))
+            return result.scalar()
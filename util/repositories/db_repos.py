@@ -1,14 +1,33 @@
 import copy
+import io
 import os
+from datetime import timedelta
 from abc import ABC
+from contextlib import contextmanager
 from dataclasses import asdict
+from itertools import islice
 from pydoc import plain
 
 from dotenv import dotenv_values, load_dotenv
-from sqlalchemy import Table, Column, Integer, Text, MetaData, create_engine, select, update, delete, ForeignKey
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import Table, Column, Integer, Text, select, update, delete, ForeignKey, func, case, bindparam
+from sqlalchemy.dialects.postgresql import insert, ARRAY
 
 from util.repositories.base_repo import BaseRepository
+from util.repositories.engine_registry import engine_registry
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _copy_value(value):
+    # Текстовый формат COPY: \N - NULL, разделители и обратная косая черта экранируются
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
 
 
 class SQLAlchemyPostgresqlDataclassRepository(BaseRepository, ABC):
@@ -23,13 +42,16 @@ class SQLAlchemyPostgresqlDataclassRepository(BaseRepository, ABC):
     }
 
     primary_field_name = "id"
+    related_tables = ()  # Таблицы, кроме основной, с которыми работают запросы репозитория
+    batch_size = int(os.getenv("DB_BATCH_SIZE", 1000))  # Строк в одной команде массовых операций
 
     def __init__(self, reference_type):
         super().__init__(reference_type)
 
-        self.engine = create_engine(f"postgresql+psycopg2://" + self.DATABASE_ACCESS_URI)
-        self.metadata = MetaData()
-        self.metadata.reflect(bind=self.engine)
+        # Движок и отражённые таблицы общие для всех репозиториев процесса
+        url = f"postgresql+psycopg2://" + self.DATABASE_ACCESS_URI
+        self.engine = engine_registry.engine(url)
+        self.metadata = engine_registry.metadata(url, (self._get_table_name(), *self.related_tables))
 
     def _get_table_name(self):
         return self._reference_type.__name__.lower()
@@ -99,6 +121,108 @@ class SQLAlchemyPostgresqlDataclassRepository(BaseRepository, ABC):
             connection.execute(delete(table).where(getattr(table.c, self.primary_field_name) == reference))
             connection.commit()
 
+    def _fields(self, with_primary=False):
+        return [name for name in self._reference_type.__annotations__
+                if with_primary or name != self.primary_field_name]
+
+    def _rows(self, objs, with_primary=False):
+        for obj in objs:
+            row = asdict(obj)
+            if not with_primary:
+                del row[self.primary_field_name]
+            yield row
+
+    def add_many(self, objs, batch_size=None) -> int:
+        """
+        Добавляет объекты пачками по batch_size строк (один INSERT на пачку) в одной транзакции:
+        при ошибке не добавляется ни одна строка. Возвращает число добавленных строк.
+        """
+        table = self.metadata.tables[self._get_table_name()]
+        count = 0
+        with self.engine.begin() as connection:
+            for batch in _batches(self._rows(objs), batch_size or self.batch_size):
+                connection.execute(insert(table), batch)
+                count += len(batch)
+        return count
+
+    def update_many(self, objs, batch_size=None) -> int:
+        """
+        Обновляет объекты по первичному ключу: одна команда UPDATE ... FROM unnest(...) на пачку
+        из batch_size строк, все пачки в одной транзакции. Возвращает число обновлённых строк.
+        """
+        table = self.metadata.tables[self._get_table_name()]
+        fields = self._fields(with_primary=True)
+        # Значения столбцов передаются массивами: текст команды не зависит от размера пачки
+        # и компилируется один раз
+        source = func.unnest(*[
+            bindparam(f"{name}_values", type_=ARRAY(table.c[name].type)) for name in fields
+        ]).table_valued(*fields).render_derived(name="source")
+        statement = (
+            update(table)
+            .where(getattr(table.c, self.primary_field_name) == source.c[self.primary_field_name])
+            .values({name: source.c[name] for name in fields if name != self.primary_field_name})
+        )
+        count = 0
+        with self.engine.begin() as connection:
+            for batch in _batches(self._rows(objs, with_primary=True), batch_size or self.batch_size):
+                count += connection.execute(
+                    statement, {f"{name}_values": [row[name] for row in batch] for name in fields}
+                ).rowcount
+        return count
+
+    def upsert(self, objs, conflict_fields, update_fields=None, batch_size=None, index_where=None) -> int:
+        """
+        Добавляет объекты, а если строка с теми же conflict_fields (уникальный индекс) уже есть,
+        обновляет в ней update_fields - по умолчанию все поля, кроме conflict_fields и первичного
+        ключа; при пустом update_fields существующая строка не меняется (ON CONFLICT DO NOTHING).
+        Для частичного уникального индекса index_where - его условие.
+        Пачки по batch_size строк, одна транзакция. Возвращает число обработанных строк.
+        """
+        table = self.metadata.tables[self._get_table_name()]
+        conflict_fields = list(conflict_fields)
+        if update_fields is None:
+            update_fields = [name for name in self._fields() if name not in conflict_fields]
+        statement = insert(table)
+        if update_fields:
+            statement = statement.on_conflict_do_update(
+                index_elements=conflict_fields, index_where=index_where,
+                set_={name: statement.excluded[name] for name in update_fields})
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=conflict_fields, index_where=index_where)
+
+        rows = self._rows(objs, with_primary=self.primary_field_name in conflict_fields)
+        count = 0
+        with self.engine.begin() as connection:
+            for batch in _batches(rows, batch_size or self.batch_size):
+                # Одна команда не может изменить строку дважды: из повторов в пачке остаётся последний
+                unique = {tuple(row[name] for name in conflict_fields): row for row in batch}
+                connection.execute(statement, list(unique.values()))
+                count += len(unique)
+        return count
+
+    def copy_many(self, objs, batch_size=None) -> int:
+        """
+        Добавляет объекты командой COPY - для очень больших объёмов быстрее add_many.
+        Пачки по batch_size строк, одна транзакция. Работает только с драйвером psycopg2.
+        Возвращает число добавленных строк.
+        """
+        table = self.metadata.tables[self._get_table_name()]
+        fields = self._fields()
+        preparer = self.engine.dialect.identifier_preparer
+        command = (f"COPY {preparer.format_table(table)} ({', '.join(preparer.quote(name) for name in fields)}) "
+                   f"FROM STDIN")
+        count = 0
+        with self.engine.begin() as connection:
+            cursor = connection.connection.driver_connection.cursor()
+            for batch in _batches(self._rows(objs), batch_size or self.batch_size):
+                buffer = io.StringIO()
+                for row in batch:
+                    buffer.write("\t".join(_copy_value(row[name]) for name in fields) + "\n")
+                buffer.seek(0)
+                cursor.copy_expert(command, buffer)
+                count += len(batch)
+        return count
+
     def remove_by_name(self, name: str) -> None:
         with self.engine.connect() as connection:
             table = self.metadata.tables[self._get_table_name()]
@@ -117,6 +241,51 @@ class SQLAlchemyPostgresqlDataclassRepository(BaseRepository, ABC):
             cursor = connection.execute(select(table))
             return [self._reference_type(**item) for item in cursor.mappings().all()]
 
+    def _columns(self, table, fields=None):
+        # По умолчанию - поля датакласса: в таблице могут быть столбцы, которых в нём нет
+        return [getattr(table.c, name) for name in fields or self._reference_type.__annotations__]
+
+    def _filtered(self, query, table, filters):
+        for name, value in filters.items():
+            query = query.where(getattr(table.c, name) == value)
+        return query
+
+    def _convert(self, row, fields):
+        # Поля выбираются в порядке объявления, поэтому объект строится без промежуточного словаря
+        return tuple(row) if fields else self._reference_type(*row)
+
+    def page(self, after=None, limit=None, fields=None, **filters):
+        """
+        Страница строк по возрастанию первичного ключа: WHERE id > after ORDER BY id LIMIT limit.
+        Выбираются только столбцы fields, строки возвращаются кортежами их значений; без fields -
+        объектами reference_type. filters - условия равенства по столбцам.
+        Возвращает (строки, after для следующей страницы или None, если страница последняя).
+        """
+        table = self.metadata.tables[self._get_table_name()]
+        primary = getattr(table.c, self.primary_field_name)
+        limit = limit or self.batch_size
+        query = self._filtered(select(primary, *self._columns(table, fields)), table, filters)
+        if after is not None:
+            query = query.where(primary > after)
+        with self.engine.connect() as connection:
+            rows = connection.execute(query.order_by(primary).limit(limit)).all()
+        cursor = rows[-1][0] if len(rows) == limit else None
+        return [self._convert(row[1:], fields) for row in rows], cursor
+
+    def stream(self, fields=None, chunk_size=None, **filters):
+        """
+        Генератор по всем строкам (как page, но без разбиения на страницы). Строки читаются
+        серверным курсором по chunk_size за раз, поэтому память не растёт с размером таблицы.
+        Соединение занято, пока генератор не исчерпан или не закрыт.
+        """
+        table = self.metadata.tables[self._get_table_name()]
+        query = self._filtered(select(*self._columns(table, fields)), table, filters)
+        query = query.order_by(getattr(table.c, self.primary_field_name))
+        with self.engine.connect() as connection:
+            result = connection.execution_options(yield_per=chunk_size or self.batch_size).execute(query)
+            for row in result:
+                yield self._convert(row, fields)
+
     def list_files_by_status(self, status_name: str):
         with self.engine.connect() as connection:
             file_table = self.metadata.tables["file"]
@@ -147,3 +316,396 @@ class SQLAlchemyPostgresqlDataclassRepository(BaseRepository, ABC):
                 return result
             else:
                 raise Exception(f"Файл с именем '{file_name}' не найден!")
+
+
+class SQLAlchemyPostgresqlFileRepository(SQLAlchemyPostgresqlDataclassRepository):
+    """
+    Файлы (таблица file) с мягким удалением: удалённые строки помечаются deleted_at,
+    не видны в выборках и удаляются сборщиком мусора позже.
+    Если передан user_id, выборки ограничиваются файлами пользователя и идут по индексам
+    (user_id, name) и (user_id, status_id); без него просматривается вся таблица.
+    """
+
+    related_tables = ("status",)
+    owner_fields = ("user_id", "name")  # Имя файла уникально среди неудалённых файлов пользователя
+
+    def _table(self):
+        return self.metadata.tables[self._get_table_name()]
+
+    def _visible(self, query, table, user_id=None):
+        query = query.where(table.c.deleted_at.is_(None))
+        if user_id is not None:
+            query = query.where(table.c.user_id == user_id)
+        return query
+
+    def _filtered(self, query, table, filters):
+        # user_id=None - файлы всех пользователей; status_name - фильтр по имени статуса
+        filters = dict(filters)
+        user_id = filters.pop("user_id", None)
+        status_name = filters.pop("status_name", None)
+        query = self._visible(super()._filtered(query, table, filters), table, user_id)
+        if status_name is not None:
+            status_table = self.metadata.tables["status"]
+            query = query.where(
+                table.c.status_id.in_(select(status_table.c.id).where(status_table.c.name == status_name)))
+        return query
+
+    def add(self, obj) -> None:
+        # Повторная загрузка файла с тем же именем заменяет запись, а не добавляет вторую
+        self.add_many([obj])
+
+    def add_many(self, objs, batch_size=None) -> int:
+        table = self._table()
+        return self.upsert(objs, self.owner_fields, batch_size=batch_size, index_where=table.c.deleted_at.is_(None))
+
+    def list_name(self, user_id=None):
+        table = self._table()
+        with self.engine.connect() as connection:
+            return connection.execute(self._visible(select(table.c.name), table, user_id)).scalars().all()
+
+    def list(self, user_id=None):
+        table = self._table()
+        with self.engine.connect() as connection:
+            cursor = connection.execute(self._visible(select(*self._columns(table)), table, user_id))
+            return [self._reference_type(**item) for item in cursor.mappings().all()]
+
+    def list_files_by_status(self, status_name: str, user_id=None):
+        file_table = self._table()
+        status_table = self.metadata.tables["status"]
+        query = (
+            select(file_table.c.name)
+            .join(status_table, file_table.c.status_id == status_table.c.id)
+            .where(status_table.c.name == status_name)
+        )
+        with self.engine.connect() as connection:
+            return connection.execute(self._visible(query, file_table, user_id)).mappings().all()
+
+    def get_path(self, file_name: str, user_id=None) -> str:
+        table = self._table()
+        query = self._visible(select(table.c.path).where(table.c.name == file_name), table, user_id)
+        with self.engine.connect() as connection:
+            result = connection.execute(query.limit(1)).scalar()
+        if result is None:
+            raise Exception(f"Файл с именем '{file_name}' не найден!")
+        return result
+
+    def remove_by_name(self, name: str, user_id=None) -> None:
+        self.mark_deleted([name], user_id)
+
+    def mark_deleted(self, names, user_id=None) -> int:
+        """Помечает файлы с указанными именами удалёнными одним запросом. Возвращает число строк."""
+        table = self._table()
+        with self.engine.begin() as connection:
+            return connection.execute(
+                self._visible(update(table).where(table.c.name.in_(list(names))), table, user_id)
+                .values(deleted_at=func.now())
+            ).rowcount
+
+    def purge_deleted(self, grace: float) -> int:
+        """Окончательно удаляет строки, помеченные удалёнными раньше grace секунд назад."""
+        table = self._table()
+        with self.engine.begin() as connection:
+            return connection.execute(
+                delete(table).where(table.c.deleted_at < func.now() - timedelta(seconds=grace))
+            ).rowcount
+
+
+class SQLAlchemyPostgresqlBlobRepository(SQLAlchemyPostgresqlDataclassRepository):
+    """
+    Содержимое файлов (таблица blob) и имена файлов пользователей, ссылающиеся на него (pointer).
+    У каждого blob есть счётчик ссылок; blob с нулевым счётчиком не удаляется сразу,
+    а остаётся сборщику мусора (released_at - момент, когда ссылок не осталось).
+    """
+
+    related_tables = ("pointer",)
+
+    def __init__(self, reference_type):
+        super().__init__(reference_type)
+        self.blob_table = self.metadata.tables["blob"]
+        self.pointer_table = self.metadata.tables["pointer"]
+
+    def _release(self, connection, blob_id):
+        blob = self.blob_table
+        connection.execute(
+            update(blob).where(blob.c.id == blob_id).values(
+                refcount=blob.c.refcount - 1,
+                released_at=case((blob.c.refcount <= 1, func.now()), else_=None),
+            )
+        )
+
+    def retain(self, hash: str) -> bool:
+        """
+        Добавляет ссылку на существующий blob. Возвращает False, если такого содержимого ещё нет
+        и его нужно загрузить. Строка блокируется, поэтому blob, удерживаемый сборщиком мусора,
+        будет либо сохранён (ссылка добавлена), либо уже удалён (нужна загрузка).
+        """
+        blob = self.blob_table
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                update(blob).where(blob.c.hash == hash)
+                .values(refcount=blob.c.refcount + 1, released_at=None)
+                .returning(blob.c.id)
+            )
+            return result.first() is not None
+
+    def owns(self, user_id: int, hash: str) -> bool:
+        """Есть ли у пользователя файл (pointer) с содержимым hash."""
+        blob, pointer = self.blob_table, self.pointer_table
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(pointer.c.id).join(blob, pointer.c.blob_id == blob.c.id)
+                .where(pointer.c.user_id == user_id, blob.c.hash == hash).limit(1)
+            ).first() is not None
+
+    def release(self, hash: str) -> None:
+        with self.engine.begin() as connection:
+            blob_id = connection.execute(select(self.blob_table.c.id).where(self.blob_table.c.hash == hash)).scalar()
+            if blob_id is not None:
+                self._release(connection, blob_id)
+
+    def link(self, user_id: int, name: str, hash: str, retained: bool, key: str = None, size: int = None) -> str:
+        """
+        Привязывает имя файла пользователя к blob и возвращает ключ объекта blob в S3.
+        Если retain уже добавил ссылку (retained=True), счётчик не меняется, иначе blob
+        с объектом key создаётся или, если его успели создать параллельно, увеличивается счётчик
+        существующего (тогда возвращается его ключ). Если имя указывало на другой blob,
+        ссылка на него снимается.
+        """
+        blob, pointer = self.blob_table, self.pointer_table
+        with self.engine.begin() as connection:
+            if retained:
+                blob_id, blob_key = connection.execute(
+                    select(blob.c.id, blob.c.key).where(blob.c.hash == hash)
+                ).one()
+            else:
+                blob_id, blob_key = connection.execute(
+                    insert(blob).values(hash=hash, key=key, size=size, refcount=1)
+                    .on_conflict_do_update(index_elements=[blob.c.hash],
+                                           set_={"refcount": blob.c.refcount + 1, "released_at": None})
+                    .returning(blob.c.id, blob.c.key)
+                ).one()
+
+            previous = connection.execute(
+                select(pointer.c.id, pointer.c.blob_id)
+                .where(pointer.c.user_id == user_id, pointer.c.name == name)
+                .with_for_update()
+            ).first()
+            if previous is None:
+                connection.execute(insert(pointer).values(user_id=user_id, name=name, blob_id=blob_id))
+            else:
+                connection.execute(
+                    update(pointer).where(pointer.c.id == previous.id).values(blob_id=blob_id, created_at=func.now())
+                )
+                # Повторная загрузка того же содержимого под тем же именем тоже снимает лишнюю ссылку
+                self._release(connection, previous.blob_id)
+            return blob_key
+
+    def unlink(self, user_id: int, name: str) -> bool:
+        """Удаляет имя файла пользователя. Возвращает False, если такого имени нет."""
+        pointer = self.pointer_table
+        with self.engine.begin() as connection:
+            blob_id = connection.execute(
+                delete(pointer).where(pointer.c.user_id == user_id, pointer.c.name == name)
+                .returning(pointer.c.blob_id)
+            ).scalar()
+            if blob_id is None:
+                return False
+            self._release(connection, blob_id)
+            return True
+
+    def unlink_many(self, user_id: int, names) -> list[str]:
+        """
+        Удаляет имена файлов пользователя и снимает ссылки на их blob одним запросом.
+        Возвращает имена, которые были найдены.
+        """
+        blob, pointer = self.blob_table, self.pointer_table
+        removed = (
+            delete(pointer).where(pointer.c.user_id == user_id, pointer.c.name.in_(list(names)))
+            .returning(pointer.c.name, pointer.c.blob_id)
+            .cte("removed")
+        )
+        counts = select(removed.c.blob_id, func.count().label("n")).group_by(removed.c.blob_id).cte("counts")
+        released = (
+            update(blob).where(blob.c.id == counts.c.blob_id)
+            .values(refcount=blob.c.refcount - counts.c.n,
+                    released_at=case((blob.c.refcount <= counts.c.n, func.now()), else_=None))
+            .returning(blob.c.id)
+            .cte("released")
+        )
+        with self.engine.begin() as connection:
+            return connection.execute(select(removed.c.name).add_cte(released)).scalars().all()
+
+    @contextmanager
+    def reclaim(self, grace: float, limit: int):
+        """
+        Блокирует до limit blob без ссылок, освобождённых раньше grace секунд назад, и отдаёт
+        ключи их объектов. Строки удаляются при выходе из блока без ошибки. Строки, заблокированные
+        другими транзакциями (retain, другой сборщик), пропускаются.
+        """
+        blob = self.blob_table
+        with self.engine.begin() as connection:
+            rows = connection.execute(
+                select(blob.c.id, blob.c.key)
+                .where(blob.c.refcount <= 0, blob.c.released_at < func.now() - timedelta(seconds=grace))
+                .order_by(blob.c.released_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            ).all()
+            yield [row.key for row in rows]
+            if rows:
+                connection.execute(delete(blob).where(blob.c.id.in_([row.id for row in rows])))
+
+    def known_keys(self, keys) -> set:
+        """Ключи из keys, которые принадлежат blob."""
+        with self.engine.connect() as connection:
+            return set(connection.execute(
+                select(self.blob_table.c.key).where(self.blob_table.c.key.in_(list(keys)))
+            ).scalars())
+
+    def resolve(self, user_id: int, name: str):
+        """Возвращает ключ объекта в S3 с содержимым файла пользователя или None."""
+        blob, pointer = self.blob_table, self.pointer_table
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(blob.c.key).join(pointer, pointer.c.blob_id == blob.c.id)
+                .where(pointer.c.user_id == user_id, pointer.c.name == name)
+            ).scalar()
+
+    def list_pointers(self, user_id: int, limit: int, after: str = None):
+        """Имена файлов пользователя по алфавиту после after: кортежи (name, size, created_at, hash)."""
+        blob, pointer = self.blob_table, self.pointer_table
+        query = (
+            select(pointer.c.name, blob.c.size, pointer.c.created_at, blob.c.hash)
+            .join(blob, pointer.c.blob_id == blob.c.id)
+            .where(pointer.c.user_id == user_id)
+            .order_by(pointer.c.name.collate("C"))
+            .limit(limit)
+        )
+        # Побайтовый порядок (COLLATE "C") совпадает с порядком ключей в S3
+        if after is not None:
+            query = query.where(pointer.c.name.collate("C") > after)
+        with self.engine.connect() as connection:
+            return connection.execute(query).all()
+
+
+class SQLAlchemyPostgresqlResultCacheRepository(SQLAlchemyPostgresqlDataclassRepository):
+    """
+    Индекс кэша результатов обработки (таблица result_cache): ключ кэша -> объект в S3.
+    """
+
+    def _get_table_name(self):
+        return "result_cache"
+
+    def touch(self, key: str):
+        """Возвращает запись по ключу, отмечая обращение к ней, или None."""
+        table = self.metadata.tables[self._get_table_name()]
+        with self.engine.begin() as connection:
+            row = connection.execute(
+                update(table).where(table.c.key == key).values(accessed_at=func.now())
+                .returning(*self._columns(table))
+            ).mappings().first()
+            return self._reference_type(**row) if row is not None else None
+
+    def add_if_absent(self, obj) -> bool:
+        """Добавляет запись. Возвращает False, если запись с таким ключом уже есть."""
+        table = self.metadata.tables[self._get_table_name()]
+        dictation_of_object = asdict(obj)
+        del dictation_of_object[self.primary_field_name]
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                insert(table).values(**dictation_of_object)
+                .on_conflict_do_nothing(index_elements=[table.c.key])
+                .returning(table.c.id)
+            )
+            return result.first() is not None
+
+    def known_keys(self, keys) -> set:
+        """Ключи объектов из keys, на которые есть записи кэша."""
+        table = self.metadata.tables[self._get_table_name()]
+        with self.engine.connect() as connection:
+            return set(connection.execute(
+                select(table.c.object_key).where(table.c.object_key.in_(list(keys)))
+            ).scalars())
+
+    def evict(self, max_bytes: int, ttl: float) -> list[str]:
+        """
+        Удаляет записи, к которым не обращались дольше ttl секунд, и самые давние по обращению
+        записи сверх max_bytes суммарного размера. Возвращает ключи объектов S3 удалённых записей.
+        """
+        table = self.metadata.tables[self._get_table_name()]
+        with self.engine.begin() as connection:
+            removed = connection.execute(
+                delete(table).where(table.c.accessed_at < func.now() - timedelta(seconds=ttl))
+                .returning(table.c.object_key)
+            ).scalars().all()
+
+            # Накопленный размер от самых свежих записей к самым давним
+            ranked = select(
+                table.c.id,
+                func.sum(table.c.size).over(order_by=(table.c.accessed_at.desc(), table.c.id.desc())).label("total"),
+            ).subquery()
+            removed += connection.execute(
+                delete(table).where(table.c.id.in_(select(ranked.c.id).where(ranked.c.total > max_bytes)))
+                .returning(table.c.object_key)
+            ).scalars().all()
+            return removed
+
+
+class SQLAlchemyPostgresqlUploadRepository(SQLAlchemyPostgresqlDataclassRepository):
+    """
+    Возобновляемые загрузки (таблица upload_session) и принятые части (upload_part).
+    Время последней принятой части (updated_at) отличает брошенные загрузки от идущих.
+    """
+
+    related_tables = ("upload_part",)
+
+    def __init__(self, reference_type):
+        super().__init__(reference_type)
+        self.session_table = self.metadata.tables["upload_session"]
+        self.part_table = self.metadata.tables["upload_part"]
+
+    def _get_table_name(self):
+        return "upload_session"
+
+    def find(self, token: str, user_id: int):
+        """Загрузка пользователя по идентификатору или None."""
+        table = self.session_table
+        columns = [getattr(table.c, name) for name in self._reference_type.__annotations__]
+        with self.engine.connect() as connection:
+            row = connection.execute(
+                select(*columns).where(table.c.token == token, table.c.user_id == user_id)
+            ).mappings().first()
+        return self._reference_type(**row) if row is not None else None
+
+    def record_part(self, session_id: int, number: int, size: int, etag: str) -> None:
+        """Отмечает часть принятой. Повторно отправленная часть заменяет прежнюю."""
+        part, session = self.part_table, self.session_table
+        with self.engine.begin() as connection:
+            connection.execute(
+                insert(part).values(session_id=session_id, number=number, size=size, etag=etag)
+                .on_conflict_do_update(index_elements=[part.c.session_id, part.c.number],
+                                       set_={"size": size, "etag": etag})
+            )
+            connection.execute(update(session).where(session.c.id == session_id).values(updated_at=func.now()))
+
+    def parts(self, session_id: int):
+        """Принятые части по порядку: кортежи (number, size, etag)."""
+        part = self.part_table
+        with self.engine.connect() as connection:
+            return connection.execute(
+                select(part.c.number, part.c.size, part.c.etag)
+                .where(part.c.session_id == session_id).order_by(part.c.number)
+            ).all()
+
+    def purge_stale(self, grace: float) -> int:
+        """Удаляет загрузки, в которые не поступало частей дольше grace секунд."""
+        table = self.session_table
+        with self.engine.begin() as connection:
+            return connection.execute(
+                delete(table).where(table.c.updated_at < func.now() - timedelta(seconds=grace))
+            ).rowcount
+
+    def active_upload_ids(self) -> set:
+        """UploadId multipart upload всех незавершённых загрузок."""
+        with self.engine.connect() as connection:
+            return set(connection.execute(select(self.session_table.c.upload_id)).scalars())
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import os
+import pickle
+import threading
+
+from dotenv import load_dotenv
+from sqlalchemy import MetaData, create_engine, text
+from sqlalchemy.exc import SQLAlchemyError
+
+load_dotenv()
+
+
+class EngineRegistry:
+    """
+    Общие для процесса движки и отражённые таблицы.
+
+    На каждый URL создаётся один движок с ограниченным пулом соединений (pool_size + max_overflow),
+    поэтому число соединений процесса не растёт с числом репозиториев. Таблицы отражаются из БД
+    только те, что нужны, и один раз; если задан cache_dir, отражённая схема сохраняется в файл
+    и при следующем запуске загружается из него, пока не сменится ревизия миграций (alembic_version).
+    """
+
+    def __init__(self, cache_dir=None, pool_size=5, max_overflow=10):
+        self.cache_dir = cache_dir
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self._engines = {}
+        self._metadata = {}
+        self._revisions = {}
+        self._lock = threading.RLock()
+
+    def engine(self, url):
+        with self._lock:
+            engine = self._engines.get(url)
+            if engine is None:
+                engine = create_engine(url, pool_size=self.pool_size, max_overflow=self.max_overflow,
+                                       pool_pre_ping=True)
+                self._engines[url] = engine
+            return engine
+
+    def metadata(self, url, tables):
+        """
+        MetaData с таблицами tables (и таблицами, на которые они ссылаются) для БД по адресу url.
+        Таблицы, которых нет в БД, пропускаются.
+        """
+        with self._lock:
+            metadata = self._metadata.get(url)
+            if metadata is None:
+                metadata = self._load(url) or MetaData()
+                self._metadata[url] = metadata
+            missing = [name for name in tables if name not in metadata.tables]
+            if missing:
+                known = len(metadata.tables)
+                metadata.reflect(bind=self.engine(url), only=lambda name, _: name in missing)
+                if len(metadata.tables) != known:
+                    self._save(url, metadata)
+            return metadata
+
+    def _cache_file(self, url):
+        return os.path.join(self.cache_dir, f"metadata-{hashlib.sha256(url.encode()).hexdigest()[:16]}.pickle")
+
+    def _revision(self, url):
+        if url not in self._revisions:
+            try:
+                with self.engine(url).connect() as connection:
+                    self._revisions[url] = connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+            except SQLAlchemyError:
+                self._revisions[url] = None  # Без миграций нельзя понять, устарел ли кэш
+        return self._revisions[url]
+
+    def _load(self, url):
+        if not self.cache_dir or self._revision(url) is None:
+            return None
+        try:
+            with open(self._cache_file(url), "rb") as f:
+                revision, metadata = pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            return None
+        if revision != self._revision(url):
+            return None
+        logging.info(f"Схема БД загружена из кэша: {len(metadata.tables)} таблиц.")
+        return metadata
+
+    def _save(self, url, metadata):
+        if not self.cache_dir or self._revision(url) is None:
+            return
+        path = self._cache_file(url)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            part = f"{path}.{os.getpid()}"
+            with open(part, "wb") as f:
+                pickle.dump((self._revision(url), metadata), f)
+            os.replace(part, path)
+        except OSError as e:
+            logging.warning(f"Не удалось сохранить кэш схемы БД: {e}")
+
+
+engine_registry = EngineRegistry(
+    cache_dir=os.getenv("DB_METADATA_CACHE"),
+    pool_size=int(os.getenv("DB_POOL_SIZE", 5)),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", 10)),
+)